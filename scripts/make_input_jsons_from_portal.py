@@ -1,7 +1,21 @@
 import argparse
+import asyncio
+import hashlib
 import json
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
-from urllib.parse import urljoin
+import os
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qsl, urljoin
 
 import httpx
 
@@ -16,6 +30,38 @@ DATASET_OUTPUT_TYPE = {
     "Histone ChIP-seq": "fold change over control",
     "TF ChIP-seq": "fold change over control",
 }
+MAX_CONCURRENT_REQUESTS = 16
+MAX_CONCURRENT_EPIGENOMES = 8
+SEARCH_PAGE_SIZE = 1000
+FAILURES_FILENAME = "failures.json"
+CACHE_TTL = 24 * 60 * 60
+CACHE_MAX_SIZE_MB = 512
+SCRIPT_ARGS = (
+    "accession",
+    "accessions_file",
+    "search_query",
+    "outfile",
+    "output_dir",
+    "num_parallel",
+    "keypair",
+    "chip_targets",
+    "skip_assays",
+    "cache_dir",
+    "cache_ttl",
+    "cache_max_size",
+    "offline",
+)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (
+    httpx.ConnectTimeout,
+    httpx.NetworkError,
+    httpx.PoolTimeout,
+    httpx.ProtocolError,
+    httpx.ReadTimeout,
+    httpx.WriteTimeout,
+)
 
 
 class UrlJoiner:
@@ -45,11 +91,161 @@ class UrlJoiner:
         return urljoin(self.base_url, path)
 
 
+class ResponseCache:
+    """
+    Persistent cache of portal JSON responses, stored as one JSON blob per request in
+    a directory. Blobs are named by a digest of the URL and the key ID of the keypair
+    used, so responses fetched with different credentials are never shared. Entries
+    older than the TTL are revalidated with their ETag when the portal gave one. When
+    the cache grows beyond `max_size` bytes the least recently used entries are
+    evicted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = CACHE_TTL,
+        max_size: int = CACHE_MAX_SIZE_MB * 1024 * 1024,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._list_entries())
+
+    @staticmethod
+    def make_key(url: str, key_id: Optional[str] = None) -> str:
+        return hashlib.sha256(f"{key_id or ''} {url}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the entry with the response body, the ETag and the time it was
+        fetched, or None on a miss. Reading an entry marks it as recently used.
+        """
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path) as f:
+                entry: Dict[str, Any] = json.load(f)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self._remove(entry_path)
+            return None
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def put(
+        self, key: str, url: str, body: Dict[str, Any], etag: Optional[str] = None
+    ) -> None:
+        """
+        Entries are written to a temporary file then moved into place, so concurrent
+        runs sharing a cache never see partially written entries.
+        """
+        entry = {"url": url, "etag": etag, "fetched_at": time.time(), "body": body}
+        entry_path = self._get_entry_path(key)
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entry, f)
+        if os.path.exists(entry_path):
+            self._size -= os.path.getsize(entry_path)
+        os.replace(temp_path, entry_path)
+        self._size += os.path.getsize(entry_path)
+        if self._size > self.max_size:
+            self._evict()
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def _list_entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        with os.scandir(self.path) as it:
+            for dir_entry in it:
+                if dir_entry.name.endswith(".json"):
+                    stat = dir_entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._list_entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, _, entry_path in entries:
+            if self._size <= self.max_size:
+                break
+            self._remove(entry_path)
+
+    def _remove(self, entry_path: str) -> None:
+        try:
+            size = os.path.getsize(entry_path)
+            os.remove(entry_path)
+        except FileNotFoundError:
+            return
+        self._size -= size
+
+
 class Client:
-    def __init__(self, base_url: str = PORTAL_URL, keypair_path: Optional[str] = None):
+    """
+    Portal client backed by an `httpx.AsyncClient`. The async methods must be awaited
+    within `async with client:`, which opens a single connection pool shared by every
+    request made in that block, and caps the number of requests in flight. The sync
+    methods are convenience wrappers that each open their own session.
+
+    With a `ResponseCache`, fresh cached responses are served without making a
+    request. In offline mode only the cache is used, and a miss raises a
+    `LookupError`.
+    """
+
+    def __init__(
+        self,
+        base_url: str = PORTAL_URL,
+        keypair_path: Optional[str] = None,
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        cache: Optional[ResponseCache] = None,
+        offline: bool = False,
+    ):
+        if offline and cache is None:
+            raise ValueError("Must specify a cache to run offline")
         self.url_joiner = UrlJoiner(base_url)
         self._keypair_path = keypair_path
         self._keypairs: Optional[Tuple[str, str]] = None
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.cache = cache
+        self.offline = offline
+        self._session: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "Client":
+        # The semaphore has to be created in the running event loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self._session = httpx.AsyncClient(
+            auth=self.keypair,
+            headers={"Accept": "application/json"},
+            pool_limits=httpx.PoolLimits(
+                max_keepalive=self.max_concurrent_requests,
+                max_connections=self.max_concurrent_requests,
+            ),
+            trust_env=False,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._session is not None:
+            await self._session.aclose()
+        self._session = None
+        self._semaphore = None
+
+    def run(self, func: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        async def run_in_session() -> Any:
+            async with self:
+                return await func(*args)
+
+        return asyncio.run(run_in_session())
 
     @property
     def keypair(self) -> Optional[Tuple[str, str]]:
@@ -73,42 +269,193 @@ class Client:
         return key, secret
 
     def get_json(self, url_or_path: str) -> Dict[str, Any]:
+        return self.run(self.get_json_async, url_or_path)
+
+    async def get_json_async(self, url_or_path: str) -> Dict[str, Any]:
         """
-        A wrapper around httpx get potentially with an auth keypair that always asks for
-        JSON.
+        GET potentially with an auth keypair that always asks for JSON. Stale cache
+        entries are revalidated with a conditional request when they have an ETag.
         """
         url = self.url_joiner.resolve(url_or_path)
-        response = httpx.get(
-            url,
-            auth=self.keypair,
-            headers={"Accept": "application/json"},
-            trust_env=False,
-        )
+        if self.cache is None:
+            response = await self._get(url)
+            return self._parse_json(response, url)
+        key_id = self.keypair[0] if self.keypair is not None else None
+        cache_key = self.cache.make_key(url, key_id)
+        entry = self.cache.get(cache_key)
+        headers = {}
+        if entry is not None:
+            if self.offline or self.cache.is_fresh(entry):
+                return entry["body"]
+            if entry["etag"] is not None:
+                headers["If-None-Match"] = entry["etag"]
+        elif self.offline:
+            raise LookupError(f"No cached response for url {url} in offline mode")
+        response = await self._get(url, headers)
+        if response.status_code == 304 and entry is not None:
+            self.cache.put(cache_key, url, entry["body"], entry["etag"])
+            return entry["body"]
+        res = self._parse_json(response, url)
+        self.cache.put(cache_key, url, res, response.headers.get("ETag"))
+        return res
+
+    @staticmethod
+    def _parse_json(response: httpx.Response, url: str) -> Dict[str, Any]:
         response.raise_for_status()
         res = response.json()
         if not isinstance(res, dict):
             raise TypeError(f"Got a JSON array from url {url}, expected object")
         return res
 
-    def get_reference_epigenome(self, url_or_path: str) -> Dict[str, Any]:
+    async def _get(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> httpx.Response:
+        """
+        Retries connection errors and server errors with exponential backoff. Client
+        errors like 404 are returned immediately for the caller to raise.
+        """
+        if self._session is None or self._semaphore is None:
+            raise RuntimeError("Client session is not open, use `async with client:`")
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            try:
+                async with self._semaphore:
+                    response = await self._session.get(url, headers=headers)
+            except RETRY_EXCEPTIONS:
+                if is_last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or is_last_attempt:
+                    return response
+            await asyncio.sleep(self.backoff_factor * 2**attempt)
+        raise AssertionError("Unreachable, the last attempt always returns or raises")
+
+    def get_reference_epigenome(
+        self, url_or_path: str, single_query: bool = True
+    ) -> Dict[str, Any]:
+        return self.run(self.get_reference_epigenome_async, url_or_path, single_query)
+
+    async def get_reference_epigenome_async(
+        self, url_or_path: str, single_query: bool = True
+    ) -> Dict[str, Any]:
         """
         Original files are not embedded in the datasets, need to embed them manually.
-        Batch them using a query to save on individual requests.
+        By default the files for all of the datasets are fetched with a single search
+        by dataset, then joined back onto the datasets. Otherwise batch them using a
+        query per dataset, issuing the queries for all of the datasets concurrently.
         """
-        reference_epigenome = self.get_json(url_or_path)
-        for dataset in reference_epigenome["related_datasets"]:
-            query_params = [("type", "File")]
-            query_params.extend(("@id", f) for f in dataset["original_files"])
-            query_params.append(("frame", "object"))
-            original_files = self.search(query_params)
-            dataset["original_files"] = original_files
+        reference_epigenome = await self.get_json_async(url_or_path)
+        datasets = reference_epigenome["related_datasets"]
+        if single_query:
+            original_files = await self._get_original_files_by_dataset(datasets)
+        else:
+            original_files = await asyncio.gather(
+                *(
+                    self.search_async(self._make_original_files_query(dataset))
+                    for dataset in datasets
+                )
+            )
+        for dataset, files in zip(datasets, original_files):
+            dataset["original_files"] = files
         return reference_epigenome
 
+    async def _get_original_files_by_dataset(
+        self, datasets: List[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for the files of all the datasets at once, then index them by `@id` to
+        pick out each dataset's original files, keeping the order they are listed in.
+        Like the per dataset queries, files the search does not return, e.g. deleted
+        ones, are left out.
+        """
+        if not datasets:
+            return []
+        query_params = [("type", "File")]
+        query_params.extend(("dataset", dataset["@id"]) for dataset in datasets)
+        query_params.append(("frame", "object"))
+        files = await self.search_all_async(query_params)
+        files_by_id = {file["@id"]: file for file in files}
+        return [
+            [files_by_id[i] for i in dataset["original_files"] if i in files_by_id]
+            for dataset in datasets
+        ]
+
+    @staticmethod
+    def _make_original_files_query(dataset: Dict[str, Any]) -> List[Tuple[str, str]]:
+        query_params = [("type", "File")]
+        query_params.extend(("@id", f) for f in dataset["original_files"])
+        query_params.append(("frame", "object"))
+        return query_params
+
     def search(self, query_params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        return self.run(self.search_async, query_params)
+
+    async def search_async(
+        self, query_params: List[Tuple[str, str]]
+    ) -> List[Dict[str, Any]]:
         path = self._make_query_path(query_params)
-        result = self.get_json(path)
+        result = await self.get_json_async(path)
         return result["@graph"]
 
+    def search_all(
+        self, query_params: List[Tuple[str, str]], page_size: int = SEARCH_PAGE_SIZE
+    ) -> List[Dict[str, Any]]:
+        return self.run(self.search_all_async, query_params, page_size)
+
+    async def search_all_async(
+        self, query_params: List[Tuple[str, str]], page_size: int = SEARCH_PAGE_SIZE
+    ) -> List[Dict[str, Any]]:
+        """
+        Page through all of the results of a search. The first page gives the total
+        number of results, the rest of the pages are then fetched concurrently. Unlike
+        `search`, a search with no results returns an empty list.
+        """
+        first_page = await self._get_search_page(query_params, 0, page_size)
+        offsets = range(page_size, first_page["total"], page_size)
+        pages = await asyncio.gather(
+            *(self._get_search_page(query_params, i, page_size) for i in offsets)
+        )
+        results: List[Dict[str, Any]] = first_page["@graph"]
+        for page in pages:
+            results.extend(page["@graph"])
+        return results
+
+    async def _get_search_page(
+        self, query_params: List[Tuple[str, str]], offset: int, page_size: int
+    ) -> Dict[str, Any]:
+        page_params = [("limit", str(page_size)), ("from", str(offset))]
+        path = self._make_query_path(query_params + page_params)
+        try:
+            return await self.get_json_async(path)
+        except httpx.HTTPError as e:
+            # The portal responds with a 404 when a search has no results
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return {"@graph": [], "total": 0}
+
+    def get_objects(self, item_type: str, ids: List[str]) -> List[Dict[str, Any]]:
+        return self.run(self.get_objects_async, item_type, ids)
+
+    async def get_objects_async(
+        self, item_type: str, ids: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch the objects with the given `@id`s in a single search, returning them in
+        the same order as `ids`. Any objects missing from the search results, e.g.
+        because they are not indexed yet, are fetched individually.
+        """
+        if not ids:
+            return []
+        query_params = [("type", item_type)]
+        query_params.extend(("@id", i) for i in ids)
+        query_params.append(("frame", "object"))
+        results = await self.search_all_async(query_params)
+        objs = {result["@id"]: result for result in results}
+        misses = [i for i in dict.fromkeys(ids) if i not in objs]
+        fetched = await asyncio.gather(*(self.get_json_async(i) for i in misses))
+        objs.update(zip(misses, fetched))
+        return [objs[i] for i in ids]
+
     def _make_query_path(self, query_params: List[Tuple[str, str]]) -> str:
         """
         Generate the query string for the ENCODE portal's `/search` endpoint with the
@@ -120,8 +467,12 @@ class Client:
 
     def get_assembly(self, chrom_sizes_url: str) -> str:
         file = self.get_json(chrom_sizes_url)
+        return self.get_assembly_from_file_obj(file)
+
+    @staticmethod
+    def get_assembly_from_file_obj(portal_file: Dict[str, Any]) -> str:
         try:
-            assembly: str = file["assembly"]
+            assembly: str = portal_file["assembly"]
         except KeyError as e:
             raise ValueError("Chrom sizes file does not have an assembly") from e
         return assembly
@@ -158,14 +509,14 @@ class ArgHelper:
         self._validate_args(args)
         return args
 
+    @property
+    def is_batch(self) -> bool:
+        return self.args.accession is None
+
     @staticmethod
     def _transform_args(args: argparse.Namespace) -> argparse.Namespace:
-        epigenome_id = (
-            "/".join(("reference-epigenomes", args.accession))
-            if not args.accession.startswith("reference-epigenomes")
-            else args.accession
-        )
-        args.accession = epigenome_id
+        if args.accession is not None:
+            args.accession = get_epigenome_id(args.accession)
         return args
 
     @staticmethod
@@ -180,24 +531,35 @@ class ArgHelper:
 
     def get_extra_props(self, chrom_sizes_url: str, annotation_url: str) -> InputJson:
         args = vars(self.args)
-        extra_props: InputJson = {k: v for k, v in args.items() if v is not None}
-        extra_props.pop("accession")
-        extra_props.pop("outfile", None)
-        extra_props.pop("keypair", None)
-        extra_props.pop("chip_targets", None)
-        extra_props.pop("skip_assays", None)
+        extra_props: InputJson = {
+            k: v for k, v in args.items() if v is not None and k not in SCRIPT_ARGS
+        }
         extra_props["chrom_sizes"] = chrom_sizes_url
         extra_props["annotation_gtf"] = annotation_url
         return extra_props
 
     def _get_parser(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser()
-        parser.add_argument(
+        accessions = parser.add_mutually_exclusive_group(required=True)
+        accessions.add_argument(
             "-a",
             "--accession",
-            required=True,
             help="Accession of reference epigenome on the ENCODE portal",
         )
+        accessions.add_argument(
+            "--accessions-file",
+            help=(
+                "Path to a file with one reference epigenome accession per line, to "
+                "generate input JSONs for all of them in one run"
+            ),
+        )
+        accessions.add_argument(
+            "--search-query",
+            help=(
+                "Portal search query string selecting reference epigenomes to generate "
+                "input JSONs for, e.g. `status=released&biosample_ontology.classification=tissue`"
+            ),
+        )
         parser.add_argument(
             "--skip-assays",
             nargs="+",
@@ -271,29 +633,195 @@ class ArgHelper:
         parser.add_argument(
             "-o", "--outfile", help="Name of file to output the input JSON"
         )
+        parser.add_argument(
+            "-d",
+            "--output-dir",
+            help=(
+                "Directory to write input JSONs to when generating them for many "
+                "reference epigenomes, defaults to the current directory"
+            ),
+        )
+        parser.add_argument(
+            "-j",
+            "--num-parallel",
+            type=int,
+            default=MAX_CONCURRENT_EPIGENOMES,
+            help="Number of reference epigenomes to fetch from the portal at once",
+        )
         parser.add_argument(
             "-k",
             "--keypair",
             help="Path to JSON file containing portal API keys, only needed for in progress data",
         )
+        parser.add_argument(
+            "--cache-dir",
+            help=(
+                "Directory to cache portal responses in across runs, if not specified "
+                "responses are not cached"
+            ),
+        )
+        parser.add_argument(
+            "--cache-ttl",
+            type=float,
+            default=CACHE_TTL,
+            help="Time in seconds after which cached responses are revalidated",
+        )
+        parser.add_argument(
+            "--cache-max-size",
+            type=int,
+            default=CACHE_MAX_SIZE_MB,
+            help="Maximum size of the cache in MB, least recently used responses are evicted beyond it",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="Only use cached responses, raising an error for anything not in the cache",
+        )
         return parser
 
 
 def main() -> None:
     arg_helper = ArgHelper()
     args = arg_helper.args
-    client = Client(keypair_path=args.keypair)
-    reference_epigenome = client.get_reference_epigenome(args.accession)
-    assembly = client.get_assembly(args.chrom_sizes)
-    portal_files = get_portal_files(
+    cache = (
+        ResponseCache(args.cache_dir, args.cache_ttl, args.cache_max_size * 1024 * 1024)
+        if args.cache_dir is not None
+        else None
+    )
+    client = Client(keypair_path=args.keypair, cache=cache, offline=args.offline)
+    if not arg_helper.is_batch:
+        input_json = client.run(make_input_json_for_accession, client, arg_helper)
+        outfile = args.outfile if args.outfile is not None else f"{args.accession}.json"
+        write_json(input_json, outfile)
+        return
+    output_dir = args.output_dir if args.output_dir is not None else "."
+    failures = client.run(make_input_jsons, client, arg_helper, output_dir)
+    failures_path = os.path.join(output_dir, FAILURES_FILENAME)
+    write_json(failures, failures_path)
+    if failures:
+        raise SystemExit(
+            f"Could not generate input JSONs for {len(failures)} reference "
+            f"epigenomes, see {failures_path}"
+        )
+
+
+async def make_input_json_for_accession(
+    client: Client, arg_helper: ArgHelper
+) -> InputJson:
+    args = arg_helper.args
+    reference_epigenome, (assembly, extra_props) = await asyncio.gather(
+        client.get_reference_epigenome_async(args.accession),
+        get_shared_inputs(client, arg_helper),
+    )
+    portal_files = await get_portal_files_async(
         reference_epigenome, assembly, client, args.skip_assays, args.chip_targets
     )
-    chrom_sizes_s3_url = client.get_url_for_file(args.chrom_sizes)
-    annotation_s3_url = client.get_url_for_file(args.annotation_gtf)
-    extra_props = arg_helper.get_extra_props(chrom_sizes_s3_url, annotation_s3_url)
-    input_json = make_input_json(portal_files, extra_props)
-    outfile = args.outfile if args.outfile is not None else f"{args.accession}.json"
-    write_json(input_json, outfile)
+    return make_input_json(portal_files, extra_props)
+
+
+async def make_input_jsons(
+    client: Client, arg_helper: ArgHelper, output_dir: str
+) -> Dict[str, str]:
+    """
+    Generate and write out input JSONs for every requested reference epigenome,
+    sharing the client session and the chrom sizes and annotation lookups across all
+    of them. Up to `--num-parallel` epigenomes are fetched concurrently. A failure for
+    one epigenome does not stop the others, instead returns the error messages keyed
+    by accession.
+    """
+    args = arg_helper.args
+    accessions, (assembly, extra_props) = await asyncio.gather(
+        get_accessions(client, args.accessions_file, args.search_query),
+        get_shared_inputs(client, arg_helper),
+    )
+    semaphore = asyncio.Semaphore(args.num_parallel)
+
+    async def make_and_write_input_json(accession: str) -> None:
+        async with semaphore:
+            reference_epigenome = await client.get_reference_epigenome_async(
+                get_epigenome_id(accession)
+            )
+            portal_files = await get_portal_files_async(
+                reference_epigenome,
+                assembly,
+                client,
+                args.skip_assays,
+                args.chip_targets,
+            )
+        input_json = make_input_json(portal_files, extra_props)
+        write_json(input_json, os.path.join(output_dir, f"{accession}.json"))
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = await asyncio.gather(
+        *(make_and_write_input_json(accession) for accession in accessions),
+        return_exceptions=True,
+    )
+    failures = {}
+    for accession, result in zip(accessions, results):
+        if isinstance(result, Exception):
+            failures[accession] = f"{type(result).__name__}: {result}"
+    return failures
+
+
+async def get_shared_inputs(
+    client: Client, arg_helper: ArgHelper
+) -> Tuple[str, InputJson]:
+    """
+    The chrom sizes and annotation are the same for every reference epigenome, so
+    only need to be looked up once per run. Returns the assembly and the extra input
+    JSON props.
+    """
+    args = arg_helper.args
+    chrom_sizes, annotation = await asyncio.gather(
+        client.get_json_async(args.chrom_sizes),
+        client.get_json_async(args.annotation_gtf),
+    )
+    assembly = client.get_assembly_from_file_obj(chrom_sizes)
+    extra_props = arg_helper.get_extra_props(
+        client.get_url_from_file_obj(chrom_sizes),
+        client.get_url_from_file_obj(annotation),
+    )
+    return assembly, extra_props
+
+
+async def get_accessions(
+    client: Client,
+    accessions_file: Optional[str] = None,
+    search_query: Optional[str] = None,
+) -> List[str]:
+    """
+    Read the accessions from a file, ignoring blank lines and duplicates, or look
+    them up with a portal search. Searches are restricted to reference epigenomes
+    unless the query specifies a type.
+    """
+    if accessions_file is not None:
+        with open(accessions_file) as f:
+            accessions = [get_accession(line.strip()) for line in f if line.strip()]
+        return list(dict.fromkeys(accessions))
+    if search_query is None:
+        raise ValueError("Must specify either an accessions file or a search query")
+    query_params = parse_qsl(search_query)
+    keys = [key for key, _ in query_params]
+    if "type" not in keys:
+        query_params.insert(0, ("type", "ReferenceEpigenome"))
+    if "limit" not in keys:
+        query_params.append(("limit", "all"))
+    query_params.append(("field", "accession"))
+    results = await client.search_async(query_params)
+    return [result["accession"] for result in results]
+
+
+def get_epigenome_id(accession: str) -> str:
+    """
+    Resolves accessions like ENCSR867OGI to the path of the reference epigenome.
+    """
+    if accession.startswith("reference-epigenomes"):
+        return accession
+    return "/".join(("reference-epigenomes", accession))
+
+
+def get_accession(epigenome_id: str) -> str:
+    return epigenome_id.strip("/").split("/")[-1]
 
 
 def get_portal_files(
@@ -302,6 +830,23 @@ def get_portal_files(
     client: Client,
     skip_assays: Optional[List[str]] = None,
     chip_targets: Optional[List[str]] = None,
+) -> List[str]:
+    return client.run(
+        get_portal_files_async,
+        reference_epigenome,
+        assembly,
+        client,
+        skip_assays,
+        chip_targets,
+    )
+
+
+async def get_portal_files_async(
+    reference_epigenome: Dict[str, Any],
+    assembly: str,
+    client: Client,
+    skip_assays: Optional[List[str]] = None,
+    chip_targets: Optional[List[str]] = None,
 ) -> List[str]:
     datasets_files: Dict[str, str] = {}
     found_targets: List[str] = []
@@ -328,7 +873,9 @@ def get_portal_files(
         max_num_reps_in_files = max(len(i["biological_replicates"]) for i in files)
         is_replicated_dnase = assay_title == "DNase-seq" and num_bioreps > 1
         if is_replicated_dnase:
-            preferred_replicate = get_dnase_preferred_replicate(files, client)
+            preferred_replicate = await get_dnase_preferred_replicate_async(
+                files, client
+            )
         for file in files:
             if file["file_format"] != "bigWig" or file["assembly"] != assembly:
                 continue
@@ -374,9 +921,15 @@ def filter_by_status(objs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
 
 def get_dnase_preferred_replicate(
     files: List[Dict[str, Any]], client: Client
+) -> List[int]:
+    return client.run(get_dnase_preferred_replicate_async, files, client)
+
+
+async def get_dnase_preferred_replicate_async(
+    files: List[Dict[str, Any]], client: Client
 ) -> List[int]:
     bams = [i for i in files if i["output_type"] == "alignments"]
-    max_mapped_read_count = -1
+    flagstats_ids = []
     for bam in bams:
         samtools_flagstats = [
             i for i in bam["quality_metrics"] if i.startswith("/samtools-flagstats")
@@ -385,7 +938,12 @@ def get_dnase_preferred_replicate(
             raise ValueError(
                 f"Expected one samtools flagstats quality metric for file {bam['@id']}, found {len(samtools_flagstats)}"
             )
-        qc = client.get_json(samtools_flagstats[0])
+        flagstats_ids.append(samtools_flagstats[0])
+    qcs = await client.get_objects_async(
+        "SamtoolsFlagstatsQualityMetric", flagstats_ids
+    )
+    max_mapped_read_count = -1
+    for bam, qc in zip(bams, qcs):
         qc_mapped_read_count = qc["mapped"]
         if qc_mapped_read_count > max_mapped_read_count:
             preferred_replicate: List[int] = bam["biological_replicates"]
@@ -393,7 +951,7 @@ def get_dnase_preferred_replicate(
     return preferred_replicate
 
 
-def write_json(input_json: InputJson, path: str) -> None:
+def write_json(input_json: Union[InputJson, Dict[str, str]], path: str) -> None:
     with open(path, "w") as f:
         f.write(json.dumps(input_json, indent=4))
 
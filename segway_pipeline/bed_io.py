@@ -0,0 +1,86 @@
+import gzip
+import io
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.pool import AsyncResult
+from typing import IO, Callable, Deque, Iterable, Iterator, List, TypeVar, Union
+
+T = TypeVar("T")
+
+BUFFER_SIZE = 1 << 20
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+@contextmanager
+def open_bed(path: str, mode: str = "r") -> Iterator[IO[str]]:
+    """
+    Open a BED file for streaming text IO, transparently handling compression. Input
+    is sniffed for the gzip magic number, so both plain gzip and bgzip (multi-member
+    gzip) files can be read directly. Output is gzipped when the path ends in `.gz`,
+    with the mtime zeroed, no filename in the header and the default compression level
+    like `gzip -n`.
+    """
+    if mode not in ("r", "w"):
+        raise ValueError(f"Unsupported mode {mode}, must be one of `r` or `w`")
+    raw = open(path, f"{mode}b", buffering=BUFFER_SIZE)
+    try:
+        if mode == "r" and raw.peek(2)[:2] == GZIP_MAGIC:  # type: ignore
+            binary: Union[gzip.GzipFile, IO[bytes]] = gzip.GzipFile(
+                fileobj=raw, mode="rb"
+            )
+        elif mode == "w" and path.endswith(".gz"):
+            binary = gzip.GzipFile(
+                filename="", fileobj=raw, mode="wb", compresslevel=6, mtime=0
+            )
+        else:
+            binary = raw
+        newline = "" if mode == "w" else None
+        with io.TextIOWrapper(
+            binary, encoding="utf-8", newline=newline  # type: ignore
+        ) as f:
+            yield f
+    finally:
+        raw.close()
+
+
+def read_blocks(
+    file_handle: IO[str], block_size: int = BUFFER_SIZE
+) -> Iterator[List[str]]:
+    """
+    Yield lists of complete lines totalling roughly `block_size` characters, so that
+    callers can process and write out whole blocks at a time.
+    """
+    while True:
+        lines = file_handle.readlines(block_size)
+        if not lines:
+            return
+        yield lines
+
+
+def map_blocks(
+    func: Callable[[List[str]], T],
+    blocks: Iterable[List[str]],
+    num_processes: int = 1,
+) -> Iterator[T]:
+    """
+    Apply `func` to each block of lines, yielding the results in input order so the
+    output is identical regardless of the number of processes. With more than one
+    process the blocks are handed to a process pool, keeping only a couple of blocks
+    per process in flight so that memory use stays bounded when reading is faster
+    than processing. `func` must be picklable, e.g. a module level function or a
+    `functools.partial` of one.
+    """
+    if num_processes < 1:
+        raise ValueError("Must use at least one process")
+    if num_processes == 1:
+        yield from map(func, blocks)
+        return
+    with multiprocessing.Pool(num_processes) as pool:
+        pending: Deque[AsyncResult] = deque()
+        for block in blocks:
+            pending.append(pool.apply_async(func, (block,)))
+            if len(pending) >= 2 * num_processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,184 @@
+import argparse
+import heapq
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+SHARD_FILENAME = "shard_{:03d}.bed"
+GENOMEDATA_SUFFIX = ".genomedata"
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.outdir is None and args.plan_outfile is None:
+        parser.error("Must specify at least one of --outdir or --plan-outfile")
+    chroms = read_chrom_sizes(args.sizes)
+    if args.genomedata is not None:
+        chroms = filter_chroms(chroms, read_genomedata_chroms(args.genomedata))
+    shards = shard_chroms(chroms, args.num_shards)
+    if args.outdir is not None:
+        write_shard_beds(shards, args.outdir)
+    if args.plan_outfile is not None:
+        with open(args.plan_outfile, "w") as f:
+            f.write(json.dumps(make_plan(shards, args.num_shards), indent=4))
+
+
+def read_chrom_sizes(chrom_sizes: str) -> List[Tuple[str, int]]:
+    chroms = []
+    with open(chrom_sizes) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chrom, size = line.split()[:2]
+            chroms.append((chrom, int(size)))
+    return chroms
+
+
+def read_genomedata_chroms(genomedata: str) -> List[str]:
+    """
+    A file mode archive has a group per chromosome, a directory mode archive has a
+    file per chromosome.
+    """
+    if os.path.isdir(genomedata):
+        return [
+            name[: -len(GENOMEDATA_SUFFIX)]
+            for name in os.listdir(genomedata)
+            if name.endswith(GENOMEDATA_SUFFIX)
+        ]
+    import tables
+
+    with tables.open_file(genomedata) as h5file:
+        return [
+            group._v_name for group in h5file.iter_nodes(h5file.root, classname="Group")
+        ]
+
+
+def filter_chroms(
+    chroms: List[Tuple[str, int]], keep: List[str]
+) -> List[Tuple[str, int]]:
+    keep_set = set(keep)
+    return [(chrom, size) for chrom, size in chroms if chrom in keep_set]
+
+
+def shard_chroms(
+    chroms: List[Tuple[str, int]], num_shards: int
+) -> List[List[Tuple[str, int]]]:
+    """
+    Split the chromosomes into at most `num_shards` groups, keeping the largest group
+    as small as possible. They are first assigned largest first to whichever shard
+    is smallest so far, then `balance_shards` improves on that. Ties are broken by
+    name and shard number so the result does not depend on the order of the chrom
+    sizes file. No shard is empty, so there are fewer shards than asked for if there
+    are fewer chromosomes. The chromosomes of each shard are sorted by name, and the
+    shards from largest to smallest, so the longest running shards can start first.
+    """
+    if num_shards < 1:
+        raise ValueError("Must use at least one shard")
+    largest_first = sorted(chroms, key=lambda chrom: (-chrom[1], chrom[0]))
+    num_shards = min(num_shards, len(chroms))
+    shards: List[List[Tuple[str, int]]] = [[] for _ in range(num_shards)]
+    heap = [(0, shard) for shard in range(num_shards)]
+    for chrom, size in largest_first:
+        total, shard = heapq.heappop(heap)
+        shards[shard].append((chrom, size))
+        heapq.heappush(heap, (total + size, shard))
+    balance_shards(shards)
+    shards = [sorted(shard) for shard in shards]
+    return sorted(shards, key=lambda shard: (-get_shard_size(shard), shard))
+
+
+def balance_shards(shards: List[List[Tuple[str, int]]]) -> None:
+    """
+    Assigning largest first can leave the largest shard up to a third larger than it
+    needs to be. Improve on it in place by repeatedly moving a chromosome from the
+    largest shard to another, or swapping it for a smaller one from another, making
+    the move that leaves the larger of the two shards smallest, as long as that is
+    smaller than the largest shard was. Every move reduces the sum of the squares of
+    the shard sizes, so this always finishes.
+    """
+    while True:
+        sizes = [get_shard_size(shard) for shard in shards]
+        largest = max(range(len(shards)), key=lambda i: (sizes[i], -i))
+        best: Optional[Tuple[int, int, int, Optional[int]]] = None
+        for other, other_shard in enumerate(shards):
+            if other == largest:
+                continue
+            for i, (_, size) in enumerate(shards[largest]):
+                # Swapping with nothing is a move
+                swaps: List[Tuple[Optional[int], int]] = [(None, 0)]
+                swaps += [
+                    (j, other_size)
+                    for j, (_, other_size) in enumerate(other_shard)
+                    if other_size < size
+                ]
+                for j, other_size in swaps:
+                    change = size - other_size
+                    new_max = max(sizes[largest] - change, sizes[other] + change)
+                    if new_max < sizes[largest] and (best is None or new_max < best[0]):
+                        best = (new_max, other, i, j)
+        if best is None:
+            return
+        _, other, i, j = best
+        chrom = shards[largest].pop(i)
+        if j is not None:
+            shards[largest].append(shards[other].pop(j))
+        shards[other].append(chrom)
+
+
+def get_shard_size(shard: List[Tuple[str, int]]) -> int:
+    return sum(size for _, size in shard)
+
+
+def make_plan(shards: List[List[Tuple[str, int]]], num_shards: int) -> Dict[str, Any]:
+    """
+    The chromosomes of each shard in a form WDL can read with `read_json`, along with
+    the size of each shard. The pipeline scatters over the shard BEDs instead, so the
+    plan is for choosing the number of shards. The lower bound on the size of the
+    largest shard for any assignment shows how close to balanced it is.
+    """
+    total = sum(get_shard_size(shard) for shard in shards)
+    largest_chrom = max((size for shard in shards for _, size in shard), default=0)
+    return {
+        "shards": [[chrom for chrom, _ in shard] for shard in shards],
+        "sizes": [get_shard_size(shard) for shard in shards],
+        "lower_bound": max(largest_chrom, -(-total // num_shards)),
+    }
+
+
+def write_shard_beds(shards: List[List[Tuple[str, int]]], outdir: str) -> None:
+    """
+    Write each shard as a BED of whole chromosomes, to pass to `segway annotate
+    --include-coords`.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    for i, shard in enumerate(shards):
+        with open(os.path.join(outdir, SHARD_FILENAME.format(i)), "w") as f:
+            for chrom, size in shard:
+                f.write(f"{chrom}\t0\t{size}\n")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Split the genome into shards of whole chromosomes with similar total sizes"
+    )
+    parser.add_argument("--sizes", required=True, help="path to chrom sizes file")
+    parser.add_argument(
+        "-n", "--num-shards", type=int, required=True, help="number of shards"
+    )
+    parser.add_argument(
+        "--genomedata",
+        help="only shard the chromosomes present in this genomedata archive",
+    )
+    parser.add_argument(
+        "-o", "--outdir", help="directory to write a BED of each shard's chromosomes to"
+    )
+    parser.add_argument(
+        "--plan-outfile",
+        help="path to write the chromosomes and size of each shard to as JSON",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+STDERR_TAIL_LINES = 50
+# ru_maxrss is in kilobytes on Linux but in bytes on macOS
+MAX_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class ResourceUsage:
+    """
+    Resources used by the child processes that finished within a `measure_children`
+    block. The times only count those children, but the peak RSS is the largest of any
+    child of this process so far, so is an overestimate if a bigger command was run
+    earlier.
+    """
+
+    def __init__(self) -> None:
+        self.wall_seconds = 0.0
+        self.user_seconds = 0.0
+        self.system_seconds = 0.0
+        self.peak_rss_bytes = 0
+
+    @property
+    def cpu_seconds(self) -> float:
+        return self.user_seconds + self.system_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wall_seconds": self.wall_seconds,
+            "user_seconds": self.user_seconds,
+            "system_seconds": self.system_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+
+@contextmanager
+def measure_children() -> Iterator[ResourceUsage]:
+    usage = ResourceUsage()
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage.wall_seconds = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage.user_seconds = after.ru_utime - before.ru_utime
+        usage.system_seconds = after.ru_stime - before.ru_stime
+        usage.peak_rss_bytes = after.ru_maxrss * MAX_RSS_UNIT
+
+
+def run_command(
+    command: List[str], metrics_path: Optional[str] = None
+) -> ResourceUsage:
+    """
+    Run the command, passing its stderr through as it is written. If it fails raises
+    `subprocess.CalledProcessError`, with the last lines of stderr attached since the
+    rest may be far back in the logs. If `metrics_path` is given, the exit status and
+    resource usage are written there as JSON, whether or not the command succeeded.
+    """
+    stderr_tail: Deque[bytes] = deque(maxlen=STDERR_TAIL_LINES)
+    with measure_children() as usage:
+        with subprocess.Popen(command, stderr=subprocess.PIPE) as process:
+            for line in process.stderr:  # type: ignore
+                sys.stderr.buffer.write(line)
+                sys.stderr.buffer.flush()
+                stderr_tail.append(line)
+    if metrics_path is not None:
+        write_metrics(usage, metrics_path, command, process.returncode)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, command, stderr=b"".join(stderr_tail)
+        )
+    return usage
+
+
+def write_metrics(
+    usage: ResourceUsage,
+    path: str,
+    command: Optional[List[str]] = None,
+    returncode: Optional[int] = None,
+) -> None:
+    metrics: Dict[str, Any] = {"command": command, "returncode": returncode}
+    metrics.update(usage.to_dict())
+    with open(path, "w") as f:
+        f.write(json.dumps(metrics, indent=4))
@@ -0,0 +1,196 @@
+import argparse
+import csv
+import json
+import math
+from typing import Callable, Dict, List, Tuple
+
+from segway_pipeline.chrom_sizes import get_shard_size, read_chrom_sizes, shard_chroms
+
+# The resources the pipeline always reserved, which are known to be enough for ENCODE
+# reference epigenomes on GRCh38 with the default hyperparameters. They are used as they
+# are unless there are recorded runs to calibrate the estimates against.
+DEFAULT_RESOURCES = {
+    "train_memory_gb": 300,
+    "train_disk_gb": 1000,
+    "annotate_memory_gb": 400,
+    "annotate_disk_gb": 1000,
+}
+DIMENSIONS = [
+    "num_tracks",
+    "resolution",
+    "minibatch_fraction",
+    "num_instances",
+    "genome_length",
+]
+# What even the smallest runs need, for the interpreter, GMTK and the Segway outputs
+BASELINE_MEMORY_GB = 8
+BASELINE_DISK_GB = 50
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.calibration is None:
+        estimates = DEFAULT_RESOURCES
+    else:
+        estimates = estimate_resources(
+            read_calibration(args.calibration),
+            read_chrom_sizes(args.chrom_sizes),
+            args.num_tracks,
+            args.resolution,
+            args.minibatch_fraction,
+            args.num_instances,
+            args.num_annotate_shards,
+        )
+    with open(args.outfile, "w") as f:
+        f.write(json.dumps(estimates, indent=4))
+
+
+def estimate_resources(
+    calibration: List[Dict[str, float]],
+    chroms: List[Tuple[str, int]],
+    num_tracks: int,
+    resolution: int,
+    minibatch_fraction: float,
+    num_instances: int,
+    num_annotate_shards: int = 1,
+) -> Dict[str, int]:
+    """
+    Scale the resources of the recorded runs to the size of this one.
+    """
+    run = {
+        "num_tracks": num_tracks,
+        "resolution": resolution,
+        "minibatch_fraction": minibatch_fraction,
+        "num_instances": num_instances,
+        "genome_length": sum(size for _, size in chroms),
+    }
+    # Each annotation shard only sees its own chromosomes, the largest shard needs most
+    annotate_run = dict(
+        run,
+        genome_length=get_shard_size(shard_chroms(chroms, num_annotate_shards)[0]),
+    )
+    estimates = {}
+    for resource, (baseline, get_work) in RESOURCE_MODELS.items():
+        model = ResourceModel.fit(
+            baseline, [(get_work(r), r[resource]) for r in calibration]
+        )
+        estimates[resource] = model.predict(
+            get_work(annotate_run if resource.startswith("annotate") else run)
+        )
+    return estimates
+
+
+class ResourceModel:
+    """
+    Predicts a resource in GB as a fixed baseline plus a cost per unit of work.
+    """
+
+    def __init__(self, baseline: float, per_unit: float) -> None:
+        self.baseline = baseline
+        self.per_unit = per_unit
+
+    @classmethod
+    def fit(cls, baseline: float, points: List[Tuple[float, float]]) -> "ResourceModel":
+        """
+        Least squares fit of the cost per unit of work to (work, resource) points from
+        recorded runs. The baseline is kept fixed, since there are rarely enough runs of
+        different sizes to fit it too, and a single run is enough to calibrate.
+        """
+        if not points:
+            raise ValueError("Need at least one recorded run to calibrate against")
+        sum_squares = sum(work**2 for work, _ in points)
+        if sum_squares == 0:
+            raise ValueError("Recorded runs must have done some work")
+        per_unit = sum(work * (used - baseline) for work, used in points) / sum_squares
+        return cls(baseline, max(per_unit, 0.0))
+
+    def predict(self, work: float) -> int:
+        """
+        Rounds up to whole GB, ignoring floating point error so that a recorded run
+        predicts exactly what it used.
+        """
+        return math.ceil(round(self.baseline + self.per_unit * work, 6))
+
+
+def get_train_memory_work(run: Dict[str, float]) -> float:
+    """
+    Every instance holds its own minibatch of every track at the model resolution.
+    """
+    return (
+        run["num_instances"]
+        * run["num_tracks"]
+        * run["minibatch_fraction"]
+        * run["genome_length"]
+        / run["resolution"]
+    )
+
+
+def get_annotate_memory_work(run: Dict[str, float]) -> float:
+    """
+    Annotation decodes all of the genome, with one instance and no minibatches.
+    """
+    return run["num_tracks"] * run["genome_length"] / run["resolution"]
+
+
+def get_disk_work(run: Dict[str, float]) -> float:
+    """
+    The localized genomedata dominates disk use, it holds every track at base pair
+    resolution.
+    """
+    return run["num_tracks"] * run["genome_length"]
+
+
+RESOURCE_MODELS: Dict[str, Tuple[float, Callable[[Dict[str, float]], float]]] = {
+    "train_memory_gb": (BASELINE_MEMORY_GB, get_train_memory_work),
+    "train_disk_gb": (BASELINE_DISK_GB, get_disk_work),
+    "annotate_memory_gb": (BASELINE_MEMORY_GB, get_annotate_memory_work),
+    "annotate_disk_gb": (BASELINE_DISK_GB, get_disk_work),
+}
+
+
+def read_calibration(path: str) -> List[Dict[str, float]]:
+    """
+    Reads recorded runs from a TSV with a header row of the dimensions of the run and
+    the resources in GB it should reserve, e.g. its peak usage plus some headroom.
+    """
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        missing = set(DIMENSIONS + list(RESOURCE_MODELS)) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(
+                f"Calibration file is missing columns {', '.join(sorted(missing))}"
+            )
+        return [{key: float(value) for key, value in row.items()} for row in reader]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Estimate the memory and disk segway train and annotate need"
+    )
+    parser.add_argument("--num-tracks", type=int, required=True)
+    parser.add_argument("--resolution", type=int, required=True)
+    parser.add_argument("--minibatch-fraction", type=float, required=True)
+    parser.add_argument("--num-instances", type=int, required=True)
+    parser.add_argument("--chrom-sizes", required=True, help="path to chrom sizes file")
+    parser.add_argument(
+        "--num-annotate-shards",
+        type=int,
+        default=1,
+        help="number of tasks annotation is split across, see chrom_sizes.py",
+    )
+    parser.add_argument(
+        "--calibration",
+        help="TSV of recorded runs to calibrate the estimates against, without it the pipeline's fixed resources are written",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        required=True,
+        help="path to write the estimates in GB to as JSON",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import os
+import re
+import tarfile
+from typing import Iterator, List, Optional, Tuple
+
+from segway_pipeline.make_tarball import TarballIndex
+
+
+class MemberFilter:
+    """
+    Selects the archive members to extract. Like `tar`, giving a directory's name
+    selects everything under it too, and no names selects everything. Members whose
+    names entirely match the `exclude` regular expression are skipped.
+    """
+
+    def __init__(
+        self, names: Optional[List[str]] = None, exclude: Optional[str] = None
+    ) -> None:
+        self.names = [name.rstrip("/") for name in names or []]
+        self.exclude = re.compile(exclude) if exclude is not None else None
+
+    def __call__(self, name: str) -> bool:
+        name = name.rstrip("/")
+        if self.exclude is not None and self.exclude.fullmatch(name):
+            return False
+        if not self.names:
+            return True
+        return any(name == n or name.startswith(f"{n}/") for n in self.names)
+
+
+def main() -> None:
+    parser = get_parser()
+    # Allows the member names to come after the options like with tar
+    args = parser.parse_intermixed_args()
+    os.makedirs(args.directory, exist_ok=True)
+    extract_tarball(
+        args.archive,
+        args.directory,
+        MemberFilter(args.names, args.exclude),
+        args.strip_components,
+        args.index,
+    )
+
+
+def extract_tarball(
+    archive: str,
+    directory: str,
+    member_filter: MemberFilter,
+    strip_components: int = 0,
+    index_path: Optional[str] = None,
+) -> None:
+    """
+    With an index from `make_tarball`, only the parts of the archive holding the
+    selected members are read and decompressed. Any other tarball is decompressed in
+    one pass, but still only the selected members are written out.
+    """
+    if index_path is None:
+        with tarfile.open(archive, "r|*") as tar:
+            for member in tar:
+                if member_filter(member.name):
+                    extract_member(tar, member, directory, strip_components)
+        return
+    index = TarballIndex.from_file(index_path)
+    with open(archive, "rb") as f:
+        for start, end in get_ranges(index, member_filter):
+            with tarfile.open(fileobj=index.open(f, start, end), mode="r|") as tar:
+                for member in tar:
+                    extract_member(tar, member, directory, strip_components)
+
+
+def get_ranges(
+    index: TarballIndex, member_filter: MemberFilter
+) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the ranges of the tar stream holding the selected entries, merging adjacent
+    entries so each part of the archive is only decompressed once.
+    """
+    current: Optional[Tuple[int, int]] = None
+    for name, start, end in index.entries:
+        if not member_filter(name):
+            continue
+        if current is not None and current[1] == start:
+            current = (current[0], end)
+            continue
+        if current is not None:
+            yield current
+        current = (start, end)
+    if current is not None:
+        yield current
+
+
+def extract_member(
+    tar: tarfile.TarFile,
+    member: tarfile.TarInfo,
+    directory: str,
+    strip_components: int = 0,
+) -> None:
+    """
+    Extract the member like `tar --strip-components`, skipping it if no path is left.
+    Unlike `tarfile`, but like `tar`, permissions are masked by the umask unless
+    running as root.
+    """
+    parts = member.name.split("/")[strip_components:]
+    if not any(parts):
+        return
+    member.name = "/".join(parts)
+    if member.islnk():
+        member.linkname = "/".join(member.linkname.split("/")[strip_components:])
+    if os.geteuid() != 0:
+        member.mode &= ~get_umask()
+    tar.extract(member, directory)
+
+
+def get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Extract selected members of a tarball, reading only the parts of the archive needed when it is indexed"
+    )
+    parser.add_argument("archive", help="path to the .tar.gz")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="members to extract, including everything under directories, by default all",
+    )
+    parser.add_argument(
+        "-C", "--directory", default=".", help="directory to extract into"
+    )
+    parser.add_argument(
+        "--index", help="path to the archive's index written by make_tarball.py"
+    )
+    parser.add_argument(
+        "--exclude",
+        help="skip members whose names entirely match this regular expression",
+    )
+    parser.add_argument(
+        "--strip-components",
+        type=int,
+        default=0,
+        help="number of leading path components to remove from the names, like tar",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
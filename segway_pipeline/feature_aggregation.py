@@ -0,0 +1,497 @@
+import argparse
+import os
+from typing import IO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from segway_pipeline.bed_io import open_bed
+from segway_pipeline.gtf_index import GtfIndex, get_digest, read_gtf_index
+from segway_pipeline.length_distribution import get_label_order
+from segway_pipeline.segmentation import Segmentation, to_strings
+from segway_pipeline.signal_distribution import (
+    ChromSegments,
+    label_positions,
+    split_chroms,
+)
+
+FEATURE_AGGREGATION_FILENAME = "feature_aggregation.tab"
+FEATURE_AGGREGATION_FIELDNAMES = ["group", "component", "offset"]
+GROUP = "genes"
+DEFAULT_FLANK_BASES = 500
+INTRON_BINS = 50
+EXON_BINS = 25
+
+# Component names, filled in with the mean length of the component's features
+FLANK_5P = "5' flanking: %d bp"
+FLANK_3P = "3' flanking: %d bp"
+INITIAL_EXON = "initial exon (%d bp)"
+TERMINAL_EXON = "terminal exon (%d bp)"
+SPLICE_COMPONENTS = [
+    INITIAL_EXON,
+    "initial intron (%d bp)",
+    "internal exons (%d bp)",
+    "internal introns (%d bp)",
+    TERMINAL_EXON,
+    "terminal intron (%d bp)",
+]
+CODING_COMPONENTS = [
+    "initial 5' UTR (%d bp)",
+    "5' UTR introns (%d bp)",
+    "internal 5' UTR (%d bp)",
+    "terminal 5' UTR (%d bp)",
+    "initial CDS (%d bp)",
+    "terminal CDS (%d bp)",
+    "initial 3' UTR (%d bp)",
+    "internal 3' UTR (%d bp)",
+    "3' UTR introns (%d bp)",
+    "terminal 3' UTR (%d bp)",
+]
+# The order segtools writes the components in, the plots draw the first `spacers` of
+# them as the splicing model and the rest as the translation model
+EXON_COMPONENTS = [FLANK_5P] + SPLICE_COMPONENTS + [FLANK_3P]
+GENE_COMPONENTS = EXON_COMPONENTS + CODING_COMPONENTS
+COMPONENT_IDS = {component: i for i, component in enumerate(GENE_COMPONENTS)}
+
+
+class GeneModel:
+    """
+    The components of the longest transcript of every gene in a GTF, mapped onto the
+    idealized gene model of `segtools-aggregation --mode=gene`. The components are
+    stored as flat arrays sorted by chromosome then start, so a chromosome's are a
+    contiguous slice. Parsing a whole GENCODE GTF takes far longer than aggregating,
+    so the model is built from the GTF's index, which `gtf_index.py` can write once
+    for any number of samples.
+    """
+
+    def __init__(
+        self,
+        chroms: List[str],
+        chrom_ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        component_ids: np.ndarray,
+        reverse: np.ndarray,
+    ) -> None:
+        self.chroms = chroms
+        self.chrom_ids = chrom_ids
+        self.starts = starts
+        self.ends = ends
+        self.component_ids = component_ids
+        self.reverse = reverse
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_index(cls, gtf_index: GtfIndex) -> "GeneModel":
+        """
+        Like `segtools`, a gene's longest transcript is the one spanning the most
+        bases, the first of them on ties, and genes without exons are skipped.
+        """
+        transcripts = gtf_index.features["transcript"]
+        transcript_ids = transcripts["ids"]
+        genes = gtf_index.transcript_genes[transcript_ids]
+        lengths = transcripts["ends"] - transcripts["starts"]
+        order = np.lexsort((transcript_ids, -lengths, genes))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = genes[order][1:] != genes[order][:-1]
+        longest = np.sort(order[first])
+        rows = np.full(len(gtf_index.transcript_ids), -1, dtype=np.int64)
+        rows[transcript_ids[longest]] = longest
+        exons = get_transcript_rows(gtf_index.features["exon"], rows)
+        cdss = get_transcript_rows(gtf_index.features["CDS"], rows)
+        groups = gtf_index.get_groups("transcript")
+        components: List[Tuple[int, int, int, int, bool]] = []
+        for row in longest.tolist():
+            if row not in exons:
+                continue
+            chrom_id, on_reverse = divmod(int(groups[row]), 2)
+            for component, (start, end) in get_gene_components(
+                exons[row], cdss.get(row, []), bool(on_reverse)
+            ):
+                components.append(
+                    (chrom_id, start, end, COMPONENT_IDS[component], bool(on_reverse))
+                )
+        columns = list(zip(*components)) if components else [()] * 5
+        chrom_ids, starts, ends, component_ids, reverse = [
+            np.array(column, dtype=dtype)
+            for column, dtype in zip(
+                columns, [np.uint16, np.int64, np.int64, np.uint8, bool]
+            )
+        ]
+        order = np.lexsort((starts, chrom_ids))
+        return cls(
+            chroms=gtf_index.chroms,
+            chrom_ids=chrom_ids[order],
+            starts=starts[order],
+            ends=ends[order],
+            component_ids=component_ids[order],
+            reverse=reverse[order],
+        )
+
+    def get_chrom_slices(self) -> Dict[str, slice]:
+        boundaries = np.searchsorted(self.chrom_ids, np.arange(len(self.chroms) + 1))
+        return {
+            chrom: slice(boundaries[i], boundaries[i + 1])
+            for i, chrom in enumerate(self.chroms)
+        }
+
+    def get_component_names(self, flank_bases: int) -> List[str]:
+        """
+        Like `segtools`, the names are filled in with the mean length of each
+        component over all genes, truncated, or the flank length for the flanks.
+        """
+        lengths = np.bincount(
+            self.component_ids,
+            weights=self.ends - self.starts,
+            minlength=len(GENE_COMPONENTS),
+        )
+        counts = np.bincount(self.component_ids, minlength=len(GENE_COMPONENTS))
+        names = []
+        for component_id, component in enumerate(GENE_COMPONENTS):
+            if component in (FLANK_5P, FLANK_3P):
+                names.append(component % flank_bases)
+            elif lengths[component_id] > 0:
+                names.append(component % (lengths[component_id] / counts[component_id]))
+            else:
+                names.append(component)
+        return names
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    gene_model = load_gene_model(args.gtf, args.gtf_index)
+    with open_bed(args.bed) as f:
+        segmentation = Segmentation.from_bed(f)
+    counts, num_features = aggregate(segmentation, gene_model, args.flank_bases)
+    names = gene_model.get_component_names(args.flank_bases)
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(os.path.join(args.outdir, FEATURE_AGGREGATION_FILENAME), "w") as f:
+        write_feature_aggregation(segmentation, names, counts, num_features, f)
+
+
+def load_gene_model(gtf: str, gtf_index: Optional[str] = None) -> GeneModel:
+    """
+    A prebuilt GTF index is only used if it was built from this GTF.
+    """
+    if gtf_index is None:
+        index = read_gtf_index(gtf)
+    else:
+        index = GtfIndex.load(gtf_index)
+        if index.digest != get_digest(gtf):
+            raise ValueError(f"GTF index {gtf_index} was not built from {gtf}")
+    return GeneModel.from_index(index)
+
+
+def get_transcript_rows(
+    feature_arrays: Dict[str, np.ndarray], rows: np.ndarray
+) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    The coordinates of the exons or CDSs of each transcript, by the transcript's row
+    in the index. Transcripts with -1 in `rows` are skipped.
+    """
+    feature_rows = rows[feature_arrays["ids"]]
+    index = np.flatnonzero(feature_rows >= 0)
+    index = index[np.argsort(feature_rows[index], kind="stable")]
+    coordinates: Dict[int, List[Tuple[int, int]]] = {}
+    for row, start, end in zip(
+        feature_rows[index].tolist(),
+        feature_arrays["starts"][index].tolist(),
+        feature_arrays["ends"][index].tolist(),
+    ):
+        coordinates.setdefault(row, []).append((start, end))
+    return coordinates
+
+
+def get_gene_components(
+    exons: List[Tuple[int, int]], cdss: List[Tuple[int, int]], reverse: bool
+) -> List[Tuple[str, Tuple[int, int]]]:
+    """
+    Split a transcript into its exons and the introns between them, then if it is
+    coding, into its UTRs and its first and last CDS. Initial and terminal are in the
+    direction of transcription, so they are swapped on the reverse strand.
+    """
+    exons = sorted(exons)
+    cdss = sorted(cdss)
+    introns = [(prev[1], exon[0]) for prev, exon in zip(exons, exons[1:])]
+    if reverse:
+        exons.reverse()
+        introns.reverse()
+        cdss.reverse()
+    components = [(INITIAL_EXON, exons[0])]
+    components += [(SPLICE_COMPONENTS[1], intron) for intron in introns[:1]]
+    components += [(SPLICE_COMPONENTS[2], exon) for exon in exons[1:-1]]
+    components += [(SPLICE_COMPONENTS[3], intron) for intron in introns[1:-1]]
+    components += [(SPLICE_COMPONENTS[5], intron) for intron in introns[-1:]]
+    components.append((TERMINAL_EXON, exons[-1]))
+    if not cdss:
+        return components
+
+    first_cds = cdss[0]
+    last_cds = cdss[-1]
+    utr_5p_exons = []
+    utr_3p_exons = []
+    for start, end in exons:
+        if not reverse and start < first_cds[0]:
+            utr_5p_exons.append((start, min(end, first_cds[0])))
+        elif not reverse and end > last_cds[1]:
+            utr_3p_exons.append((max(start, last_cds[1]), end))
+        elif reverse and end > first_cds[1]:
+            utr_5p_exons.append((max(start, first_cds[1]), end))
+        elif reverse and start < last_cds[0]:
+            utr_3p_exons.append((start, min(end, last_cds[0])))
+    utr_5p_exons = [(start, end) for start, end in utr_5p_exons if start < end]
+    utr_3p_exons = [(start, end) for start, end in utr_3p_exons if start < end]
+    utr_5p_introns = []
+    utr_3p_introns = []
+    for intron in introns:
+        if is_upstream(intron, first_cds, reverse):
+            utr_5p_introns.append(intron)
+        elif is_upstream(last_cds, intron, reverse):
+            utr_3p_introns.append(intron)
+
+    components += [(CODING_COMPONENTS[0], exon) for exon in utr_5p_exons[:1]]
+    components += [(CODING_COMPONENTS[1], intron) for intron in utr_5p_introns]
+    components += [(CODING_COMPONENTS[2], exon) for exon in utr_5p_exons[1:-1]]
+    components += [(CODING_COMPONENTS[3], exon) for exon in utr_5p_exons[-1:]]
+    components.append((CODING_COMPONENTS[4], first_cds))
+    components.append((CODING_COMPONENTS[5], last_cds))
+    components += [(CODING_COMPONENTS[6], exon) for exon in utr_3p_exons[:1]]
+    components += [(CODING_COMPONENTS[7], exon) for exon in utr_3p_exons[1:-1]]
+    components += [(CODING_COMPONENTS[8], intron) for intron in utr_3p_introns]
+    components += [(CODING_COMPONENTS[9], exon) for exon in utr_3p_exons[-1:]]
+    return components
+
+
+def is_upstream(
+    feature: Tuple[int, int], other: Tuple[int, int], reverse: bool
+) -> bool:
+    """
+    Whether `feature` starts 5' of `other`.
+    """
+    return feature[1] > other[1] if reverse else feature[0] < other[0]
+
+
+def get_component_bins(flank_bases: int) -> List[int]:
+    """
+    The number of positions each component is sampled at, in `GENE_COMPONENTS` order.
+    """
+    bins = []
+    for component in GENE_COMPONENTS:
+        if component in (FLANK_5P, FLANK_3P):
+            bins.append(flank_bases)
+        elif "intron" in component:
+            bins.append(INTRON_BINS)
+        else:
+            bins.append(EXON_BINS)
+    return bins
+
+
+def aggregate(
+    segmentation: Segmentation, gene_model: GeneModel, flank_bases: int
+) -> Tuple[List[np.ndarray], int]:
+    """
+    Count the labels found at each sampled position of each gene component, as one
+    (positions, labels) array per component in `GENE_COMPONENTS` order. The positions
+    inside a component are spread evenly across it, and components shorter than that
+    are skipped. The initial exon has the 5' flank and the terminal exon the 3' one.
+
+    Rather than look up the label of each base in turn, all the components of a kind
+    on a chromosome are counted at once: the inner positions with a binary search in
+    the segments, and the flanks by finding the segments overlapping each flank and
+    adding their clipped extents to the counts as a difference array. Also returns the
+    number of components with a label anywhere, which `segtools` reports as the number
+    of features.
+    """
+    num_labels = len(segmentation.labels)
+    bins = get_component_bins(flank_bases)
+    counts = [np.zeros((num_bins, num_labels), dtype=np.int64) for num_bins in bins]
+    chrom_slices = gene_model.get_chrom_slices()
+    num_features = 0
+    for chrom, segments in split_chroms(segmentation).items():
+        if chrom not in chrom_slices:
+            continue
+        chrom_slice = chrom_slices[chrom]
+        starts = gene_model.starts[chrom_slice]
+        ends = gene_model.ends[chrom_slice]
+        component_ids = gene_model.component_ids[chrom_slice]
+        reverse = gene_model.reverse[chrom_slice]
+        counted = np.zeros(len(starts), dtype=bool)
+        for component_id, component in enumerate(GENE_COMPONENTS):
+            index = np.flatnonzero(component_ids == component_id)
+            if len(index) == 0:
+                continue
+            num_bins = bins[component_id]
+            index = index[ends[index] - starts[index] >= num_bins]
+            positions = get_inner_positions(
+                starts[index], ends[index], reverse[index], num_bins
+            )
+            counted[index] |= add_position_counts(
+                counts[component_id], positions, segments, num_labels
+            )
+            index = np.flatnonzero(component_ids == component_id)
+            if component == INITIAL_EXON:
+                flank_starts = np.where(
+                    reverse[index], ends[index], starts[index] - flank_bases
+                )
+                counted[index] |= add_flank_counts(
+                    counts[COMPONENT_IDS[FLANK_5P]],
+                    flank_starts,
+                    reverse[index],
+                    segments,
+                    num_labels,
+                )
+            elif component == TERMINAL_EXON:
+                flank_starts = np.where(
+                    reverse[index], starts[index] - flank_bases, ends[index]
+                )
+                counted[index] |= add_flank_counts(
+                    counts[COMPONENT_IDS[FLANK_3P]],
+                    flank_starts,
+                    reverse[index],
+                    segments,
+                    num_labels,
+                )
+        num_features += int(counted.sum())
+    return counts, num_features
+
+
+def get_inner_positions(
+    starts: np.ndarray, ends: np.ndarray, reverse: np.ndarray, num_bins: int
+) -> np.ndarray:
+    """
+    `num_bins` positions spread evenly across each feature from its 5' end, rounded
+    the same way as `segtools`' `np.linspace` with `endpoint=False`.
+    """
+    steps = (ends - starts) / num_bins
+    positions = np.arange(num_bins) * steps[:, np.newaxis] + starts[:, np.newaxis]
+    positions = np.round(positions).astype(np.int64)
+    positions[reverse] = positions[reverse, ::-1]
+    return positions
+
+
+def add_position_counts(
+    counts: np.ndarray,
+    positions: np.ndarray,
+    segments: ChromSegments,
+    num_labels: int,
+) -> np.ndarray:
+    """
+    Add the label at each of the (features, bins) positions to the (bins, labels)
+    counts. Returns which features had a label at any position.
+    """
+    num_bins = positions.shape[1]
+    labels = label_positions(positions.ravel(), *segments, num_labels)
+    labels = labels.reshape(positions.shape)
+    keys = np.arange(num_bins) * (num_labels + 1) + labels
+    totals = np.bincount(keys.ravel(), minlength=num_bins * (num_labels + 1))
+    counts += totals.reshape(num_bins, num_labels + 1)[:, :num_labels]
+    return (labels != num_labels).any(axis=1)
+
+
+def add_flank_counts(
+    counts: np.ndarray,
+    flank_starts: np.ndarray,
+    reverse: np.ndarray,
+    segments: ChromSegments,
+    num_labels: int,
+) -> np.ndarray:
+    """
+    Add the labels of the flanks starting at `flank_starts` to the (bins, labels)
+    counts, bins running 5' to 3' so backwards on the reverse strand. Each segment
+    overlapping a flank adds one to its label from the first bin it covers and
+    subtracts one after the last, then a cumulative sum over the bins gives the
+    counts. Returns which flanks overlapped any segment.
+    """
+    segment_starts, segment_ends, label_ids = segments
+    num_bins = len(counts)
+    first = np.searchsorted(segment_ends, flank_starts, side="right")
+    last = np.searchsorted(segment_starts, flank_starts + num_bins, side="left")
+    num_overlaps = np.maximum(last - first, 0)
+    flank_index = np.repeat(np.arange(len(flank_starts)), num_overlaps)
+    offsets = np.arange(len(flank_index)) - np.repeat(
+        np.cumsum(num_overlaps) - num_overlaps, num_overlaps
+    )
+    segment_index = first[flank_index] + offsets
+    lows = np.clip(segment_starts[segment_index] - flank_starts[flank_index], 0, None)
+    highs = np.clip(
+        segment_ends[segment_index] - flank_starts[flank_index], None, num_bins
+    )
+    flip = reverse[flank_index]
+    lows, highs = (
+        np.where(flip, num_bins - highs, lows),
+        np.where(flip, num_bins - lows, highs),
+    )
+    keys = label_ids[segment_index].astype(np.int64) * (num_bins + 1)
+    size = num_labels * (num_bins + 1)
+    changes = np.bincount(keys + lows, minlength=size)
+    changes -= np.bincount(keys + highs, minlength=size)
+    changes = changes.reshape(num_labels, num_bins + 1)
+    counts += np.cumsum(changes, axis=1)[:, :num_bins].T
+    covered = np.bincount(
+        flank_index, weights=highs > lows, minlength=len(flank_starts)
+    )
+    return covered > 0
+
+
+def write_feature_aggregation(
+    segmentation: Segmentation,
+    component_names: List[str],
+    counts: List[np.ndarray],
+    num_features: int,
+    file_handle: IO[str],
+) -> None:
+    """
+    Formatted like `segtools`, with a comment line of metadata including the number of
+    bases of each label, and the 5' flank's offsets counting up to 0 at the gene.
+    """
+    label_order = get_label_order(segmentation.labels)
+    labels = [segmentation.labels[label_id] for label_id in label_order]
+    label_bases = np.bincount(
+        segmentation.label_ids,
+        weights=segmentation.ends - segmentation.starts,
+        minlength=len(labels),
+    ).astype(np.int64)
+    metadata = [f"num_features={num_features}", f"spacers={len(EXON_COMPONENTS)}"]
+    metadata += [
+        f"{segmentation.labels[label_id]}={label_bases[label_id]}"
+        for label_id in label_order
+    ]
+    file_handle.write("# " + " ".join(metadata) + "\n")
+    file_handle.write("\t".join(FEATURE_AGGREGATION_FIELDNAMES + labels) + "\n")
+    for component, name, component_counts in zip(
+        GENE_COMPONENTS, component_names, counts
+    ):
+        first_offset = -len(component_counts) if component == FLANK_5P else 0
+        for offset, row in enumerate(component_counts[:, label_order], first_offset):
+            file_handle.write(
+                "\t".join([GROUP, name, str(offset)] + to_strings(row)) + "\n"
+            )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Write the feature_aggregation.tab of segtools-aggregation --mode=gene without the plots"
+    )
+    parser.add_argument("bed", help="path to Segway output BED, optionally gzipped")
+    parser.add_argument("gtf", help="path to gene annotation GTF, optionally gzipped")
+    parser.add_argument(
+        "-o", "--outdir", required=True, help="directory to write the table to"
+    )
+    parser.add_argument(
+        "-f",
+        "--flank-bases",
+        type=int,
+        default=DEFAULT_FLANK_BASES,
+        help="bases around genes to aggregate over",
+    )
+    parser.add_argument(
+        "--gtf-index",
+        help="path to an index of the GTF written by gtf_index.py, to use instead of parsing it",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
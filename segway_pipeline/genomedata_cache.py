@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+from typing import List, Optional, Tuple
+
+BUFFER_SIZE = 1 << 20
+# Bump to invalidate existing entries when the way archives are built changes
+CACHE_KEY_VERSION = 2
+CACHE_SUFFIX = ".genomedata"
+
+
+class GenomedataCache:
+    """
+    Directory of previously built genomedata archives, each named by a digest of the
+    inputs it was built from. Archives are copied in and out rather than linked, so
+    later changes to an output archive can never corrupt the cache. Once the cache
+    grows beyond `max_size` bytes the least recently used archives are evicted.
+    """
+
+    def __init__(self, path: str, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        tracks: List[Tuple[str, str]],
+        chrom_sizes: str,
+        num_processes: int = 1,
+        read_bigwigs: bool = False,
+    ) -> str:
+        """
+        The key covers the contents of the bigWigs and the chrom sizes, and the track
+        names in order, since they determine the archive's track order. It also
+        covers whether the bigWigs were read directly, since going through bedGraph
+        rounds the values. The paths of the files do not matter. Large bigWigs are
+        hashed concurrently.
+        """
+        files = [chrom_sizes] + [file for _, file in tracks]
+        with ThreadPool(num_processes) as pool:
+            digests = pool.map(file_digest, files)
+        inputs = {
+            "version": CACHE_KEY_VERSION,
+            "build_mode": "bigwig" if read_bigwigs else "bedgraph",
+            "chrom_sizes": digests[0],
+            "tracks": [
+                [trackname, digest]
+                for (trackname, _), digest in zip(tracks, digests[1:])
+            ],
+        }
+        return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+    def get(self, key: str, outfile: str) -> bool:
+        """
+        Copy the cached archive to `outfile` if there is one, marking it as recently
+        used. Returns whether it was found.
+        """
+        cached_path = self._get_path(key)
+        if not os.path.exists(cached_path):
+            return False
+        os.utime(cached_path)
+        shutil.copyfile(cached_path, outfile)
+        return True
+
+    def put(self, key: str, outfile: str) -> None:
+        """
+        The archive is copied to a temporary file first then moved into place, so
+        other runs sharing the cache never see a partial archive.
+        """
+        cached_path = self._get_path(key)
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        shutil.copyfile(outfile, temp_path)
+        os.replace(temp_path, cached_path)
+        self._evict(keep=cached_path)
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}{CACHE_SUFFIX}")
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another run sharing the cache
+                pass
+            total_size -= size
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,280 @@
+import argparse
+import hashlib
+import os
+import re
+import struct
+import zipfile
+from typing import IO, Dict, List, Tuple
+
+import numpy as np
+
+from segway_pipeline.bed_io import open_bed
+
+GTF_FIELDNAMES = [
+    "seqname",
+    "source",
+    "feature",
+    "start",
+    "end",
+    "score",
+    "strand",
+    "frame",
+]
+GTF_GENE_ID = re.compile(r'(?:^|;)\s*gene_id "?([^";]*)')
+GTF_TRANSCRIPT_ID = re.compile(r'(?:^|;)\s*transcript_id "?([^";]*)')
+FEATURES = ("gene", "transcript", "exon", "CDS")
+TRANSCRIPT_FEATURES = ("exon", "CDS")
+FEATURE_ARRAYS = ("starts", "ends", "ids", "offsets")
+STRANDS = ("+", "-")
+DIGEST_BLOCK_SIZE = 1 << 20
+# A zip local file header, only the lengths of the name and extra field that follow it
+# are needed to find where the file data starts
+ZIP_LOCAL_HEADER = struct.Struct("<26xHH")
+
+
+class GtfIndex:
+    """
+    The coordinates of the genes, transcripts, exons and CDSs of a GTF as typed arrays,
+    so that the GTF only needs to be parsed once for any number of samples. Each
+    feature type's rows are grouped by chromosome then strand, with `offsets`
+    delimiting the groups, and kept in GTF order within a group. Coordinates are
+    zero-based and half-open, and a transcript spans all of its rows like in
+    `segtools`.
+
+    Genes and transcripts are numbered in the order they first appear. A row's `ids`
+    is the gene of a gene, the transcript of a transcript, exon or CDS, and
+    `transcript_genes` is the gene of each transcript. The index is saved with the
+    digest of the GTF it was built from as an uncompressed .npz, so it can be memory
+    mapped.
+    """
+
+    def __init__(
+        self,
+        digest: str,
+        chroms: List[str],
+        gene_ids: np.ndarray,
+        transcript_ids: np.ndarray,
+        transcript_genes: np.ndarray,
+        features: Dict[str, Dict[str, np.ndarray]],
+    ) -> None:
+        self.digest = digest
+        self.chroms = chroms
+        self.gene_ids = gene_ids
+        self.transcript_ids = transcript_ids
+        self.transcript_genes = transcript_genes
+        self.features = features
+
+    @classmethod
+    def from_gtf(cls, file_handle: IO[str], digest: str) -> "GtfIndex":
+        chroms: Dict[str, int] = {}
+        gene_ids: Dict[str, int] = {}
+        transcript_ids: Dict[str, int] = {}
+        transcript_genes: List[int] = []
+        spans: List[List[int]] = []
+        rows: Dict[str, List[Tuple[int, int, int, int]]] = {
+            feature: [] for feature in FEATURES
+        }
+        for line in file_handle:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t", len(GTF_FIELDNAMES))
+            if fields[0] == "track":
+                continue
+            if len(fields) <= len(GTF_FIELDNAMES):
+                raise ValueError(f"Expected GTF rows with attributes, got: {line}")
+            chrom, _, feature, start, end, _, strand, _, attributes = fields
+            if strand not in STRANDS:
+                raise ValueError(f"Expected a strand for every GTF row, got: {line}")
+            gene_id = GTF_GENE_ID.search(attributes)
+            if gene_id is None:
+                raise ValueError(f"Expected a gene_id, got: {line}")
+            group = 2 * chroms.setdefault(chrom, len(chroms)) + STRANDS.index(strand)
+            gene = gene_ids.setdefault(gene_id.group(1), len(gene_ids))
+            row_start = int(start) - 1
+            row_end = int(end)
+            if feature == "gene":
+                rows[feature].append((group, row_start, row_end, gene))
+                continue
+            transcript_id = GTF_TRANSCRIPT_ID.search(attributes)
+            if transcript_id is None:
+                raise ValueError(f"Expected a transcript_id, got: {line}")
+            transcript = transcript_ids.setdefault(
+                transcript_id.group(1), len(transcript_ids)
+            )
+            if transcript == len(spans):
+                spans.append([group, row_start, row_end])
+                transcript_genes.append(gene)
+            span = spans[transcript]
+            if span[0] != group:
+                raise ValueError(
+                    f"Found transcript {transcript_id.group(1)} on more than one chromosome or strand"
+                )
+            span[1] = min(span[1], row_start)
+            span[2] = max(span[2], row_end)
+            if feature in TRANSCRIPT_FEATURES:
+                rows[feature].append((group, row_start, row_end, transcript))
+        rows["transcript"] = [
+            (group, start, end, transcript)
+            for transcript, (group, start, end) in enumerate(spans)
+        ]
+        return cls(
+            digest=digest,
+            chroms=list(chroms),
+            gene_ids=np.array(list(gene_ids), dtype=str),
+            transcript_ids=np.array(list(transcript_ids), dtype=str),
+            transcript_genes=np.array(transcript_genes, dtype=np.uint32),
+            features={
+                feature: make_feature_arrays(rows[feature], 2 * len(chroms))
+                for feature in FEATURES
+            },
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "GtfIndex":
+        arrays = load_arrays(path)
+        return cls(
+            digest=str(arrays["digest"][0]),
+            chroms=arrays["chroms"].tolist(),
+            gene_ids=arrays["gene_names"],
+            transcript_ids=arrays["transcript_names"],
+            transcript_genes=arrays["transcript_genes"],
+            features={
+                feature: {name: arrays[f"{feature}_{name}"] for name in FEATURE_ARRAYS}
+                for feature in FEATURES
+            },
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Written through a file handle, otherwise NumPy appends .npz to the path. The
+        gene and transcript ids are saved as names, since the feature arrays of genes
+        and transcripts are already `gene_ids` and `transcript_ids`.
+        """
+        arrays = {
+            f"{feature}_{name}": array
+            for feature, feature_arrays in self.features.items()
+            for name, array in feature_arrays.items()
+        }
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                digest=np.array([self.digest], dtype=str),
+                chroms=np.array(self.chroms, dtype=str),
+                gene_names=self.gene_ids,
+                transcript_names=self.transcript_ids,
+                transcript_genes=self.transcript_genes,
+                **arrays,
+            )
+
+    def get(
+        self, feature: str, chrom: str, strand: str
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The starts, ends and ids of the rows of the feature type on the chromosome and
+        strand.
+        """
+        arrays = self.features[feature]
+        if chrom not in self.chroms:
+            return arrays["starts"][:0], arrays["ends"][:0], arrays["ids"][:0]
+        group = 2 * self.chroms.index(chrom) + STRANDS.index(strand)
+        rows = slice(arrays["offsets"][group], arrays["offsets"][group + 1])
+        return arrays["starts"][rows], arrays["ends"][rows], arrays["ids"][rows]
+
+    def get_groups(self, feature: str) -> np.ndarray:
+        """
+        The group of each row of the feature type, twice the chromosome's index plus
+        the strand's.
+        """
+        offsets = self.features[feature]["offsets"]
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    gtf_index = read_gtf_index(args.gtf)
+    gtf_index.save(args.outfile)
+
+
+def read_gtf_index(gtf: str) -> GtfIndex:
+    digest = get_digest(gtf)
+    with open_bed(gtf) as f:
+        return GtfIndex.from_gtf(f, digest)
+
+
+def get_digest(path: str) -> str:
+    """
+    The SHA-256 of the file as is, so a gzipped GTF isn't decompressed.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DIGEST_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_feature_arrays(
+    rows: List[Tuple[int, int, int, int]], num_groups: int
+) -> Dict[str, np.ndarray]:
+    columns = list(zip(*rows)) if rows else [()] * 4
+    groups, starts, ends, ids = [np.array(column, dtype=np.int64) for column in columns]
+    order = np.argsort(groups, kind="stable")
+    return {
+        "starts": starts[order],
+        "ends": ends[order],
+        "ids": ids[order].astype(np.uint32),
+        "offsets": np.searchsorted(groups[order], np.arange(num_groups + 1)),
+    }
+
+
+def load_arrays(path: str) -> Dict[str, np.ndarray]:
+    """
+    Memory map the arrays of an uncompressed .npz, which `np.load` would read into
+    memory instead. Each member of the zip is a .npy file stored as is, so an array's
+    data starts right after the member's local header and its .npy header.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Can't memory map compressed {info.filename}")
+            f.seek(info.header_offset)
+            name_length, extra_length = ZIP_LOCAL_HEADER.unpack(
+                f.read(ZIP_LOCAL_HEADER.size)
+            )
+            f.seek(name_length + extra_length, 1)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+            name = os.path.splitext(info.filename)[0]
+            if np.prod(shape) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Index the gene, transcript, exon and CDS coordinates of a GTF for feature_aggregation.py"
+    )
+    parser.add_argument("gtf", help="path to gene annotation GTF, optionally gzipped")
+    parser.add_argument(
+        "-o", "--outfile", required=True, help="path to write the .npz index to"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
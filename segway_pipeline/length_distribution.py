@@ -0,0 +1,159 @@
+import argparse
+import os
+from collections import defaultdict
+from typing import IO, DefaultDict, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from segway_pipeline.bed_io import open_bed
+from segway_pipeline.segmentation import Segmentation, to_strings
+
+LABEL_ALL = "all"
+LENGTH_DISTRIBUTION_FILENAME = "length_distribution.tab"
+SEGMENT_SIZES_FILENAME = "segment_sizes.tab"
+LENGTH_DISTRIBUTION_FIELDNAMES = ["label", "length"]
+SEGMENT_SIZES_FIELDNAMES = [
+    "label",
+    "num.segs",
+    "mean.len",
+    "median.len",
+    "stdev.len",
+    "num.bp",
+    "frac.bp",
+]
+WRITE_BLOCK_ROWS = 100000
+
+
+class SegmentLengths:
+    """
+    The lengths of the segments of a Segway BED, grouped by chromosome and label. The
+    chromosomes and labels are numbered in the order they first appear, and the
+    lengths of each group are in file order, which is how `segtools` orders them for
+    a sorted BED. Keeping that order means the statistics are summed in the same
+    order too, so they match `segtools` to the last digit.
+    """
+
+    def __init__(self, labels: List[str], groups: Dict[Tuple[int, int], np.ndarray]):
+        self.labels = labels
+        self.groups = groups
+
+    @classmethod
+    def from_bed(cls, file_handle: IO[str]) -> "SegmentLengths":
+        """
+        Stream the BED a block at a time, splitting each block's lengths into their
+        groups with a stable sort, so the whole BED is never held in memory.
+        """
+        labels: List[str] = []
+        chunks: DefaultDict[Tuple[int, int], List[np.ndarray]] = defaultdict(list)
+        for block in Segmentation.iter_bed(file_handle):
+            labels = block.labels
+            lengths = block.ends - block.starts
+            keys = block.chrom_ids.astype(np.int64) * len(labels) + block.label_ids
+            order = np.argsort(keys, kind="stable")
+            boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+            for group in np.split(order, boundaries):
+                key = (int(block.chrom_ids[group[0]]), int(block.label_ids[group[0]]))
+                chunks[key].append(lengths[group])
+        if not chunks:
+            raise ValueError("BED has no segments")
+        groups = {key: np.concatenate(chunks[key]) for key in sorted(chunks)}
+        return cls(labels, groups)
+
+    def get(self, label_id: Optional[int] = None) -> np.ndarray:
+        """
+        The lengths of the segments with the label, chromosome by chromosome, or of
+        all segments, chromosome by chromosome then label by label.
+        """
+        return np.concatenate(
+            [
+                lengths
+                for (_, group_label_id), lengths in self.groups.items()
+                if label_id is None or group_label_id == label_id
+            ]
+        )
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    with open_bed(args.bed) as f:
+        segment_lengths = SegmentLengths.from_bed(f)
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(os.path.join(args.outdir, LENGTH_DISTRIBUTION_FILENAME), "w") as f:
+        write_length_distribution(segment_lengths, f)
+    with open(os.path.join(args.outdir, SEGMENT_SIZES_FILENAME), "w") as f:
+        write_segment_sizes(segment_lengths, f)
+
+
+def write_length_distribution(
+    segment_lengths: SegmentLengths, file_handle: IO[str]
+) -> None:
+    """
+    Every segment's length, label by label in the order they first appear.
+    """
+    file_handle.write("\t".join(LENGTH_DISTRIBUTION_FIELDNAMES) + "\n")
+    for label_id, label in enumerate(segment_lengths.labels):
+        lengths = segment_lengths.get(label_id)
+        for offset in range(0, len(lengths), WRITE_BLOCK_ROWS):
+            block = to_strings(lengths[offset:][:WRITE_BLOCK_ROWS])
+            file_handle.writelines([f"{label}\t{length}\n" for length in block])
+
+
+def write_segment_sizes(segment_lengths: SegmentLengths, file_handle: IO[str]) -> None:
+    """
+    Summary of the lengths of all segments, followed by each label's in order.
+    """
+    all_lengths = segment_lengths.get()
+    total_bp = all_lengths.sum()
+    rows = [get_size_row(LABEL_ALL, all_lengths, total_bp)]
+    for label_id in get_label_order(segment_lengths.labels):
+        label = segment_lengths.labels[label_id]
+        rows.append(get_size_row(label, segment_lengths.get(label_id), total_bp))
+    file_handle.write("\t".join(SEGMENT_SIZES_FIELDNAMES) + "\n")
+    file_handle.writelines(["\t".join(row) + "\n" for row in rows])
+
+
+def get_size_row(label: str, lengths: np.ndarray, total_bp: int) -> List[str]:
+    """
+    Formatted like `segtools`, note the standard deviation is the population one.
+    """
+    num_bp = lengths.sum()
+    return [
+        label,
+        str(len(lengths)),
+        f"{lengths.mean():.3f}",
+        f"{np.median(lengths):.3f}",
+        f"{lengths.std():.3f}",
+        str(num_bp),
+        f"{num_bp / total_bp:.3f}",
+    ]
+
+
+def get_label_order(labels: List[str]) -> List[int]:
+    """
+    Integer labels are sorted numerically, and any others after them by name.
+    """
+
+    def get_key(label_id: int) -> Tuple[int, Union[int, str]]:
+        label = labels[label_id]
+        try:
+            return 0, int(label)
+        except ValueError:
+            return 1, label
+
+    return sorted(range(len(labels)), key=get_key)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Write the length_distribution.tab and segment_sizes.tab of segtools-length-distribution without the plots"
+    )
+    parser.add_argument("bed", help="path to Segway output BED, optionally gzipped")
+    parser.add_argument(
+        "-o", "--outdir", required=True, help="directory to write the tables to"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
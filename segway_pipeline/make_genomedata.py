@@ -1,27 +1,359 @@
 import argparse
+import multiprocessing
+import os
+import shutil
 import subprocess
+import sys
+import tempfile
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from segway_pipeline.chrom_sizes import read_chrom_sizes
+from segway_pipeline.command import measure_children, run_command, write_metrics
+from segway_pipeline.genomedata_cache import GenomedataCache
+
+if TYPE_CHECKING:
+    import tables
+
+BUFFER_SIZE = 1 << 20
+GENOMEDATA_SUFFIX = ".genomedata"
+# Root attributes of a directory mode archive's files that describe the whole archive
+ARCHIVE_ATTRS = ("genomedata_format_version", "tracknames")
+# Rows of the data copied at a time when removing tracks from an archive
+COPY_CHUNK_ROWS = 1 << 20
+# Bases of a bigWig read at a time when reading them directly
+READ_BLOCK_SIZE = 1 << 22
+BYTES_PER_GB = 1024**3
 
 
 def main():
     parser = get_parser()
     args = parser.parse_args()
-    command = make_command(args.files, args.sizes, args.outfile)
-    run_command(command)
+    cache = (
+        GenomedataCache(args.cache_dir, int(args.cache_max_size * BYTES_PER_GB))
+        if args.cache_dir is not None
+        else None
+    )
+    returncode = 1
+    try:
+        with measure_children() as usage:
+            make_genomedata(
+                args.files,
+                args.sizes,
+                args.outfile,
+                args.num_processes,
+                cache,
+                args.existing_archive,
+                args.read_bigwigs,
+            )
+        returncode = 0
+    finally:
+        # Also record failures, e.g. to see how close to the memory limit it got
+        if args.metrics_outfile is not None:
+            write_metrics(usage, args.metrics_outfile, sys.argv, returncode)
+
+
+def make_genomedata(
+    files: List[str],
+    chrom_sizes: str,
+    outfile: str,
+    num_processes: int = 1,
+    cache: Optional[GenomedataCache] = None,
+    existing_archive: Optional[str] = None,
+    read_bigwigs: bool = False,
+) -> None:
+    """
+    With a cache, an archive previously built from the same bigWigs and chrom sizes
+    is reused instead of loading the data again. Given an existing archive, only the
+    tracks it is missing are loaded. Such an archive has its tracks in a different
+    order than `files`, so it is not cached, but an archive cached from `files` is
+    still reused. Reading the bigWigs directly requires loading each chromosome
+    separately, so always uses the process pool.
+    """
+    if cache is not None:
+        key = cache.make_key(
+            get_tracks(files), chrom_sizes, num_processes, read_bigwigs
+        )
+        if cache.get(key, outfile):
+            return
+    if existing_archive is not None:
+        update_genomedata(files, existing_archive, outfile)
+    elif num_processes > 1 or read_bigwigs:
+        make_genomedata_parallel(
+            files, chrom_sizes, outfile, num_processes, read_bigwigs
+        )
+    else:
+        command = make_command(files, chrom_sizes, outfile)
+        run_command(command)
+    if cache is not None and existing_archive is None:
+        cache.put(key, outfile)
 
 
 def make_command(files: List[str], chrom_sizes: str, outfile: str) -> List[str]:
     command = ["genomedata-load", "-s", chrom_sizes, "--sizes"]
-    for file in files:
-        file_basename = Path(file).with_suffix("").name
-        command.extend(["-t", f"{file_basename}={file}"])
+    for trackname, file in get_tracks(files):
+        command.extend(["-t", f"{trackname}={file}"])
     command.append(outfile)
     return command
 
 
-def run_command(command: List[str]):
-    subprocess.run(command)
+def get_tracks(files: List[str]) -> List[Tuple[str, str]]:
+    return [(Path(file).with_suffix("").name, file) for file in files]
+
+
+def update_genomedata(files: List[str], existing_archive: str, outfile: str) -> None:
+    """
+    Copy the existing file mode archive to `outfile`, then remove the tracks that are
+    no longer wanted and load the new ones, so adding one track to a large archive
+    only costs loading that track. Tracks are matched by the names `make_command`
+    gives them, so a changed bigWig needs a new file name to be reloaded. New tracks
+    are appended after the existing ones rather than following the order of `files`.
+    The statistics for every track are recomputed by `genomedata-close-data`.
+    """
+    tracks = get_tracks(files)
+    tracknames = [trackname for trackname, _ in tracks]
+    existing_tracknames = read_tracknames(existing_archive)
+    removed = [name for name in existing_tracknames if name not in tracknames]
+    added = [
+        (trackname, file)
+        for trackname, file in tracks
+        if trackname not in existing_tracknames
+    ]
+    shutil.copyfile(existing_archive, outfile)
+    if removed:
+        remove_tracks(outfile, removed)
+    if added:
+        added_tracknames = list(dict.fromkeys(trackname for trackname, _ in added))
+        run_command(
+            ["genomedata-open-data", outfile, "--tracknames", *added_tracknames]
+        )
+        for trackname, file in added:
+            load_track(None, file, outfile, trackname)
+    if removed or added:
+        run_command(["genomedata-close-data", outfile])
+    if removed:
+        repack(outfile)
+
+
+def read_tracknames(archive: str) -> List[str]:
+    import tables
+
+    with tables.open_file(archive) as h5file:
+        attrs = h5file.root._v_attrs
+        if "tracknames" not in attrs:
+            return []
+        return [trackname.decode() for trackname in attrs.tracknames]
+
+
+def remove_tracks(archive: str, tracknames: List[str]) -> None:
+    """
+    `genomedata-erase-data` only blanks a track, so the track's column is dropped from
+    every supercontig with PyTables instead. The columns of an array cannot be removed
+    in place, so the remaining ones are copied into a new array a block of rows at a
+    time. The chromosomes are marked dirty so `genomedata-close-data` recomputes their
+    statistics.
+    """
+    import tables
+
+    with tables.open_file(archive, "r+") as h5file:
+        attrs = h5file.root._v_attrs
+        keep = [
+            index
+            for index, trackname in enumerate(attrs.tracknames)
+            if trackname.decode() not in tracknames
+        ]
+        for chromosome in h5file.iter_nodes(h5file.root, classname="Group"):
+            for supercontig in h5file.iter_nodes(chromosome, classname="Group"):
+                if "continuous" in supercontig:
+                    remove_columns(supercontig.continuous, keep)
+            chromosome._v_attrs.dirty = True
+        attrs.tracknames = attrs.tracknames[keep]
+
+
+def remove_columns(continuous: "tables.EArray", keep: List[int]) -> None:
+    nrows = continuous.shape[0]
+    kept = continuous._v_file.create_earray(
+        continuous._v_parent,
+        "continuous_kept",
+        continuous.atom,
+        (nrows, 0),
+        filters=continuous.filters,
+        chunkshape=continuous.chunkshape,
+    )
+    # The archive's arrays are extended along the track dimension
+    kept.truncate(len(keep))
+    if keep:
+        for start in range(0, nrows, COPY_CHUNK_ROWS):
+            stop = min(start + COPY_CHUNK_ROWS, nrows)
+            kept[start:stop] = continuous[start:stop][:, keep]
+    continuous.remove()
+    kept.rename("continuous")
+
+
+def repack(archive: str) -> None:
+    """
+    HDF5 does not reuse the space freed by removed tracks, so the archive is repacked
+    the same way `genomedata-load` does.
+    """
+    repacked = f"{archive}.repack"
+    run_command(["h5repack", "-f", "GZIP=1", archive, repacked])
+    os.replace(repacked, archive)
+
+
+def make_genomedata_parallel(
+    files: List[str],
+    chrom_sizes: str,
+    outfile: str,
+    num_processes: int,
+    read_bigwigs: bool = False,
+) -> None:
+    """
+    `genomedata-load` loads every track one after the other into a single HDF5 file.
+    Instead load each chromosome into its own directory mode archive in a process
+    pool, then assemble them into the same single file archive. The largest
+    chromosomes are loaded first to keep the processes evenly busy. The intermediate
+    archives are written next to the output, since the temporary directory may not
+    have enough space.
+    """
+    tracks = get_tracks(files)
+    chroms = read_chrom_sizes(chrom_sizes)
+    largest_first = sorted(chroms, key=lambda chrom: chrom[1], reverse=True)
+    workdir = Path(outfile).resolve().parent
+    with tempfile.TemporaryDirectory(dir=workdir) as tempdir:
+        jobs = [
+            (chrom, size, tracks, tempdir, read_bigwigs)
+            for chrom, size in largest_first
+        ]
+        with multiprocessing.Pool(num_processes) as pool:
+            archives = dict(pool.starmap(load_chromosome, jobs, chunksize=1))
+        assemble_genomedata([archives[chrom] for chrom, _ in chroms], outfile)
+
+
+def load_chromosome(
+    chrom: str,
+    size: int,
+    tracks: List[Tuple[str, str]],
+    workdir: str,
+    read_bigwigs: bool = False,
+) -> Tuple[str, str]:
+    """
+    Runs the same steps as `genomedata-load`, but only for one chromosome, asking
+    `bigWigToBedGraph` for just that chromosome's data, or reading it from the bigWigs
+    directly. Returns the chromosome and the path to its HDF5 file.
+    """
+    archive = os.path.join(workdir, chrom)
+    sizes_path = os.path.join(workdir, f"{chrom}.sizes")
+    with open(sizes_path, "w") as f:
+        f.write(f"{chrom}\t{size}\n")
+    run_command(
+        ["genomedata-load-seq", "--sizes", "--directory-mode", archive, sizes_path]
+    )
+    tracknames = list(dict.fromkeys(trackname for trackname, _ in tracks))
+    run_command(["genomedata-open-data", archive, "--tracknames", *tracknames])
+    chrom_file = os.path.join(archive, f"{chrom}{GENOMEDATA_SUFFIX}")
+    if read_bigwigs:
+        write_tracks(chrom, tracks, chrom_file)
+    else:
+        for trackname, file in tracks:
+            load_track(chrom, file, archive, trackname)
+    run_command(["genomedata-close-data", archive])
+    return chrom, chrom_file
+
+
+def load_track(chrom: Optional[str], file: str, archive: str, trackname: str) -> None:
+    """
+    Stream the chromosome's data from `bigWigToBedGraph` into `genomedata-load-data`,
+    or the whole bigWig's if `chrom` is None. The loader fails on empty input, so it
+    is only started once there is data, as bigWigs often have no data for some
+    chromosomes, e.g. chrY or chrEBV.
+    """
+    read_command = ["bigWigToBedGraph", file, "/dev/stdout"]
+    if chrom is not None:
+        read_command.insert(1, f"-chrom={chrom}")
+    reader = subprocess.Popen(read_command, stdout=subprocess.PIPE)
+    load_command = ["genomedata-load-data", archive, trackname]
+    first_chunk = reader.stdout.read1(BUFFER_SIZE)  # type: ignore
+    if first_chunk:
+        loader = subprocess.Popen(load_command, stdin=subprocess.PIPE, bufsize=0)
+        try:
+            loader.stdin.write(first_chunk)  # type: ignore
+            shutil.copyfileobj(reader.stdout, loader.stdin, BUFFER_SIZE)  # type: ignore
+        except BrokenPipeError:
+            # The loader exited early, its exit status is checked below
+            pass
+        loader.stdin.close()  # type: ignore
+        if loader.wait() != 0:
+            reader.kill()
+            reader.wait()
+            raise subprocess.CalledProcessError(loader.returncode, load_command)
+    reader.stdout.close()  # type: ignore
+    if reader.wait() != 0:
+        raise subprocess.CalledProcessError(reader.returncode, reader.args)
+
+
+def write_tracks(chrom: str, tracks: List[Tuple[str, str]], chrom_file: str) -> None:
+    """
+    Read the chromosome's values from each bigWig with pyBigWig and write them
+    straight into the track's column of the directory mode archive's file, instead of
+    converting them to bedGraph text that `genomedata-load-data` then parses. Values
+    are read a block at a time, as float32 arrays with NaN where there is no data,
+    which is what the archive stores. The values are exact, whereas the bedGraph text
+    only keeps six significant digits.
+    """
+    import pyBigWig
+    import tables
+
+    with tables.open_file(chrom_file, "r+") as h5file:
+        root = h5file.root
+        tracknames = [trackname.decode() for trackname in root._v_attrs.tracknames]
+        supercontigs = list(h5file.iter_nodes(root, classname="Group"))
+        for trackname, file in tracks:
+            col_index = tracknames.index(trackname)
+            bigwig = pyBigWig.open(file)
+            try:
+                chrom_length = bigwig.chroms().get(chrom)
+                if chrom_length is None:
+                    continue
+                for supercontig in supercontigs:
+                    write_supercontig(
+                        bigwig, chrom, chrom_length, supercontig, col_index
+                    )
+            finally:
+                bigwig.close()
+
+
+def write_supercontig(
+    bigwig, chrom: str, chrom_length: int, supercontig: "tables.Group", col_index: int
+) -> None:
+    start = supercontig._v_attrs.start
+    end = min(supercontig._v_attrs.end, chrom_length)
+    continuous = supercontig.continuous
+    for block_start in range(start, end, READ_BLOCK_SIZE):
+        block_end = min(block_start + READ_BLOCK_SIZE, end)
+        rows = slice(block_start - start, block_end - start)
+        continuous[rows, col_index] = bigwig.values(
+            chrom, block_start, block_end, numpy=True
+        )
+
+
+def assemble_genomedata(archives: List[str], outfile: str) -> None:
+    """
+    Each file of a directory mode archive holds a single chromosome in its root group,
+    so it is copied into a group named after the chromosome in the file mode archive.
+    The track names and format version are stored once on the root instead.
+    """
+    import tables
+
+    with tables.open_file(outfile, "w") as out:
+        for archive in archives:
+            chrom = Path(archive).name[: -len(GENOMEDATA_SUFFIX)]
+            with tables.open_file(archive) as chrom_file:
+                root = chrom_file.root
+                group = out.create_group(out.root, chrom)
+                for attr in root._v_attrs._f_list("user"):
+                    target = out.root if attr in ARCHIVE_ATTRS else group
+                    target._v_attrs[attr] = root._v_attrs[attr]
+                root._f_copy_children(group, recursive=True)
 
 
 def get_parser():
@@ -33,6 +365,36 @@ def get_parser():
     parser.add_argument(
         "-o", "--outfile", help="desired name of output file", required=True
     )
+    parser.add_argument(
+        "-p",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="number of chromosomes to load in parallel, by default loads serially with genomedata-load",
+    )
+    parser.add_argument(
+        "--metrics-outfile",
+        help="path to write the wall time, CPU time and peak memory use as JSON",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of previously built archives to reuse when the inputs are the same",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=float,
+        default=100,
+        help="maximum size of the cache in GB, least recently used archives are evicted beyond it",
+    )
+    parser.add_argument(
+        "--existing-archive",
+        help="archive to update instead of building from scratch, only the tracks it is missing are loaded and those not in --files are removed",
+    )
+    parser.add_argument(
+        "--read-bigwigs",
+        action="store_true",
+        help="read the bigWigs directly instead of converting them to bedGraph, loading chromosomes in the process pool even with one process",
+    )
     return parser
 
 
@@ -0,0 +1,283 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import re
+import struct
+import tarfile
+import zlib
+from collections import deque
+from multiprocessing.pool import AsyncResult, ThreadPool
+from typing import IO, Deque, List, Optional, Tuple, cast
+
+BLOCK_SIZE = 1 << 20
+COMPRESS_LEVEL = 6
+# 2019-01-01 00:00Z, matching the --mtime previously passed to tar
+MTIME = 1546300800
+# No file name, zero mtime, Unix OS byte, like `gzip -n`
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03"
+INDEX_SUFFIX = ".index"
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    entries = list_entries(args.directory, args.regex)
+    make_tarball(entries, args.outfile, args.num_threads, args.index_outfile)
+
+
+def list_entries(directory: str, regex: Optional[str] = None) -> List[str]:
+    """
+    The equivalent of `find DIRECTORY [-regex REGEX] | LC_ALL=C sort`: every path in
+    the directory including itself, only those entirely matching `regex` if given,
+    sorted by their bytes so that the order does not depend on the locale.
+    """
+    directory = os.path.normpath(directory)
+    paths = [directory]
+    for dirpath, dirnames, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, name) for name in dirnames + filenames)
+    if regex is not None:
+        pattern = re.compile(regex)
+        paths = [path for path in paths if pattern.fullmatch(path)]
+    return sorted(paths, key=os.fsencode)
+
+
+def make_tarball(
+    entries: List[str],
+    outfile: str,
+    num_threads: int = 1,
+    index_outfile: Optional[str] = None,
+) -> None:
+    """
+    Tar the entries straight into a `ParallelGzipWriter` without an intermediate tar
+    file. Ownership and modification times are normalized so that the archive only
+    depends on the names, contents and permissions of the entries, see
+    https://reproducible-builds.org/docs/archives/ . Optionally also writes a
+    `TarballIndex` of the archive.
+    """
+    ranges = []
+    with open(outfile, "wb") as raw, ParallelGzipWriter(raw, num_threads) as gz:
+        with tarfile.open(
+            fileobj=gz, mode="w|", format=tarfile.GNU_FORMAT  # type: ignore
+        ) as tar:
+            for path in entries:
+                tarinfo = tar.gettarinfo(path)
+                tarinfo.uid = tarinfo.gid = 0
+                tarinfo.uname = tarinfo.gname = ""
+                tarinfo.mtime = MTIME
+                start = tar.offset  # type: ignore
+                if tarinfo.isreg():
+                    with open(path, "rb") as f:
+                        tar.addfile(tarinfo, f)
+                else:
+                    tar.addfile(tarinfo)
+                ranges.append((path, start, tar.offset))  # type: ignore
+    if index_outfile is not None:
+        index = TarballIndex(gz.block_size, gz.member_offsets, ranges)
+        index.to_file(index_outfile)
+
+
+class TarballIndex:
+    """
+    Sidecar index of an archive written by `make_tarball`, giving the range of bytes
+    of each entry in the uncompressed tar stream, headers and padding included, and
+    the offset of each gzip member in the archive. Since every member but the last
+    holds exactly `block_size` bytes of the tar stream, any range of it can be read by
+    only decompressing the members it overlaps.
+    """
+
+    def __init__(
+        self,
+        block_size: int,
+        member_offsets: List[int],
+        entries: List[Tuple[str, int, int]],
+    ) -> None:
+        self.block_size = block_size
+        self.member_offsets = member_offsets
+        self.entries = entries
+
+    @classmethod
+    def from_file(cls, path: str) -> "TarballIndex":
+        with open(path) as f:
+            index = json.load(f)
+        entries = [(name, start, end) for name, start, end in index["entries"]]
+        return cls(index["block_size"], index["member_offsets"], entries)
+
+    def to_file(self, path: str) -> None:
+        index = {
+            "block_size": self.block_size,
+            "member_offsets": self.member_offsets,
+            "entries": self.entries,
+        }
+        with open(path, "w") as f:
+            json.dump(index, f)
+
+    def open(self, fileobj: IO[bytes], start: int, end: int) -> IO[bytes]:
+        """
+        Open bytes `start` to `end` of the uncompressed tar stream from the archive as
+        a file object, which decompresses one member at a time as it is read.
+        """
+        return cast(
+            IO[bytes], io.BufferedReader(TarballRange(self, fileobj, start, end))
+        )
+
+
+class TarballRange(io.RawIOBase):
+    """
+    Readable range of the uncompressed tar stream of an indexed archive, holding at
+    most one decompressed gzip member in memory however long the range is. Seeks
+    `fileobj` itself before reading each member, so several ranges can share it as
+    long as they are read one after the other.
+    """
+
+    def __init__(
+        self, index: TarballIndex, fileobj: IO[bytes], start: int, end: int
+    ) -> None:
+        super().__init__()
+        self.index = index
+        self.fileobj = fileobj
+        self._member = start // index.block_size
+        self._skip = start - self._member * index.block_size
+        self._remaining = end - start
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buffer:
+            if self._remaining <= 0:
+                return 0
+            offsets = self.index.member_offsets
+            self.fileobj.seek(offsets[self._member])
+            member = self.fileobj.read(
+                offsets[self._member + 1] - offsets[self._member]
+            )
+            data = memoryview(gzip.decompress(member))
+            self._buffer = data[slice(self._skip, self._skip + self._remaining)]
+            self._member += 1
+            self._skip = 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._remaining -= size
+        return size
+
+
+class ParallelGzipWriter:
+    """
+    Writable file object that gzips its input as a series of independent gzip members
+    of `block_size` bytes each, like `pigz --independent`. The members are compressed
+    in a thread pool, since zlib releases the GIL. Since the blocks only depend on the
+    data, the output is the same whatever the number of threads. Any gzip reader,
+    including `gzip`, `tar` and Python's `gzip` module, reads the concatenated members
+    as one stream.
+    """
+
+    def __init__(
+        self,
+        fileobj: IO[bytes],
+        num_threads: int = 1,
+        block_size: int = BLOCK_SIZE,
+        compresslevel: int = COMPRESS_LEVEL,
+    ) -> None:
+        if num_threads < 1:
+            raise ValueError("Must use at least one thread")
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        self._buffer = bytearray()
+        self._num_members = 0
+        # Where each member starts, followed by the end of the last one
+        self.member_offsets = [0]
+        self._max_pending = 2 * num_threads
+        self._pending: Deque[AsyncResult] = deque()
+        self._pool = ThreadPool(num_threads)
+
+    def __enter__(self) -> "ParallelGzipWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.terminate()
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def close(self) -> None:
+        """
+        Compress what is left of the input, always writing at least one member so that
+        empty input still gives a valid gzip file. Does not close `fileobj`.
+        """
+        if self._buffer or self._num_members == 0:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_member(self._pending.popleft().get())
+        self._pool.close()
+        self._pool.join()
+
+    def _submit(self, block: bytes) -> None:
+        """
+        Only a couple of blocks per thread are kept in flight, so that memory use stays
+        bounded when the input is written faster than it can be compressed.
+        """
+        self._pending.append(
+            self._pool.apply_async(compress_member, (block, self.compresslevel))
+        )
+        self._num_members += 1
+        while len(self._pending) > self._max_pending:
+            self._write_member(self._pending.popleft().get())
+
+    def _write_member(self, member: bytes) -> None:
+        self.fileobj.write(member)
+        self.member_offsets.append(self.member_offsets[-1] + len(member))
+
+
+def compress_member(data: bytes, compresslevel: int = COMPRESS_LEVEL) -> bytes:
+    """
+    Builds the gzip member by hand, since `gzip.compress` only takes an mtime from
+    Python 3.8 on.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    trailer = struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF)
+    return GZIP_HEADER + body + trailer
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Reproducibly tar and gzip a directory, compressing in parallel"
+    )
+    parser.add_argument("directory", help="directory to archive")
+    parser.add_argument(
+        "-o", "--outfile", required=True, help="path to the output .tar.gz"
+    )
+    parser.add_argument(
+        "--regex",
+        help="only archive paths entirely matching this regular expression, like find -regex",
+    )
+    parser.add_argument(
+        "-p",
+        "--num-threads",
+        type=int,
+        default=1,
+        help="number of threads to compress with",
+    )
+    parser.add_argument(
+        "--index-outfile",
+        help=f"path to write an index of the archive to for extract_tarball.py, usually the archive's path with {INDEX_SUFFIX} appended",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
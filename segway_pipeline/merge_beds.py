@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+from typing import IO, Dict, List, Optional, Tuple
+
+from segway_pipeline.bed_io import open_bed
+
+# Lines that are not features
+HEADER_PREFIXES = ("browser", "track", "#")
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open_bed(args.output_filename, "w") as output_file_handle:
+        merge_beds(args.beds, output_file_handle)
+
+
+def merge_beds(
+    beds: List[str], output_file_handle: IO[str], tempdir: Optional[str] = None
+) -> None:
+    """
+    Merge the BEDs of the annotation shards in the order `LC_ALL=C sort -k1,1 -k2,2n`
+    gives, which is the order `segway annotate` writes the whole genome in and the
+    order `bedToBigBed` requires, whatever chromosomes went to which shard. Header
+    lines are dropped. Each chromosome's features are first spilled to their own
+    temporary file, so only one chromosome's are held in memory at a time.
+    """
+    with tempfile.TemporaryDirectory(dir=tempdir) as spill_dir:
+        spills: Dict[str, IO[str]] = {}
+        try:
+            for bed in beds:
+                with open_bed(bed) as f:
+                    for line in f:
+                        if line.startswith(HEADER_PREFIXES) or not line.strip():
+                            continue
+                        if not line.endswith("\n"):
+                            line += "\n"
+                        chrom = line.split("\t", 1)[0]
+                        if chrom not in spills:
+                            path = os.path.join(spill_dir, str(len(spills)))
+                            spills[chrom] = open(path, "w+")
+                        spills[chrom].write(line)
+            for chrom in sorted(spills, key=str.encode):
+                spill = spills[chrom]
+                spill.seek(0)
+                lines = spill.readlines()
+                lines.sort(key=get_sort_key)
+                output_file_handle.writelines(lines)
+        finally:
+            for spill in spills.values():
+                spill.close()
+
+
+def get_sort_key(line: str) -> Tuple[int, str]:
+    """
+    Like `sort`, lines with the same start are ordered by the whole line.
+    """
+    return int(line.split("\t", 2)[1]), line
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Merge the BEDs of annotation shards into one sorted BED"
+    )
+    parser.add_argument(
+        "beds", nargs="+", help="paths to the shards' BED files, optionally gzipped"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="path to output BED file, will be gzipped if it ends with .gz",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, closing
+from functools import partial
+from itertools import groupby
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+
+from segway_pipeline.bed_io import map_blocks, open_bed, read_blocks
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS, Colors, get_color
+from segway_pipeline.relabel import parse_mnemonics
+
+# Characters copied at a time from a chromosome's spilled rows to the output
+BUFFER_SIZE = 1 << 20
+
+
+class ChromosomeSpill:
+    """
+    Spills the processed rows for a single chromosome to temporary files, so only one
+    chromosome is ever held in memory, and only if it needs sorting. Segway emits each
+    chromosome in order of start, so its rows are copied to the output as they are
+    unless we actually see one out of order.
+    """
+
+    def __init__(self, path: str, relabeled: bool = True) -> None:
+        self.recolored = open(f"{path}.recolored", "w+")
+        self.relabeled = open(f"{path}.relabeled", "w+") if relabeled else None
+        self.is_sorted = True
+        self._last_start = -1
+
+    def add(self, relabeled: str, recolored: str, starts: List[int]) -> None:
+        if self.is_sorted:
+            for start in starts:
+                if start < self._last_start:
+                    self.is_sorted = False
+                    break
+                self._last_start = start
+        self.recolored.write(recolored)
+        if self.relabeled is not None:
+            self.relabeled.write(relabeled)
+
+    def write(
+        self, output_file_handle: IO[str], relabeled_file_handle: Optional[IO[str]]
+    ) -> None:
+        spills = [(self.recolored, output_file_handle)]
+        if self.relabeled is not None and relabeled_file_handle is not None:
+            spills.append((self.relabeled, relabeled_file_handle))
+        order = None
+        for spill, file_handle in spills:
+            spill.seek(0)
+            if self.is_sorted:
+                shutil.copyfileobj(spill, file_handle, BUFFER_SIZE)
+                continue
+            lines = spill.readlines()
+            if order is None:
+                order = sorted(
+                    range(len(lines)), key=lambda i: int(lines[i].split("\t", 2)[1])
+                )
+            file_handle.writelines(lines[i] for i in order)
+
+    def close(self) -> None:
+        self.recolored.close()
+        if self.relabeled is not None:
+            self.relabeled.close()
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open_bed(args.bed) as bed_file_handle, open(
+        args.mnemonics
+    ) as mnemonics_file_handle, open_bed(
+        args.output_filename, "w"
+    ) as output_file_handle, ExitStack() as stack:
+        relabeled_file_handle = None
+        if args.relabeled_output_filename is not None:
+            relabeled_file_handle = stack.enter_context(
+                open_bed(args.relabeled_output_filename, "w")
+            )
+        postprocess_bed(
+            bed_file_handle,
+            mnemonics_file_handle,
+            output_file_handle,
+            relabeled_file_handle=relabeled_file_handle,
+            num_processes=args.num_processes,
+        )
+
+
+def postprocess_bed(
+    bed_file_handle: IO[str],
+    mnemonics_file_handle: IO[str],
+    output_file_handle: IO[str],
+    relabeled_file_handle: Optional[IO[str]] = None,
+    labels_to_colors: Dict[str, Colors] = LABELS_TO_COLORS,
+    num_processes: int = 1,
+    tempdir: Optional[str] = None,
+) -> None:
+    """
+    Relabels and recolors the Segway BED in a single pass over the input, then writes
+    it sorted by chromosome and start, ready for `bedToBigBed`. The relabeled but not
+    recolored BED can optionally be written at the same time. Blocks of lines can be
+    processed in parallel, they are collected in input order so the output does not
+    depend on the number of processes. Like `merge_beds.py`, each chromosome's rows
+    are first spilled to their own temporary files.
+    """
+    mnemonics = parse_mnemonics(mnemonics_file_handle)
+    label_columns = make_label_columns(mnemonics, labels_to_colors)
+    process = partial(process_block, label_columns=label_columns)
+    with tempfile.TemporaryDirectory(dir=tempdir) as spill_dir, ExitStack() as stack:
+        chromosomes: Dict[str, ChromosomeSpill] = {}
+        for chrom_blocks in map_blocks(
+            process, read_blocks(bed_file_handle), num_processes=num_processes
+        ):
+            for chrom, relabeled, recolored, starts in chrom_blocks:
+                if chrom not in chromosomes:
+                    path = os.path.join(spill_dir, str(len(chromosomes)))
+                    spill = ChromosomeSpill(path, relabeled_file_handle is not None)
+                    chromosomes[chrom] = stack.enter_context(closing(spill))
+                chromosomes[chrom].add(relabeled, recolored, starts)
+        for chrom in sorted(chromosomes):
+            chromosomes[chrom].write(output_file_handle, relabeled_file_handle)
+
+
+def make_label_columns(
+    mnemonics: Dict[str, str], labels_to_colors: Dict[str, Colors]
+) -> Dict[str, Tuple[str, str]]:
+    """
+    Compute the new label and color columns once for each of the Segway labels.
+    """
+    label_columns = {}
+    for old, new in mnemonics.items():
+        label = f"{old}_{new}"
+        color = get_color(label, labels_to_colors)
+        label_columns[old] = (label, color)
+    return label_columns
+
+
+def process_block(
+    lines: List[str], label_columns: Dict[str, Tuple[str, str]]
+) -> List[Tuple[str, str, str, List[int]]]:
+    """
+    Split the block into runs of the same chromosome, returning the chromosome, the
+    joined relabeled and recolored lines, and the starts for each run.
+    """
+    chrom_blocks = []
+    for chrom, chrom_lines in groupby(lines, key=get_chrom):
+        relabeled, recolored, starts = process_lines(chrom_lines, label_columns)
+        chrom_blocks.append((chrom, "".join(relabeled), "".join(recolored), starts))
+    return chrom_blocks
+
+
+def process_lines(
+    lines: Iterable[str], label_columns: Dict[str, Tuple[str, str]]
+) -> Tuple[List[str], List[str], List[int]]:
+    relabeled = []
+    recolored = []
+    starts = []
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        label, color = label_columns[fields[3]]
+        fields[3] = label
+        relabeled.append("\t".join(fields) + "\n")
+        fields[-1] = color
+        recolored.append("\t".join(fields) + "\n")
+        starts.append(int(fields[1]))
+    return relabeled, recolored, starts
+
+
+def get_chrom(line: str) -> str:
+    return line[: line.index("\t")]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bed", help="path to Segway BED file, optionally gzipped")
+    parser.add_argument("mnemonics")
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="path to relabeled and recolored output BED, gzipped if it ends with .gz",
+    )
+    parser.add_argument(
+        "--relabeled-output-filename",
+        help="path to optionally write the relabeled BED, gzipped if it ends with .gz",
+    )
+    parser.add_argument(
+        "-p",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="number of processes to use for relabeling and recoloring",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
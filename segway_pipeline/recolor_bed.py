@@ -1,7 +1,10 @@
 import argparse
-import csv
 from enum import Enum
-from typing import IO, Dict, List
+from functools import partial
+from typing import IO, Dict, List, Optional
+
+from segway_pipeline.bed_io import map_blocks, open_bed, read_blocks
+from segway_pipeline.segmentation import Segmentation
 
 
 class Rgb:
@@ -16,6 +19,18 @@ class Rgb:
     def __str__(self) -> str:
         return f"{self.red},{self.green},{self.blue}"
 
+    def __eq__(self, other: object) -> bool:
+        """
+        Needed to look up `Colors` by value, which is how enum members are unpickled
+        when they are sent to worker processes.
+        """
+        if not isinstance(other, Rgb):
+            return NotImplemented
+        return (self.red, self.green, self.blue) == (other.red, other.green, other.blue)
+
+    def __hash__(self) -> int:
+        return hash((self.red, self.green, self.blue))
+
 
 class Colors(Enum):
     """
@@ -54,39 +69,118 @@ LABELS_TO_COLORS = {
 }
 
 
+class ColorColumns(Dict[str, str]):
+    """
+    Memoized table from a full BED label, e.g. `0_Promoter`, to the rendered color
+    column that ends the row. A Segway run only has a few dozen distinct labels, so
+    the color lookup and formatting only happens the first time each one is seen.
+    """
+
+    def __init__(self, labels_to_colors: Dict[str, Colors]) -> None:
+        super().__init__()
+        self.labels_to_colors = labels_to_colors
+
+    def __missing__(self, label: str) -> str:
+        column = f"\t{get_color(label, self.labels_to_colors)}\n"
+        self[label] = column
+        return column
+
+
 def main() -> None:
     parser = get_parser()
     args = parser.parse_args()
-    with open(args.bed) as input_file_handle, open(
-        args.output_filename, "w", newline=""
+    with open_bed(args.bed) as input_file_handle, open_bed(
+        args.output_filename, "w"
     ) as output_file_handle:
-        recolor_bed(input_file_handle, output_file_handle)
+        if args.in_memory:
+            segmentation = Segmentation.from_bed(input_file_handle)
+            recolor_segmentation(segmentation)
+            segmentation.to_bed(output_file_handle)
+        else:
+            recolor_bed(
+                input_file_handle,
+                output_file_handle,
+                num_processes=args.num_processes,
+            )
 
 
 def recolor_bed(
     input_file_handle: IO[str],
     output_file_handle: IO[str],
     labels_to_colors: Dict[str, Colors] = LABELS_TO_COLORS,
+    num_processes: int = 1,
 ) -> None:
-    input_reader = csv.reader(input_file_handle, delimiter="\t", lineterminator="\n")
-    output_writer = csv.writer(
-        output_file_handle, delimiter="\t", lineterminator="\n", quotechar="'"
-    )
-    for row in input_reader:
-        processed = process_row(row, labels_to_colors=labels_to_colors)
-        output_writer.writerow(processed)
+    """
+    Streams the BED through in blocks of lines, which can be recolored in parallel.
+    Each process fills its own copy of the color column table.
+    """
+    color_columns = ColorColumns(labels_to_colors)
+    recolor_lines = partial(recolor_block, color_columns=color_columns)
+    for text in map_blocks(
+        recolor_lines, read_blocks(input_file_handle), num_processes=num_processes
+    ):
+        output_file_handle.write(text)
 
 
-def process_row(row: List[str], labels_to_colors: Dict[str, Colors]) -> List[str]:
-    label = row[3]
-    row[-1] = str(labels_to_colors[label.split("_")[-1]].value)
+def recolor_block(lines: List[str], color_columns: ColorColumns) -> str:
+    return "".join([recolor_line(line, color_columns) for line in lines])
+
+
+def recolor_segmentation(
+    segmentation: Segmentation,
+    labels_to_colors: Dict[str, Colors] = LABELS_TO_COLORS,
+) -> None:
+    segmentation.color_by_label(lambda label: get_color(label, labels_to_colors))
+
+
+def recolor_line(line: str, color_columns: ColorColumns) -> str:
+    """
+    Swap out the last column of the row for the precomputed color column.
+    """
+    label = line.split("\t", 4)[3]
+    return line[: line.rindex("\t")] + color_columns[label]
+
+
+def process_row(
+    row: List[str],
+    labels_to_colors: Dict[str, Colors],
+    color_columns: Optional[ColorColumns] = None,
+) -> List[str]:
+    """
+    Recolor a row already split into columns. Pass a `ColorColumns` to share its
+    memoized colors across rows.
+    """
+    if color_columns is None:
+        color_columns = ColorColumns(labels_to_colors)
+    row[-1] = color_columns[row[3]].strip()
     return row
 
 
+def get_color(label: str, labels_to_colors: Dict[str, Colors]) -> str:
+    return str(labels_to_colors[label.split("_")[-1]].value)
+
+
 def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
-    parser.add_argument("bed")
-    parser.add_argument("-o", "--output-filename", required=True)
+    parser.add_argument("bed", help="path to BED file, optionally gzipped")
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="path to output BED file, will be gzipped if it ends with .gz",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="load the whole BED into a columnar representation instead of streaming",
+    )
+    parser.add_argument(
+        "-p",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="number of processes to use for recoloring when streaming",
+    )
     return parser
 
 
@@ -1,32 +1,55 @@
 import argparse
 import csv
-from typing import IO, Dict, List
+from functools import partial
+from typing import IO, Dict, List, Optional
+
+from segway_pipeline.bed_io import map_blocks, open_bed, read_blocks
+from segway_pipeline.segmentation import Segmentation
 
 
 def main() -> None:
     parser = get_parser()
     args = parser.parse_args()
-    with open(args.bed) as bed_file_handle, open(
+    with open_bed(args.bed) as bed_file_handle, open(
         args.mnemonics
-    ) as mnemonics_file_handle, open(
-        args.output_filename, "w", newline=""
+    ) as mnemonics_file_handle, open_bed(
+        args.output_filename, "w"
     ) as output_file_handle:
-        relabel(bed_file_handle, mnemonics_file_handle, output_file_handle)
+        if args.in_memory:
+            segmentation = Segmentation.from_bed(bed_file_handle)
+            relabel_segmentation(segmentation, parse_mnemonics(mnemonics_file_handle))
+            segmentation.to_bed(output_file_handle)
+        else:
+            relabel(
+                bed_file_handle,
+                mnemonics_file_handle,
+                output_file_handle,
+                num_processes=args.num_processes,
+            )
 
 
 def relabel(
     bed_file_handle: IO[str],
     mnemonics_file_handle: IO[str],
     output_file_handle: IO[str],
+    num_processes: int = 1,
 ) -> None:
+    """
+    Streams the BED through in blocks of lines, which can be relabeled in parallel.
+    The new label for each of the handful of distinct labels is computed once up
+    front, so each row only needs a split, a dict lookup and a join.
+    """
     mnemonics = parse_mnemonics(mnemonics_file_handle)
-    input_reader = csv.reader(bed_file_handle, delimiter="\t", lineterminator="\n")
-    output_writer = csv.writer(
-        output_file_handle, delimiter="\t", lineterminator="\n", quotechar="'"
-    )
-    for row in input_reader:
-        processed = process_row(row, mnemonics)
-        output_writer.writerow(processed)
+    new_labels = make_new_labels(mnemonics)
+    relabel_lines = partial(relabel_block, new_labels=new_labels)
+    for text in map_blocks(
+        relabel_lines, read_blocks(bed_file_handle), num_processes=num_processes
+    ):
+        output_file_handle.write(text)
+
+
+def relabel_segmentation(segmentation: Segmentation, mnemonics: Dict[str, str]) -> None:
+    segmentation.map_labels(lambda label: f"{label}_{mnemonics[label]}")
 
 
 def parse_mnemonics(mnemonics_file_handle: IO[str]) -> Dict[str, str]:
@@ -39,17 +62,57 @@ def parse_mnemonics(mnemonics_file_handle: IO[str]) -> Dict[str, str]:
     return mnemonics
 
 
-def process_row(row: List[str], mnemonics: Dict[str, str]) -> List[str]:
-    label = row[3]
-    row[3] = "{}_{}".format(label, mnemonics[label])
+def make_new_labels(mnemonics: Dict[str, str]) -> Dict[str, str]:
+    return {old: f"{old}_{new}" for old, new in mnemonics.items()}
+
+
+def relabel_block(lines: List[str], new_labels: Dict[str, str]) -> str:
+    return "".join([relabel_line(line, new_labels) for line in lines])
+
+
+def relabel_line(line: str, new_labels: Dict[str, str]) -> str:
+    fields = line.rstrip("\n").split("\t", 4)
+    fields[3] = new_labels[fields[3]]
+    return "\t".join(fields) + "\n"
+
+
+def process_row(
+    row: List[str],
+    mnemonics: Dict[str, str],
+    new_labels: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """
+    Relabel a row already split into columns. Pass the table from `make_new_labels`
+    to avoid rebuilding it for every row.
+    """
+    if new_labels is None:
+        new_labels = make_new_labels(mnemonics)
+    row[3] = new_labels[row[3]]
     return row
 
 
 def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
-    parser.add_argument("bed")
+    parser.add_argument("bed", help="path to BED file, optionally gzipped")
     parser.add_argument("mnemonics")
-    parser.add_argument("-o", "--output-filename", required=True)
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="path to output BED file, will be gzipped if it ends with .gz",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="load the whole BED into a columnar representation instead of streaming",
+    )
+    parser.add_argument(
+        "-p",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="number of processes to use for relabeling when streaming",
+    )
     return parser
 
 
@@ -0,0 +1,257 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from segway_pipeline.command import ResourceUsage, measure_children, run_command
+
+# What the shell reports when a command can't be found or run
+COMMAND_NOT_FOUND_RETURNCODE = 127
+# Scripts are installed next to this one, both in the repo and in the Docker image
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SegtoolsTool:
+    """
+    One segtools command. Tools that are allowed to fail don't fail the run when they
+    do, they just don't produce their outputs.
+    """
+
+    def __init__(self, name: str, command: List[str], allow_failure: bool = False):
+        self.name = name
+        self.command = command
+        self.allow_failure = allow_failure
+
+
+class ToolResult:
+    def __init__(
+        self, tool: SegtoolsTool, returncode: int, usage: ResourceUsage
+    ) -> None:
+        self.tool = tool
+        self.returncode = returncode
+        self.usage = usage
+
+    @property
+    def failed(self) -> bool:
+        return self.returncode != 0 and not self.tool.allow_failure
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "name": self.tool.name,
+            "command": self.tool.command,
+            "returncode": self.returncode,
+            "allow_failure": self.tool.allow_failure,
+        }
+        result.update(self.usage.to_dict())
+        return result
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    tools = get_tools(
+        args.bed,
+        args.genomedata,
+        args.annotation_gtf,
+        args.params,
+        args.flank_bases,
+        args.tables_only,
+        args.signal_distribution_processes,
+        args.annotation_gtf_index,
+    )
+    results = run_segtools(tools, args.num_processes)
+    for result in results:
+        print(
+            f"{result.tool.name} exited with status {result.returncode} after "
+            f"{result.usage.wall_seconds:.1f} seconds",
+            file=sys.stderr,
+        )
+    if args.metrics_outfile is not None:
+        with open(args.metrics_outfile, "w") as f:
+            f.write(json.dumps([result.to_dict() for result in results], indent=4))
+    failed = [result.tool.name for result in results if result.failed]
+    if failed:
+        sys.exit(f"Segtools commands failed: {', '.join(failed)}")
+
+
+def get_tools(
+    bed: str,
+    genomedata: str,
+    annotation_gtf: str,
+    params: str,
+    flank_bases: int,
+    tables_only: bool = False,
+    signal_distribution_processes: int = 1,
+    annotation_gtf_index: Optional[str] = None,
+) -> List[SegtoolsTool]:
+    """
+    With `tables_only`, tools with a native equivalent in this package that skips the
+    plots are replaced by it. The native signal distribution does not fail
+    spuriously, so unlike segtools' it must succeed, and the native feature
+    aggregation reads the GTF's prebuilt index if there is one.
+    """
+    if tables_only:
+        gtf_index_args = []
+        if annotation_gtf_index is not None:
+            gtf_index_args = ["--gtf-index", annotation_gtf_index]
+        return [
+            SegtoolsTool(
+                "length_distribution",
+                get_script_command("length_distribution.py")
+                + ["-o", "length_distribution", bed],
+            ),
+            get_gmtk_parameters_tool(params),
+            SegtoolsTool(
+                "feature_aggregation",
+                get_script_command("feature_aggregation.py")
+                + [f"--flank-bases={flank_bases}"]
+                + gtf_index_args
+                + ["-o", "feature_aggregation", bed, annotation_gtf],
+            ),
+            SegtoolsTool(
+                "signal_distribution",
+                get_script_command("signal_distribution.py")
+                + [
+                    "--transformation",
+                    "arcsinh",
+                    "--num-processes",
+                    str(signal_distribution_processes),
+                    "-o",
+                    "signal_distribution",
+                    bed,
+                    genomedata,
+                ],
+            ),
+        ]
+    return [
+        SegtoolsTool(
+            "length_distribution",
+            ["segtools-length-distribution", "-o", "length_distribution", bed],
+        ),
+        get_gmtk_parameters_tool(params),
+        get_feature_aggregation_tool(bed, annotation_gtf, flank_bases),
+        # TODO: undo temporary env fix once segtools is patched. Use conda run to avoid
+        # bashrc wackiness. It sometimes fails for no good reason, so is allowed to.
+        SegtoolsTool(
+            "signal_distribution",
+            [
+                "conda",
+                "run",
+                "-n",
+                "segtools-signal-distribution",
+                "segtools-signal-distribution",
+                "--transformation",
+                "arcsinh",
+                "-o",
+                "signal_distribution",
+                bed,
+                genomedata,
+            ],
+            allow_failure=True,
+        ),
+    ]
+
+
+def get_gmtk_parameters_tool(params: str) -> SegtoolsTool:
+    return SegtoolsTool(
+        "gmtk_parameters",
+        ["segtools-gmtk-parameters", "-o", "gmtk_parameters", params],
+    )
+
+
+def get_feature_aggregation_tool(
+    bed: str, annotation_gtf: str, flank_bases: int
+) -> SegtoolsTool:
+    return SegtoolsTool(
+        "feature_aggregation",
+        [
+            "segtools-aggregation",
+            "--normalize",
+            "-o",
+            "feature_aggregation",
+            "--mode=gene",
+            f"--flank-bases={flank_bases}",
+            bed,
+            annotation_gtf,
+        ],
+    )
+
+
+def get_script_command(script: str) -> List[str]:
+    return [sys.executable, os.path.join(SCRIPT_DIR, script)]
+
+
+def run_segtools(
+    tools: List[SegtoolsTool], num_processes: Optional[int] = None
+) -> List[ToolResult]:
+    """
+    The tools are independent, so run them all at once, by default each in its own
+    process. Every worker only runs one tool, so the resource usage it measures is for
+    that tool alone. Results are in the same order as the tools.
+    """
+    with multiprocessing.Pool(num_processes or len(tools), maxtasksperchild=1) as pool:
+        return pool.map(run_tool, tools, chunksize=1)
+
+
+def run_tool(tool: SegtoolsTool) -> ToolResult:
+    returncode = 0
+    with measure_children() as usage:
+        try:
+            run_command(tool.command)
+        except subprocess.CalledProcessError as e:
+            returncode = e.returncode
+        except OSError:
+            returncode = COMMAND_NOT_FOUND_RETURNCODE
+    return ToolResult(tool, returncode, usage)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run the segtools commands on a Segway annotation concurrently"
+    )
+    parser.add_argument("--bed", required=True, help="path to Segway output BED")
+    parser.add_argument("--genomedata", required=True, help="path to genomedata")
+    parser.add_argument(
+        "--annotation-gtf", required=True, help="path to gene annotation GTF"
+    )
+    parser.add_argument(
+        "--annotation-gtf-index",
+        help="path to the annotation GTF's index from gtf_index.py, only used with --tables-only",
+    )
+    parser.add_argument(
+        "--params", required=True, help="path to the trained params.params"
+    )
+    parser.add_argument(
+        "--flank-bases",
+        type=int,
+        required=True,
+        help="bases around genes to aggregate over",
+    )
+    parser.add_argument(
+        "--tables-only",
+        action="store_true",
+        help="only write the tables where possible, skipping the plots",
+    )
+    parser.add_argument(
+        "--signal-distribution-processes",
+        type=int,
+        default=1,
+        help="number of chromosomes the native signal distribution processes at once",
+    )
+    parser.add_argument(
+        "--num-processes",
+        type=int,
+        help="number of commands to run at once, by default all of them",
+    )
+    parser.add_argument(
+        "--metrics-outfile",
+        help="path to write each command's exit status and resource usage to as JSON",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import warnings
+from typing import IO, Callable, Dict, Iterator, List
+
+import numpy as np
+
+from segway_pipeline.bed_io import read_blocks
+
+NUM_COLUMNS = 9
+WRITE_BLOCK_ROWS = 100000
+
+
+class Segmentation:
+    """
+    Columnar in-memory representation of a Segway BED. Coordinates are stored as NumPy
+    arrays, and the repetitive string columns (chromosome, label, strand and color)
+    are interned, so each row holds a small integer index into a table of distinct
+    values. Relabeling and recoloring then only touch the tables or remap the index
+    columns, rather than doing any per-row string work. Only BED9 as written by Segway
+    is supported.
+    """
+
+    def __init__(
+        self,
+        chroms: List[str],
+        chrom_ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        labels: List[str],
+        label_ids: np.ndarray,
+        scores: np.ndarray,
+        strands: List[str],
+        strand_ids: np.ndarray,
+        thick_starts: np.ndarray,
+        thick_ends: np.ndarray,
+        colors: List[str],
+        color_ids: np.ndarray,
+    ) -> None:
+        self.chroms = chroms
+        self.chrom_ids = chrom_ids
+        self.starts = starts
+        self.ends = ends
+        self.labels = labels
+        self.label_ids = label_ids
+        self.scores = scores
+        self.strands = strands
+        self.strand_ids = strand_ids
+        self.thick_starts = thick_starts
+        self.thick_ends = thick_ends
+        self.colors = colors
+        self.color_ids = color_ids
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_bed(cls, file_handle: IO[str]) -> "Segmentation":
+        """
+        Each block of lines is split on tabs and newlines in one go and the columns
+        are taken out as strided slices, so no per-row lists are ever built. Numbers
+        are parsed by NumPy and the string columns are interned as they are seen.
+        """
+        tables: List[Dict[str, int]] = [{}, {}, {}, {}]
+        blocks = list(parse_bed_blocks(file_handle, tables))
+        if blocks:
+            arrays = [np.concatenate(column) for column in zip(*blocks)]
+        else:
+            dtypes = [np.uint16, np.int64, np.int64, np.uint16, np.int32, np.uint16]
+            dtypes.extend([np.int64, np.int64, np.uint16])
+            arrays = [np.empty(0, dtype=dtype) for dtype in dtypes]
+        chroms, labels, strands, colors = [list(table) for table in tables]
+        return cls(
+            chroms=chroms,
+            chrom_ids=arrays[0],
+            starts=arrays[1],
+            ends=arrays[2],
+            labels=labels,
+            label_ids=arrays[3],
+            scores=arrays[4],
+            strands=strands,
+            strand_ids=arrays[5],
+            thick_starts=arrays[6],
+            thick_ends=arrays[7],
+            colors=colors,
+            color_ids=arrays[8],
+        )
+
+    @classmethod
+    def iter_bed(cls, file_handle: IO[str]) -> Iterator["Segmentation"]:
+        """
+        Stream the BED as a `Segmentation` per block of lines. The interned tables are
+        shared between blocks, so a string has the same index in every block, and the
+        indexes are in the order the strings first appear in the file.
+        """
+        tables: List[Dict[str, int]] = [{}, {}, {}, {}]
+        for arrays in parse_bed_blocks(file_handle, tables):
+            chroms, labels, strands, colors = [list(table) for table in tables]
+            yield cls(
+                chroms=chroms,
+                chrom_ids=arrays[0],
+                starts=arrays[1],
+                ends=arrays[2],
+                labels=labels,
+                label_ids=arrays[3],
+                scores=arrays[4],
+                strands=strands,
+                strand_ids=arrays[5],
+                thick_starts=arrays[6],
+                thick_ends=arrays[7],
+                colors=colors,
+                color_ids=arrays[8],
+            )
+
+    def to_bed(self, file_handle: IO[str]) -> None:
+        """
+        Render the rows in blocks. The interned columns are expanded with a single
+        fancy index into their table.
+        """
+        chroms = np.array(self.chroms, dtype=object)
+        labels = np.array(self.labels, dtype=object)
+        strands = np.array(self.strands, dtype=object)
+        colors = np.array(self.colors, dtype=object)
+        for offset in range(0, len(self), WRITE_BLOCK_ROWS):
+            rows = slice(offset, offset + WRITE_BLOCK_ROWS)
+            columns = [
+                chroms[self.chrom_ids[rows]].tolist(),
+                to_strings(self.starts[rows]),
+                to_strings(self.ends[rows]),
+                labels[self.label_ids[rows]].tolist(),
+                to_strings(self.scores[rows]),
+                strands[self.strand_ids[rows]].tolist(),
+                to_strings(self.thick_starts[rows]),
+                to_strings(self.thick_ends[rows]),
+                colors[self.color_ids[rows]].tolist(),
+            ]
+            file_handle.writelines(["\t".join(row) + "\n" for row in zip(*columns)])
+
+    def map_labels(self, func: Callable[[str], str]) -> None:
+        """
+        Only the label table changes, the label of every row is already an index into
+        it.
+        """
+        self.labels = [func(label) for label in self.labels]
+
+    def color_by_label(self, func: Callable[[str], str]) -> None:
+        """
+        Compute the color once per label, then remap the label column to the color
+        column with a single fancy index.
+        """
+        color_table: Dict[str, int] = {}
+        label_to_color_id = np.array(
+            [
+                color_table.setdefault(func(label), len(color_table))
+                for label in self.labels
+            ],
+            dtype=np.uint16,
+        )
+        self.colors = list(color_table)
+        self.color_ids = label_to_color_id[self.label_ids]
+
+
+def parse_bed_blocks(
+    file_handle: IO[str], tables: List[Dict[str, int]]
+) -> Iterator[List[np.ndarray]]:
+    """
+    Parse each block of lines into its columns, interning the chromosome, label,
+    strand and color columns into `tables`.
+    """
+    for lines in read_blocks(file_handle):
+        text = "".join(lines)
+        if not text.endswith("\n"):
+            text += "\n"
+        fields = text.replace("\n", "\t").split("\t")
+        if len(fields) % NUM_COLUMNS != 1:
+            raise ValueError(f"Expected BED9 rows with {NUM_COLUMNS} columns")
+        chrom, start, end, label, score, strand, thick_start, thick_end, color = [
+            fields[i:-1:NUM_COLUMNS] for i in range(NUM_COLUMNS)
+        ]
+        yield [
+            intern(chrom, tables[0]),
+            parse_ints(start, np.int64),
+            parse_ints(end, np.int64),
+            intern(label, tables[1]),
+            parse_ints(score, np.int32),
+            intern(strand, tables[2]),
+            parse_ints(thick_start, np.int64),
+            parse_ints(thick_end, np.int64),
+            intern(color, tables[3]),
+        ]
+
+
+def intern(values: List[str], table: Dict[str, int]) -> np.ndarray:
+    """
+    Replace the strings in `values` with their index in `table`, adding any new
+    strings to the end of the table. The indices are stored as uint16, so there can be
+    at most 65,536 distinct strings.
+    """
+    ids = [table.setdefault(value, len(table)) for value in values]
+    if len(table) > np.iinfo(np.uint16).max + 1:
+        raise ValueError(
+            f"Too many distinct values to intern, {len(table)} is more than 65536"
+        )
+    return np.array(ids, dtype=np.uint16)
+
+
+def parse_ints(values: List[str], dtype: type) -> np.ndarray:
+    with warnings.catch_warnings():
+        # NumPy warns and returns what it could parse when hitting non-numeric data
+        warnings.simplefilter("ignore", DeprecationWarning)
+        parsed = np.fromstring(" ".join(values), dtype=dtype, sep=" ")
+    if len(parsed) != len(values):
+        raise ValueError("Could not parse BED coordinates or scores as integers")
+    return parsed
+
+
+def to_strings(values: np.ndarray) -> List[str]:
+    return list(map(str, values.tolist()))
@@ -0,0 +1,264 @@
+import argparse
+import multiprocessing
+import os
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import tables
+
+from segway_pipeline.bed_io import open_bed
+from segway_pipeline.chrom_sizes import GENOMEDATA_SUFFIX, read_genomedata_chroms
+from segway_pipeline.segmentation import Segmentation
+
+SIGNAL_DISTRIBUTION_FILENAME = "signal_distribution.tab"
+SIGNAL_DISTRIBUTION_FIELDNAMES = ["label", "trackname", "mean", "sd", "n"]
+TRANSFORMATIONS = ("arcsinh",)
+# Bases of a supercontig read at a time
+READ_BLOCK_ROWS = 1 << 20
+
+# Sum, sum of squares and number of finite values of each track, by label
+SignalSums = Tuple[np.ndarray, np.ndarray, np.ndarray]
+# Starts, ends and label ids of the segments on a chromosome
+ChromSegments = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    with open_bed(args.bed) as f:
+        segmentation = Segmentation.from_bed(f)
+    tracknames, sums = get_signal_sums(
+        segmentation, args.genomedata, args.transformation, args.num_processes
+    )
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(os.path.join(args.outdir, SIGNAL_DISTRIBUTION_FILENAME), "w") as f:
+        write_signal_distribution(segmentation.labels, tracknames, sums, f)
+
+
+def get_signal_sums(
+    segmentation: Segmentation,
+    genomedata: str,
+    transformation: Optional[str] = None,
+    num_processes: int = 1,
+) -> Tuple[List[str], SignalSums]:
+    """
+    Sum the signal over the segments of each label, one chromosome per process, for
+    the chromosomes in both the segmentation and the genomedata. Like `segtools`, the
+    sums are accumulated in extended precision.
+    """
+    tracknames = read_tracknames(genomedata)
+    num_labels = len(segmentation.labels)
+    segments = split_chroms(segmentation)
+    chroms = [
+        chrom for chrom in read_genomedata_chroms(genomedata) if chrom in segments
+    ]
+    jobs = [
+        (
+            genomedata,
+            chrom,
+            segments[chrom],
+            len(tracknames),
+            num_labels,
+            transformation,
+        )
+        for chrom in sorted(chroms)
+    ]
+    total = make_signal_sums(len(tracknames), num_labels)
+    with multiprocessing.Pool(num_processes) as pool:
+        for chrom_sums in pool.starmap(get_chrom_signal_sums, jobs, chunksize=1):
+            for accumulated, chrom_sum in zip(total, chrom_sums):
+                accumulated += chrom_sum
+    return tracknames, total
+
+
+def make_signal_sums(num_tracks: int, num_labels: int) -> SignalSums:
+    shape = (num_tracks, num_labels)
+    return (
+        np.zeros(shape, dtype=np.longdouble),
+        np.zeros(shape, dtype=np.longdouble),
+        np.zeros(shape, dtype=np.int64),
+    )
+
+
+def split_chroms(segmentation: Segmentation) -> Dict[str, ChromSegments]:
+    """
+    Each chromosome's segments, sorted by start.
+    """
+    order = np.lexsort((segmentation.starts, segmentation.chrom_ids))
+    chrom_ids = segmentation.chrom_ids[order]
+    boundaries = np.flatnonzero(np.diff(chrom_ids)) + 1
+    segments = {}
+    for group in np.split(order, boundaries):
+        if len(group) == 0:
+            continue
+        chrom = segmentation.chroms[segmentation.chrom_ids[group[0]]]
+        segments[chrom] = (
+            segmentation.starts[group],
+            segmentation.ends[group],
+            segmentation.label_ids[group],
+        )
+    return segments
+
+
+def get_chrom_signal_sums(
+    genomedata: str,
+    chrom: str,
+    segments: ChromSegments,
+    num_tracks: int,
+    num_labels: int,
+    transformation: Optional[str] = None,
+) -> SignalSums:
+    """
+    Read each supercontig a block of rows at a time, label every base of the block
+    with its segment's label, then sum every track over each label at once with
+    `np.bincount`. Bases outside any segment get an extra label that is dropped at
+    the end.
+    """
+    starts, ends, label_ids = segments
+    sums = make_signal_sums(num_tracks, num_labels + 1)
+    with open_chromosome(genomedata, chrom) as chromosome:
+        for supercontig in chromosome._v_file.iter_nodes(chromosome, classname="Group"):
+            if "continuous" not in supercontig:
+                continue
+            continuous = supercontig.continuous
+            supercontig_start = int(supercontig._v_attrs.start)
+            for row in range(0, continuous.shape[0], READ_BLOCK_ROWS):
+                data = continuous[slice(row, row + READ_BLOCK_ROWS)]
+                positions = supercontig_start + row + np.arange(len(data))
+                labels = label_positions(positions, starts, ends, label_ids, num_labels)
+                add_block_sums(sums, data, labels, num_labels, transformation)
+    total, total_squares, counts = sums
+    return total[:, :num_labels], total_squares[:, :num_labels], counts[:, :num_labels]
+
+
+def label_positions(
+    positions: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    label_ids: np.ndarray,
+    num_labels: int,
+) -> np.ndarray:
+    """
+    The label id of the segment covering each position, or `num_labels` if none does.
+    """
+    index = np.searchsorted(starts, positions, side="right") - 1
+    clipped = np.maximum(index, 0)
+    covered = (index >= 0) & (positions < ends[clipped])
+    return np.where(covered, label_ids[clipped], num_labels)
+
+
+def add_block_sums(
+    sums: SignalSums,
+    data: np.ndarray,
+    labels: np.ndarray,
+    num_labels: int,
+    transformation: Optional[str] = None,
+) -> None:
+    """
+    Like `segtools`, missing values are skipped and the transformation and squares
+    are computed in the data's single precision, but summed in extended precision.
+    Labels come in runs of a segment's bases, so each run is summed with
+    `np.add.reduceat` and only the few run sums are added to their labels.
+    """
+    total, total_squares, counts = sums
+    for track_index in range(data.shape[1]):
+        values = data[:, track_index]
+        finite = np.isfinite(values)
+        values = values[finite]
+        track_labels = labels[finite]
+        counts[track_index] += np.bincount(track_labels, minlength=num_labels + 1)
+        if len(values) == 0:
+            continue
+        if transformation == "arcsinh":
+            values = np.arcsinh(values)
+        run_starts = np.flatnonzero(np.diff(track_labels, prepend=-1))
+        run_labels = track_labels[run_starts]
+        np.add.at(
+            total[track_index],
+            run_labels,
+            np.add.reduceat(values.astype(np.longdouble), run_starts),
+        )
+        np.add.at(
+            total_squares[track_index],
+            run_labels,
+            np.add.reduceat(np.square(values).astype(np.longdouble), run_starts),
+        )
+
+
+def write_signal_distribution(
+    labels: List[str], tracknames: List[str], sums: SignalSums, file_handle: IO[str]
+) -> None:
+    """
+    The mean and sample standard deviation of each track over each label, labels in
+    the order they first appear in the BED and tracks in genomedata order.
+    """
+    total, total_squares, counts = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = total / counts
+        sds = np.sqrt((total_squares - np.square(total) / counts) / (counts - 1))
+    file_handle.write("\t".join(SIGNAL_DISTRIBUTION_FIELDNAMES) + "\n")
+    for label_id, label in enumerate(labels):
+        for track_index, trackname in enumerate(tracknames):
+            row = [
+                label,
+                trackname,
+                str(means[track_index, label_id]),
+                str(sds[track_index, label_id]),
+                str(counts[track_index, label_id]),
+            ]
+            file_handle.write("\t".join(row) + "\n")
+
+
+def read_tracknames(genomedata: str) -> List[str]:
+    """
+    In directory mode every chromosome's file has the track names.
+    """
+    chrom = read_genomedata_chroms(genomedata)[0]
+    with open_chromosome(genomedata, chrom) as chromosome:
+        tracknames = chromosome._v_file.root._v_attrs.tracknames
+    return [trackname.decode() for trackname in tracknames]
+
+
+@contextmanager
+def open_chromosome(genomedata: str, chrom: str) -> Iterator[tables.Group]:
+    """
+    The group holding the chromosome's supercontigs, the root of its own file in a
+    directory mode archive.
+    """
+    if os.path.isdir(genomedata):
+        path = os.path.join(genomedata, chrom + GENOMEDATA_SUFFIX)
+        with tables.open_file(path) as h5file:
+            yield h5file.root
+    else:
+        with tables.open_file(genomedata) as h5file:
+            yield h5file.get_node(h5file.root, chrom)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Write the signal_distribution.tab of segtools-signal-distribution without the plots"
+    )
+    parser.add_argument("bed", help="path to Segway output BED, optionally gzipped")
+    parser.add_argument("genomedata", help="path to genomedata archive")
+    parser.add_argument(
+        "-o", "--outdir", required=True, help="directory to write the table to"
+    )
+    parser.add_argument(
+        "-t",
+        "--transformation",
+        choices=TRANSFORMATIONS,
+        help="transformation to apply to the signal",
+    )
+    parser.add_argument(
+        "-p",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="number of chromosomes to process at once",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.workflow("test_postprocess_bed")
+def test_postprocess_bed_relabeled_bed_files_match(workflow_dir, skip_n_lines_md5):
+    bed_path = workflow_dir / Path("test-output/relabeled.bed.gz")
+    md5sum = skip_n_lines_md5(bed_path, n_lines=0)
+    assert md5sum == "78dec54ca4251100922c3aafb36c3b2b"
+
+
+@pytest.mark.workflow("test_postprocess_bed")
+def test_postprocess_bed_recolored_bed_files_match(workflow_dir, skip_n_lines_md5):
+    bed_path = workflow_dir / Path("test-output/recolored.bed.gz")
+    md5sum = skip_n_lines_md5(bed_path, n_lines=0)
+    assert md5sum == "6644b1d1d9804691882296a36f2d45bc"
@@ -0,0 +1,82 @@
+import gzip
+from io import StringIO
+
+import pytest
+
+from segway_pipeline.bed_io import map_blocks, open_bed, read_blocks
+
+BED_DATA = (
+    "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+)
+
+
+def test_open_bed_read_plain(tmp_path):
+    path = tmp_path / "in.bed"
+    path.write_text(BED_DATA)
+    with open_bed(str(path)) as f:
+        assert f.read() == BED_DATA
+
+
+def test_open_bed_read_gzipped_regardless_of_suffix(tmp_path):
+    path = tmp_path / "in.bed"
+    path.write_bytes(gzip.compress(BED_DATA.encode()))
+    with open_bed(str(path)) as f:
+        assert f.read() == BED_DATA
+
+
+def test_open_bed_read_multi_member_gzip(tmp_path):
+    """
+    bgzip output is a series of concatenated gzip members.
+    """
+    path = tmp_path / "in.bed.gz"
+    first, second = BED_DATA.splitlines(keepends=True)
+    path.write_bytes(gzip.compress(first.encode()) + gzip.compress(second.encode()))
+    with open_bed(str(path)) as f:
+        assert f.read() == BED_DATA
+
+
+def test_open_bed_write_gzipped_is_reproducible(tmp_path):
+    outputs = []
+    for i in range(2):
+        path = tmp_path / f"{i}" / "out.bed.gz"
+        path.parent.mkdir()
+        with open_bed(str(path), "w") as f:
+            f.write(BED_DATA)
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
+    assert gzip.decompress(outputs[0]).decode() == BED_DATA
+
+
+def test_open_bed_write_plain(tmp_path):
+    path = tmp_path / "out.bed"
+    with open_bed(str(path), "w") as f:
+        f.write(BED_DATA)
+    assert path.read_bytes() == BED_DATA.encode()
+
+
+def test_open_bed_invalid_mode_raises(tmp_path):
+    with pytest.raises(ValueError):
+        with open_bed(str(tmp_path / "out.bed"), "a"):
+            pass
+
+
+def test_read_blocks(tmp_path):
+    path = tmp_path / "in.bed"
+    path.write_text(BED_DATA * 10)
+    with open_bed(str(path)) as f:
+        blocks = list(read_blocks(f, block_size=100))
+    assert len(blocks) > 1
+    assert "".join(line for block in blocks for line in block) == BED_DATA * 10
+
+
+@pytest.mark.parametrize("num_processes", [1, 3])
+def test_map_blocks_preserves_order(num_processes):
+    blocks = list(read_blocks(StringIO(BED_DATA * 50), block_size=100))
+    result = list(map_blocks("".join, blocks, num_processes=num_processes))
+    assert "".join(result) == BED_DATA * 50
+
+
+def test_map_blocks_invalid_num_processes_raises():
+    with pytest.raises(ValueError):
+        list(map_blocks("".join, [], num_processes=0))
@@ -0,0 +1,192 @@
+import itertools
+import json
+
+import pytest
+import tables
+
+from segway_pipeline.chrom_sizes import (
+    balance_shards,
+    filter_chroms,
+    main,
+    make_plan,
+    read_chrom_sizes,
+    read_genomedata_chroms,
+    shard_chroms,
+    write_shard_beds,
+)
+
+
+def test_read_chrom_sizes(tmp_path):
+    path = tmp_path / "chrom.sizes"
+    path.write_text("chr1\t1000\n\nchrEBV\t171823\n")
+    assert read_chrom_sizes(str(path)) == [("chr1", 1000), ("chrEBV", 171823)]
+
+
+def test_read_chrom_sizes_test_data():
+    result = read_chrom_sizes("tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv")
+    assert result == [("chr19", 58617616)]
+
+
+def test_shard_chroms():
+    chroms = [("chr1", 100), ("chr2", 90), ("chr3", 50), ("chr4", 40), ("chrM", 5)]
+    result = shard_chroms(chroms, 2)
+    assert result == [
+        [("chr1", 100), ("chr4", 40), ("chrM", 5)],
+        [("chr2", 90), ("chr3", 50)],
+    ]
+
+
+def test_shard_chroms_improves_on_largest_first():
+    """
+    Largest first gives shards of 7 and 5.
+    """
+    chroms = [("chr1", 3), ("chr2", 3), ("chr3", 2), ("chr4", 2), ("chr5", 2)]
+    assert shard_chroms(chroms, 2) == [
+        [("chr1", 3), ("chr2", 3)],
+        [("chr3", 2), ("chr4", 2), ("chr5", 2)],
+    ]
+
+
+@pytest.mark.parametrize(
+    "sizes,num_shards",
+    [
+        ([8, 7, 6, 5, 4], 2),
+        ([9, 7, 6, 5, 5, 4, 3], 3),
+        ([248, 242, 198, 190, 181, 171, 159, 145, 138, 133], 4),
+    ],
+)
+def test_shard_chroms_optimal(sizes, num_shards):
+    chroms = [(f"chr{i}", size) for i, size in enumerate(sizes)]
+    result = shard_chroms(chroms, num_shards)
+    optimum = min(
+        max(
+            sum(size for size, shard in zip(sizes, assignment) if shard == i)
+            for i in range(num_shards)
+        )
+        for assignment in itertools.product(range(num_shards), repeat=len(sizes))
+    )
+    assert max(sum(size for _, size in shard) for shard in result) == optimum
+    assert sorted(chrom for shard in result for chrom in shard) == sorted(chroms)
+
+
+def test_balance_shards_swaps():
+    shards = [[("chr1", 10), ("chr2", 4)], [("chr3", 6), ("chr4", 2)]]
+    balance_shards(shards)
+    assert shards == [[("chr2", 4), ("chr3", 6)], [("chr4", 2), ("chr1", 10)]]
+
+
+def test_balance_shards_already_balanced():
+    shards = [[("chr1", 10)], [("chr2", 6), ("chr3", 3)]]
+    balance_shards(shards)
+    assert shards == [[("chr1", 10)], [("chr2", 6), ("chr3", 3)]]
+
+
+def test_shard_chroms_does_not_depend_on_order():
+    chroms = [("chr1", 10), ("chr2", 10), ("chr3", 10), ("chr4", 20)]
+    assert shard_chroms(chroms, 3) == shard_chroms(chroms[::-1], 3)
+
+
+def test_shard_chroms_more_shards_than_chroms():
+    assert shard_chroms([("chr1", 10), ("chr2", 5)], 4) == [
+        [("chr1", 10)],
+        [("chr2", 5)],
+    ]
+
+
+def test_shard_chroms_invalid_num_shards():
+    with pytest.raises(ValueError):
+        shard_chroms([("chr1", 10)], 0)
+
+
+def test_make_plan():
+    shards = [[("chr1", 10), ("chr3", 5)], [("chr2", 12)]]
+    assert make_plan(shards, 2) == {
+        "shards": [["chr1", "chr3"], ["chr2"]],
+        "sizes": [15, 12],
+        "lower_bound": 14,
+    }
+
+
+def test_make_plan_lower_bound_largest_chrom():
+    assert make_plan([[("chr1", 10)], [("chr2", 1)]], 2)["lower_bound"] == 10
+
+
+def test_filter_chroms():
+    chroms = [("chr1", 10), ("chr2", 5), ("chrEBV", 1)]
+    assert filter_chroms(chroms, ["chrEBV", "chr1"]) == [("chr1", 10), ("chrEBV", 1)]
+
+
+def test_read_genomedata_chroms_file_mode(tmp_path):
+    path = str(tmp_path / "test.genomedata")
+    with tables.open_file(path, "w") as h5file:
+        for chrom in ("chr1", "chr19"):
+            h5file.create_group("/", chrom)
+    assert sorted(read_genomedata_chroms(path)) == ["chr1", "chr19"]
+
+
+def test_read_genomedata_chroms_directory_mode(tmp_path):
+    for name in ("chr1.genomedata", "chr19.genomedata", "README"):
+        (tmp_path / name).write_text("")
+    assert sorted(read_genomedata_chroms(str(tmp_path))) == ["chr1", "chr19"]
+
+
+def test_write_shard_beds(tmp_path):
+    write_shard_beds([[("chr1", 10), ("chr3", 5)], [("chr2", 12)]], str(tmp_path))
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "shard_000.bed",
+        "shard_001.bed",
+    ]
+    assert (tmp_path / "shard_000.bed").read_text() == "chr1\t0\t10\nchr3\t0\t5\n"
+    assert (tmp_path / "shard_001.bed").read_text() == "chr2\t0\t12\n"
+
+
+def test_main(mocker, tmp_path):
+    sizes = "tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv"
+    testargs = ["prog", "--sizes", sizes, "-n", "2", "-o", str(tmp_path / "shards")]
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert (tmp_path / "shards" / "shard_000.bed").read_text() == "chr19\t0\t58617616\n"
+    assert len(list((tmp_path / "shards").iterdir())) == 1
+
+
+def test_main_plan(mocker, tmp_path):
+    sizes = "tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv"
+    plan = tmp_path / "plan.json"
+    testargs = ["prog", "--sizes", sizes, "-n", "3", "--plan-outfile", str(plan)]
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert json.loads(plan.read_text()) == {
+        "shards": [["chr19"]],
+        "sizes": [58617616],
+        "lower_bound": 58617616,
+    }
+
+
+def test_main_genomedata(mocker, tmp_path):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text("chr19\t58617616\nchrEBV\t171823\n")
+    genomedata = tmp_path / "genomedata"
+    genomedata.mkdir()
+    (genomedata / "chr19.genomedata").write_text("")
+    plan = tmp_path / "plan.json"
+    testargs = [
+        "prog",
+        "--sizes",
+        str(sizes),
+        "-n",
+        "2",
+        "--genomedata",
+        str(genomedata),
+        "--plan-outfile",
+        str(plan),
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert json.loads(plan.read_text())["shards"] == [["chr19"]]
+
+
+def test_main_no_outputs(mocker):
+    sizes = "tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv"
+    mocker.patch("sys.argv", ["prog", "--sizes", sizes, "-n", "2"])
+    with pytest.raises(SystemExit):
+        main()
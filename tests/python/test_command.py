@@ -0,0 +1,78 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from segway_pipeline.command import (
+    STDERR_TAIL_LINES,
+    ResourceUsage,
+    measure_children,
+    run_command,
+    write_metrics,
+)
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_command_streams_stderr(capfd):
+    run_command(python_command("import sys; print('foo', file=sys.stderr)"))
+    assert capfd.readouterr().err == "foo\n"
+
+
+def test_run_command_writes_metrics(tmp_path):
+    metrics_path = tmp_path / "metrics.json"
+    command = python_command("sum(range(10 ** 6))")
+    usage = run_command(command, str(metrics_path))
+    metrics = json.loads(metrics_path.read_text())
+    assert metrics["command"] == command
+    assert metrics["returncode"] == 0
+    assert metrics["wall_seconds"] == usage.wall_seconds > 0
+    assert metrics["cpu_seconds"] == usage.cpu_seconds > 0
+    assert metrics["peak_rss_bytes"] > 0
+
+
+def test_run_command_failure_raises_with_stderr_tail(tmp_path, capfd):
+    metrics_path = tmp_path / "metrics.json"
+    code = (
+        "import sys\n"
+        "for i in range(100):\n"
+        "    print(i, file=sys.stderr)\n"
+        "sys.exit(3)\n"
+    )
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run_command(python_command(code), str(metrics_path))
+    assert e.value.returncode == 3
+    expected_tail = range(100 - STDERR_TAIL_LINES, 100)
+    assert e.value.stderr.decode() == "".join(f"{i}\n" for i in expected_tail)
+    assert json.loads(metrics_path.read_text())["returncode"] == 3
+    assert capfd.readouterr().err.startswith("0\n1\n")
+
+
+def test_measure_children():
+    with measure_children() as usage:
+        subprocess.run(python_command("sum(range(10 ** 6))"))
+    assert usage.wall_seconds > 0
+    assert usage.cpu_seconds == usage.user_seconds + usage.system_seconds > 0
+    assert usage.peak_rss_bytes > 0
+
+
+def test_write_metrics(tmp_path):
+    usage = ResourceUsage()
+    usage.wall_seconds = 2.0
+    usage.user_seconds = 1.5
+    usage.system_seconds = 0.25
+    usage.peak_rss_bytes = 1024
+    path = tmp_path / "metrics.json"
+    write_metrics(usage, str(path), ["foo"], 0)
+    assert json.loads(path.read_text()) == {
+        "command": ["foo"],
+        "returncode": 0,
+        "wall_seconds": 2.0,
+        "user_seconds": 1.5,
+        "system_seconds": 0.25,
+        "cpu_seconds": 1.75,
+        "peak_rss_bytes": 1024,
+    }
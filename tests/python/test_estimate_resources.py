@@ -0,0 +1,176 @@
+import json
+
+import pytest
+
+from segway_pipeline.estimate_resources import (
+    DEFAULT_RESOURCES,
+    ResourceModel,
+    get_annotate_memory_work,
+    get_disk_work,
+    get_train_memory_work,
+    main,
+    read_calibration,
+)
+
+# A GRCh38 run with the default hyperparameters that used the default resources
+RECORDED_RUN = {
+    "num_tracks": 10,
+    "resolution": 100,
+    "minibatch_fraction": 0.01,
+    "num_instances": 10,
+    "genome_length": 3099922541,
+    "train_memory_gb": 300,
+    "train_disk_gb": 1000,
+    "annotate_memory_gb": 400,
+    "annotate_disk_gb": 1000,
+}
+RUN = {
+    "num_tracks": 4,
+    "resolution": 200,
+    "minibatch_fraction": 0.1,
+    "num_instances": 5,
+    "genome_length": 1000,
+}
+
+
+def test_resource_model_fit():
+    model = ResourceModel.fit(10, [(100, 30), (200, 50)])
+    assert model.per_unit == pytest.approx(0.2)
+    assert model.predict(0) == 10
+    assert model.predict(50) == 20
+
+
+def test_resource_model_fit_clamps_negative_cost():
+    model = ResourceModel.fit(10, [(100, 5)])
+    assert model.per_unit == 0
+    assert model.predict(1000) == 10
+
+
+@pytest.mark.parametrize("points", [[], [(0, 10)]])
+def test_resource_model_fit_invalid(points):
+    with pytest.raises(ValueError):
+        ResourceModel.fit(10, points)
+
+
+def test_resource_model_predict_rounds_up():
+    assert ResourceModel(1, 0.25).predict(3) == 2
+
+
+def test_get_train_memory_work():
+    assert get_train_memory_work(RUN) == pytest.approx(10)
+
+
+def test_get_annotate_memory_work():
+    assert get_annotate_memory_work(RUN) == pytest.approx(20)
+
+
+def test_get_disk_work():
+    assert get_disk_work(RUN) == 4000
+
+
+def test_read_calibration(tmp_path):
+    path = tmp_path / "runs.tsv"
+    path.write_text(
+        "\t".join(RECORDED_RUN) + "\n" + "\t".join(map(str, RECORDED_RUN.values()))
+    )
+    assert read_calibration(str(path)) == [
+        {key: float(value) for key, value in RECORDED_RUN.items()}
+    ]
+
+
+def test_read_calibration_missing_columns(tmp_path):
+    path = tmp_path / "runs.tsv"
+    path.write_text("num_tracks\ttrain_memory_gb\n10\t300\n")
+    with pytest.raises(ValueError):
+        read_calibration(str(path))
+
+
+def write_calibration(tmp_path, run=RECORDED_RUN):
+    calibration = tmp_path / "runs.tsv"
+    calibration.write_text("\t".join(run) + "\n" + "\t".join(map(str, run.values())))
+    return str(calibration)
+
+
+def make_args(tmp_path, chrom_sizes, num_tracks=10, calibration=None):
+    calibration_args = [] if calibration is None else ["--calibration", calibration]
+    return [
+        "prog",
+        "--num-tracks",
+        str(num_tracks),
+        "--resolution",
+        "100",
+        "--minibatch-fraction",
+        "0.01",
+        "--num-instances",
+        "10",
+        "--chrom-sizes",
+        chrom_sizes,
+        "-o",
+        str(tmp_path / "resources.json"),
+    ] + calibration_args
+
+
+def test_main_reference_run(mocker, tmp_path):
+    chrom_sizes = tmp_path / "chrom.sizes"
+    chrom_sizes.write_text(f"chr1\t{RECORDED_RUN['genome_length']}\n")
+    calibration = write_calibration(tmp_path)
+    mocker.patch(
+        "sys.argv", make_args(tmp_path, str(chrom_sizes), calibration=calibration)
+    )
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    assert result == DEFAULT_RESOURCES
+
+
+def test_main_without_calibration(mocker, tmp_path):
+    chrom_sizes = "tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv"
+    mocker.patch("sys.argv", make_args(tmp_path, chrom_sizes, num_tracks=30))
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    assert result == DEFAULT_RESOURCES
+
+
+def test_main_small_genome(mocker, tmp_path):
+    chrom_sizes = "tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv"
+    calibration = write_calibration(tmp_path)
+    testargs = make_args(tmp_path, chrom_sizes, num_tracks=3, calibration=calibration)
+    mocker.patch("sys.argv", testargs)
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    assert result == {
+        "train_memory_gb": 10,
+        "train_disk_gb": 56,
+        "annotate_memory_gb": 11,
+        "annotate_disk_gb": 56,
+    }
+
+
+def test_main_annotate_shards(mocker, tmp_path):
+    chrom_sizes = tmp_path / "chrom.sizes"
+    chrom_sizes.write_text("chr1\t2000000000\nchr2\t1000000000\nchr3\t1000000000\n")
+    calibration = write_calibration(tmp_path)
+    unsharded_args = make_args(tmp_path, str(chrom_sizes), calibration=calibration)
+    mocker.patch("sys.argv", unsharded_args + ["--num-annotate-shards", "2"])
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    mocker.patch("sys.argv", unsharded_args)
+    main()
+    unsharded = json.loads((tmp_path / "resources.json").read_text())
+    assert result["train_memory_gb"] == unsharded["train_memory_gb"]
+    assert result["annotate_memory_gb"] < unsharded["annotate_memory_gb"]
+    assert result["annotate_disk_gb"] < unsharded["annotate_disk_gb"]
+
+
+def test_main_calibration(mocker, tmp_path):
+    calibration = write_calibration(tmp_path, dict(RECORDED_RUN, train_memory_gb=158))
+    chrom_sizes = tmp_path / "chrom.sizes"
+    chrom_sizes.write_text(f"chr1\t{RECORDED_RUN['genome_length']}\n")
+    testargs = make_args(tmp_path, str(chrom_sizes), calibration=calibration)
+    mocker.patch("sys.argv", testargs)
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    assert result["train_memory_gb"] == 158
+    mocker.patch("sys.argv", testargs[:2] + ["30"] + testargs[3:])
+    main()
+    result = json.loads((tmp_path / "resources.json").read_text())
+    assert result["train_memory_gb"] > 300
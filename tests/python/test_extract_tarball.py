@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from segway_pipeline.extract_tarball import (
+    MemberFilter,
+    extract_tarball,
+    get_ranges,
+    main,
+)
+from segway_pipeline.make_tarball import TarballIndex, list_entries, make_tarball
+
+
+@pytest.mark.parametrize(
+    "names,exclude,name,expected",
+    [
+        (None, None, "traindir/params/params.params", True),
+        (["traindir/params"], None, "traindir/params/params.params", True),
+        (["traindir/params/"], None, "traindir/params/", True),
+        (["traindir/params"], None, "traindir/params.tab", False),
+        (None, "traindir/log/.*", "traindir/log/x.tab", False),
+        (None, "traindir/log/.*", "traindir/log", True),
+        (["traindir/log"], "traindir/log/.*", "traindir/log/x.tab", False),
+    ],
+)
+def test_member_filter(names, exclude, name, expected):
+    assert MemberFilter(names, exclude)(name) is expected
+
+
+def test_get_ranges():
+    entries = [("a", 0, 512), ("b", 512, 2048), ("c", 2048, 2560), ("d", 2560, 3072)]
+    index = TarballIndex(1024, [0, 100], entries)
+    result = list(get_ranges(index, MemberFilter(exclude="c")))
+    assert result == [(0, 2048), (2560, 3072)]
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    contents = {
+        "traindir/params/params.params": os.urandom(3000),
+        "traindir/log/likelihood.tab": b"1\n",
+        "traindir/segway.str": b"structure\n",
+    }
+    for path, content in contents.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+    os.chmod("traindir/segway.str", 0o664)
+    make_tarball(list_entries("traindir"), "traindir.tar.gz", 1, "traindir.index")
+    return contents
+
+
+def read_tree(directory):
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relpath = os.path.relpath(path, directory)
+            if os.path.isdir(path):
+                tree[relpath] = None
+            else:
+                with open(path, "rb") as f:
+                    tree[relpath] = f.read()
+    return tree
+
+
+@pytest.mark.parametrize("index", [None, "traindir.index"])
+def test_extract_tarball(archive, index):
+    member_filter = MemberFilter(["traindir/params", "traindir/segway.str"])
+    extract_tarball("traindir.tar.gz", "out", member_filter, 1, index)
+    assert read_tree("out") == {
+        "params": None,
+        "params/params.params": archive["traindir/params/params.params"],
+        "segway.str": archive["traindir/segway.str"],
+    }
+    assert os.stat("out/segway.str").st_mtime == 1546300800
+
+
+@pytest.mark.parametrize("index", [None, "traindir.index"])
+def test_extract_tarball_exclude(archive, index):
+    member_filter = MemberFilter(exclude="traindir/log/.*")
+    extract_tarball("traindir.tar.gz", "out", member_filter, 0, index)
+    assert read_tree("out") == {
+        "traindir": None,
+        "traindir/log": None,
+        "traindir/params": None,
+        "traindir/params/params.params": archive["traindir/params/params.params"],
+        "traindir/segway.str": archive["traindir/segway.str"],
+    }
+
+
+def test_extract_tarball_applies_umask(mocker, archive):
+    mocker.patch("os.geteuid", return_value=1000)
+    old_umask = os.umask(0o027)
+    try:
+        extract_tarball("traindir.tar.gz", "out", MemberFilter(["traindir/segway.str"]))
+    finally:
+        os.umask(old_umask)
+    assert os.stat("out/traindir/segway.str").st_mode & 0o777 == 0o640
+
+
+def test_extract_tarball_as_root_keeps_permissions(mocker, archive):
+    mocker.patch("os.geteuid", return_value=0)
+    old_umask = os.umask(0o027)
+    try:
+        extract_tarball("traindir.tar.gz", "out", MemberFilter(["traindir/segway.str"]))
+    finally:
+        os.umask(old_umask)
+    assert os.stat("out/traindir/segway.str").st_mode & 0o777 == 0o664
+
+
+def test_main(mocker, archive):
+    testargs = ["prog", "traindir.tar.gz", "-C", "out", "--strip-components", "1"]
+    mocker.patch(
+        "sys.argv", testargs + ["--index", "traindir.index", "traindir/params"]
+    )
+    main()
+    assert read_tree("out") == {
+        "params": None,
+        "params/params.params": archive["traindir/params/params.params"],
+    }
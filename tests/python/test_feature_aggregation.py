@@ -0,0 +1,350 @@
+import hashlib
+import re
+from io import StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.feature_aggregation import (
+    CODING_COMPONENTS,
+    FLANK_3P,
+    FLANK_5P,
+    GENE_COMPONENTS,
+    INITIAL_EXON,
+    SPLICE_COMPONENTS,
+    TERMINAL_EXON,
+    GeneModel,
+    add_flank_counts,
+    add_position_counts,
+    aggregate,
+    get_component_bins,
+    get_gene_components,
+    get_inner_positions,
+    load_gene_model,
+    main,
+    write_feature_aggregation,
+)
+from segway_pipeline.gtf_index import GtfIndex, get_digest, read_gtf_index
+from segway_pipeline.segmentation import Segmentation
+from segway_pipeline.signal_distribution import split_chroms
+
+GTF = "tests/data/gencode.v29.primary_assembly.annotation_UCSC_names_chr19.gtf.gz"
+ATTRIBUTES = 'gene_id "{}"; transcript_id "{}"; gene_type "protein_coding";'
+GTF_ROWS = [
+    ("chr1", "gene", 101, 1000, "+", "A", None),
+    ("chr1", "transcript", 101, 300, "+", "A", "A.2"),
+    ("chr1", "exon", 101, 300, "+", "A", "A.2"),
+    ("chr1", "transcript", 101, 1000, "+", "A", "A.1"),
+    ("chr1", "exon", 101, 200, "+", "A", "A.1"),
+    ("chr1", "CDS", 151, 200, "+", "A", "A.1"),
+    ("chr1", "exon", 401, 500, "+", "A", "A.1"),
+    ("chr1", "CDS", 401, 500, "+", "A", "A.1"),
+    ("chr1", "exon", 801, 1000, "+", "A", "A.1"),
+    ("chr1", "CDS", 801, 850, "+", "A", "A.1"),
+    ("chr2", "transcript", 2001, 2600, "-", "B", "B.1"),
+    ("chr2", "exon", 2501, 2600, "-", "B", "B.1"),
+    ("chr2", "exon", 2001, 2100, "-", "B", "B.1"),
+    ("chr2", "transcript", 2001, 2600, "-", "B", "B.2"),
+    ("chr2", "exon", 2001, 2600, "-", "B", "B.2"),
+    ("chr1", "transcript", 51, 90, "-", "C", "C.1"),
+    ("chr1", "exon", 51, 90, "-", "C", "C.1"),
+    ("chr2", "transcript", 11, 20, "+", "D", "D.1"),
+]
+BED_DATA = (
+    "chr1\t0\t120\t1\t1000\t.\t0\t120\t0,0,0\n"
+    "chr1\t120\t450\t0\t1000\t.\t120\t450\t0,0,0\n"
+    "chr1\t600\t1100\t2\t1000\t.\t600\t1100\t0,0,0\n"
+    "chr1\t1100\t1105\t0\t1000\t.\t1100\t1105\t0,0,0\n"
+    "chr2\t1900\t2550\t1\t1000\t.\t1900\t2550\t0,0,0\n"
+    "chr2\t2550\t2800\t2\t1000\t.\t2550\t2800\t0,0,0\n"
+    "chr3\t0\t100\t2\t1000\t.\t0\t100\t0,0,0\n"
+)
+
+
+def make_gtf(rows):
+    lines = ["##format: gtf"]
+    for chrom, feature, start, end, strand, gene_id, transcript_id in rows:
+        attributes = ATTRIBUTES.format(gene_id, transcript_id)
+        if transcript_id is None:
+            attributes = f'gene_id "{gene_id}";'
+        fields = [chrom, "TEST", feature, str(start), str(end), ".", strand, "."]
+        lines.append("\t".join(fields + [attributes]))
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def gene_model():
+    gtf_index = GtfIndex.from_gtf(StringIO(initial_value=make_gtf(GTF_ROWS)), "")
+    return GeneModel.from_index(gtf_index)
+
+
+@pytest.fixture
+def segmentation():
+    return Segmentation.from_bed(StringIO(initial_value=BED_DATA))
+
+
+def get_expected_counts(segmentation, gene_model, flank_bases):
+    """
+    Look up the label of every sampled base one feature at a time, like `segtools`.
+    """
+    bins = get_component_bins(flank_bases)
+    num_labels = len(segmentation.labels)
+    counts = [np.zeros((num_bins, num_labels), dtype=np.int64) for num_bins in bins]
+    num_features = 0
+    segments = split_chroms(segmentation)
+    for i in range(len(gene_model)):
+        chrom = gene_model.chroms[gene_model.chrom_ids[i]]
+        if chrom not in segments:
+            continue
+        base_labels = {}
+        for start, end, label_id in zip(*segments[chrom]):
+            base_labels.update((base, label_id) for base in range(start, end))
+        start = gene_model.starts[i]
+        end = gene_model.ends[i]
+        reverse = gene_model.reverse[i]
+        component_id = gene_model.component_ids[i]
+        windows = []
+        num_bins = bins[component_id]
+        if num_bins <= end - start:
+            window = np.round(np.linspace(start, end, num_bins, endpoint=False))
+            windows.append((component_id, window.astype(int)[:: -1 if reverse else 1]))
+        if GENE_COMPONENTS[component_id] == INITIAL_EXON:
+            if reverse:
+                window = np.arange(end, end + flank_bases)[::-1]
+            else:
+                window = np.arange(start - flank_bases, start)
+            windows.append((GENE_COMPONENTS.index(FLANK_5P), window))
+        if GENE_COMPONENTS[component_id] == TERMINAL_EXON:
+            if reverse:
+                window = np.arange(start - flank_bases, start)[::-1]
+            else:
+                window = np.arange(end, end + flank_bases)
+            windows.append((GENE_COMPONENTS.index(FLANK_3P), window))
+        counted = False
+        for window_component_id, window in windows:
+            for bin_index, base in enumerate(window):
+                if base in base_labels:
+                    counts[window_component_id][bin_index, base_labels[base]] += 1
+                    counted = True
+        num_features += counted
+    return counts, num_features
+
+
+def test_get_gene_components():
+    result = get_gene_components(
+        [(100, 200), (400, 500), (800, 1000)],
+        [(150, 200), (400, 500), (800, 850)],
+        False,
+    )
+    assert result == [
+        (SPLICE_COMPONENTS[0], (100, 200)),
+        (SPLICE_COMPONENTS[1], (200, 400)),
+        (SPLICE_COMPONENTS[2], (400, 500)),
+        (SPLICE_COMPONENTS[5], (500, 800)),
+        (SPLICE_COMPONENTS[4], (800, 1000)),
+        (CODING_COMPONENTS[0], (100, 150)),
+        (CODING_COMPONENTS[3], (100, 150)),
+        (CODING_COMPONENTS[4], (150, 200)),
+        (CODING_COMPONENTS[5], (800, 850)),
+        (CODING_COMPONENTS[6], (850, 1000)),
+        (CODING_COMPONENTS[9], (850, 1000)),
+    ]
+
+
+def test_get_gene_components_reverse():
+    result = get_gene_components(
+        [(200, 300), (0, 100), (400, 500)], [(400, 450), (250, 300)], True
+    )
+    assert result == [
+        (SPLICE_COMPONENTS[0], (400, 500)),
+        (SPLICE_COMPONENTS[1], (300, 400)),
+        (SPLICE_COMPONENTS[2], (200, 300)),
+        (SPLICE_COMPONENTS[5], (100, 200)),
+        (SPLICE_COMPONENTS[4], (0, 100)),
+        (CODING_COMPONENTS[0], (450, 500)),
+        (CODING_COMPONENTS[3], (450, 500)),
+        (CODING_COMPONENTS[4], (400, 450)),
+        (CODING_COMPONENTS[5], (250, 300)),
+        (CODING_COMPONENTS[6], (200, 250)),
+        (CODING_COMPONENTS[8], (100, 200)),
+        (CODING_COMPONENTS[9], (0, 100)),
+    ]
+
+
+def test_get_gene_components_noncoding_single_exon():
+    result = get_gene_components([(10, 20)], [], False)
+    assert result == [(INITIAL_EXON, (10, 20)), (TERMINAL_EXON, (10, 20))]
+
+
+def test_gene_model_from_index(gene_model):
+    assert gene_model.chroms == ["chr1", "chr2"]
+    assert gene_model.chrom_ids.tolist() == [0] * 13 + [1] * 4
+    assert gene_model.starts.tolist() == sorted(gene_model.starts[:13].tolist()) + [
+        2000,
+        2100,
+        2100,
+        2500,
+    ]
+    assert gene_model.get_chrom_slices() == {
+        "chr1": slice(0, 13),
+        "chr2": slice(13, 17),
+    }
+    chr2 = slice(13, 17)
+    assert gene_model.reverse[chr2].all()
+    assert [GENE_COMPONENTS[i] for i in gene_model.component_ids[chr2]] == [
+        TERMINAL_EXON,
+        "initial intron (%d bp)",
+        "terminal intron (%d bp)",
+        INITIAL_EXON,
+    ]
+
+
+def test_gene_model_get_component_names(gene_model):
+    result = gene_model.get_component_names(300)
+    assert result[:4] == [
+        "5' flanking: 300 bp",
+        "initial exon (80 bp)",
+        "initial intron (300 bp)",
+        "internal exons (100 bp)",
+    ]
+    assert result[GENE_COMPONENTS.index(CODING_COMPONENTS[1])] == CODING_COMPONENTS[1]
+
+
+def test_load_gene_model_gtf_index(mocker, tmp_path):
+    path = str(tmp_path / "gtf_index.npz")
+    GtfIndex.from_gtf(StringIO(initial_value=make_gtf(GTF_ROWS)), get_digest(GTF)).save(
+        path
+    )
+    read_gtf = mocker.patch("segway_pipeline.feature_aggregation.read_gtf_index")
+    result = load_gene_model(GTF, gtf_index=path)
+    read_gtf.assert_not_called()
+    assert result.chroms == ["chr1", "chr2"]
+    assert len(result) == 17
+
+
+def test_load_gene_model_gtf_index_digest_mismatch(tmp_path):
+    path = str(tmp_path / "gtf_index.npz")
+    GtfIndex.from_gtf(StringIO(initial_value=make_gtf(GTF_ROWS)), "other").save(path)
+    with pytest.raises(ValueError):
+        load_gene_model(GTF, gtf_index=path)
+
+
+@pytest.mark.parametrize("num_bins", [25, 50])
+def test_get_inner_positions(num_bins):
+    starts = np.array([0, 1234, 99999, 7])
+    ends = np.array([25, 5678, 123457, 507])
+    reverse = np.array([False, True, False, True])
+    result = get_inner_positions(starts, ends, reverse, num_bins)
+    for i in range(len(starts)):
+        window = np.linspace(starts[i], ends[i], num_bins, endpoint=False)
+        expected = np.round(window).astype(int)
+        if reverse[i]:
+            expected = expected[::-1]
+        assert result[i].tolist() == expected.tolist()
+
+
+def test_add_position_counts():
+    segments = (np.array([10, 20]), np.array([15, 30]), np.array([1, 0]))
+    counts = np.zeros((3, 2), dtype=np.int64)
+    positions = np.array([[10, 15, 29], [0, 1, 2], [14, 20, 30]])
+    result = add_position_counts(counts, positions, segments, 2)
+    assert result.tolist() == [True, False, True]
+    assert counts.tolist() == [[0, 2], [1, 0], [1, 0]]
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_add_flank_counts(reverse):
+    segments = (
+        np.array([10, 20, 40, 41]),
+        np.array([15, 30, 40, 50]),
+        np.array([1, 0, 2, 2]),
+    )
+    flank_starts = np.array([-5, 12, 25, 40, 100, 5])
+    flip = np.array([reverse] * 5 + [not reverse])
+    counts = np.zeros((10, 3), dtype=np.int64)
+    result = add_flank_counts(counts, flank_starts, flip, segments, 3)
+    positions = flank_starts[:, np.newaxis] + np.arange(10)
+    positions[flip] = positions[flip, ::-1]
+    expected = np.zeros((10, 3), dtype=np.int64)
+    expected_covered = add_position_counts(expected, positions, segments, 3)
+    assert result.tolist() == expected_covered.tolist()
+    assert counts.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("flank_bases", [0, 30, 300])
+def test_aggregate(segmentation, gene_model, flank_bases):
+    counts, num_features = aggregate(segmentation, gene_model, flank_bases)
+    expected_counts, expected_num_features = get_expected_counts(
+        segmentation, gene_model, flank_bases
+    )
+    assert num_features == expected_num_features
+    for component_counts, expected in zip(counts, expected_counts):
+        assert component_counts.tolist() == expected.tolist()
+
+
+def test_write_feature_aggregation(segmentation):
+    bins = get_component_bins(2)
+    counts = [np.zeros((num_bins, 3), dtype=np.int64) for num_bins in bins]
+    counts[0][:] = [[1, 2, 3], [4, 5, 6]]
+    names = [component.replace("%d", "9") for component in GENE_COMPONENTS]
+    output = StringIO()
+    write_feature_aggregation(segmentation, names, counts, 7, output)
+    lines = output.getvalue().splitlines()
+    assert lines[0] == "# num_features=7 spacers=8 0=335 1=770 2=850"
+    assert lines[1] == "group\tcomponent\toffset\t0\t1\t2"
+    assert lines[2:5] == [
+        "genes\t5' flanking: 9 bp\t-2\t2\t1\t3",
+        "genes\t5' flanking: 9 bp\t-1\t5\t4\t6",
+        "genes\tinitial exon (9 bp)\t0\t0\t0\t0",
+    ]
+    assert len(lines) == 2 + sum(bins)
+
+
+def md5sum(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_main(mocker, tmp_path):
+    """
+    The checksum is that of the segtools output for the same inputs in the
+    integration tests.
+    """
+    testargs = ["prog", "tests/data/segway.bed.gz", GTF, "-o", str(tmp_path / "out")]
+    mocker.patch("sys.argv", testargs + ["--flank-bases", "500"])
+    main()
+    assert md5sum(tmp_path / "out" / "feature_aggregation.tab") == (
+        "ebaedfa804b5a15c88851eb5986e8538"
+    )
+
+
+def test_main_gtf_index(mocker, tmp_path):
+    gtf_index = str(tmp_path / "gtf_index.npz")
+    read_gtf_index(GTF).save(gtf_index)
+    testargs = ["prog", "tests/data/segway.bed.gz", GTF, "-o", str(tmp_path / "out")]
+    mocker.patch("sys.argv", testargs + ["-f", "500", "--gtf-index", gtf_index])
+    main()
+    assert md5sum(tmp_path / "out" / "feature_aggregation.tab") == (
+        "ebaedfa804b5a15c88851eb5986e8538"
+    )
+
+
+def test_main_layout_matches_segtools(mocker, tmp_path):
+    """
+    The test table is for a different BED and GTF, so only compare the rows and
+    columns, ignoring the labels and the lengths in the component names.
+    """
+    testargs = ["prog", "tests/data/segway.bed.gz", GTF, "-o", str(tmp_path)]
+    mocker.patch("sys.argv", testargs + ["-f", "10000"])
+    main()
+
+    def get_layout(path):
+        with open(path) as f:
+            metadata = [field.split("=")[0] for field in f.readline().split()]
+            rows = [line.split("\t", 3)[:3] for line in f]
+        for row in rows:
+            row[1] = re.sub(r"\d+ bp", "N bp", row[1])
+        return metadata[:3], rows
+
+    result = get_layout(tmp_path / "feature_aggregation.tab")
+    assert result == get_layout("tests/data/feature_aggregation.tab")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from segway_pipeline.genomedata_cache import GenomedataCache, file_digest
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text("chr1\t1000\n")
+    f1 = tmp_path / "f1.bigWig"
+    f1.write_bytes(b"foo")
+    f2 = tmp_path / "f2.bigWig"
+    f2.write_bytes(b"bar")
+    return str(sizes), [("f1", str(f1)), ("f2", str(f2))]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GenomedataCache(str(tmp_path / "cache"), max_size=100)
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"foo" * 1000000)
+    assert file_digest(str(path)) == hashlib.sha256(b"foo" * 1000000).hexdigest()
+
+
+def test_genomedata_cache_make_key_is_stable(inputs):
+    sizes, tracks = inputs
+    key = GenomedataCache.make_key(tracks, sizes)
+    assert key == GenomedataCache.make_key(tracks, sizes, num_processes=2)
+
+
+def test_genomedata_cache_make_key_ignores_paths(inputs, tmp_path):
+    sizes, tracks = inputs
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+    copied_tracks = []
+    for trackname, file in tracks:
+        copied = other_dir / os.path.basename(file)
+        shutil.copyfile(file, copied)
+        copied_tracks.append((trackname, str(copied)))
+    key = GenomedataCache.make_key(copied_tracks, sizes)
+    assert key == GenomedataCache.make_key(tracks, sizes)
+
+
+def test_genomedata_cache_make_key_depends_on_inputs(inputs):
+    sizes, tracks = inputs
+    key = GenomedataCache.make_key(tracks, sizes)
+    assert key != GenomedataCache.make_key(tracks[::-1], sizes)
+    assert key != GenomedataCache.make_key([("g1", tracks[0][1]), tracks[1]], sizes)
+    assert key != GenomedataCache.make_key(tracks[:1], sizes)
+    assert key != GenomedataCache.make_key(tracks, sizes, read_bigwigs=True)
+    with open(tracks[0][1], "ab") as f:
+        f.write(b"baz")
+    assert key != GenomedataCache.make_key(tracks, sizes)
+
+
+def test_genomedata_cache_get_miss(cache, tmp_path):
+    outfile = tmp_path / "out.genomedata"
+    assert not cache.get("foo", str(outfile))
+    assert not outfile.exists()
+
+
+def test_genomedata_cache_put_get(cache, tmp_path):
+    built = tmp_path / "built.genomedata"
+    built.write_bytes(b"archive")
+    cache.put("foo", str(built))
+    outfile = tmp_path / "out.genomedata"
+    assert cache.get("foo", str(outfile))
+    assert outfile.read_bytes() == b"archive"
+    assert os.listdir(cache.path) == ["foo.genomedata"]
+
+
+def test_genomedata_cache_evicts_least_recently_used(cache, tmp_path):
+    built = tmp_path / "built.genomedata"
+    built.write_bytes(b"x" * 40)
+    for key in ("a", "b"):
+        cache.put(key, str(built))
+    os.utime(os.path.join(cache.path, "a.genomedata"), (100, 100))
+    os.utime(os.path.join(cache.path, "b.genomedata"), (200, 200))
+    assert cache.get("a", str(tmp_path / "out.genomedata"))
+    cache.put("c", str(built))
+    assert sorted(os.listdir(cache.path)) == ["a.genomedata", "c.genomedata"]
+
+
+def test_genomedata_cache_keeps_new_entry_larger_than_max_size(cache, tmp_path):
+    built = tmp_path / "built.genomedata"
+    built.write_bytes(b"x" * 40)
+    cache.put("a", str(built))
+    built.write_bytes(b"x" * 200)
+    cache.put("b", str(built))
+    assert os.listdir(cache.path) == ["b.genomedata"]
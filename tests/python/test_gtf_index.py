@@ -0,0 +1,120 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.gtf_index import GtfIndex, get_digest, main
+
+GTF = "tests/data/gencode.v29.primary_assembly.annotation_UCSC_names_chr19.gtf.gz"
+GTF_DATA = (
+    "##format: gtf\n"
+    'chr1\tTEST\tgene\t101\t1000\t.\t+\t.\tgene_id "A";\n'
+    'chr1\tTEST\ttranscript\t101\t1000\t.\t+\t.\tgene_id "A"; transcript_id "A.1";\n'
+    'chr1\tTEST\texon\t101\t200\t.\t+\t.\tgene_id "A"; transcript_id "A.1";\n'
+    'chr1\tTEST\tCDS\t151\t200\t.\t+\t.\tgene_id "A"; transcript_id "A.1";\n'
+    'chr1\tTEST\texon\t801\t1000\t.\t+\t.\tgene_id "A"; transcript_id "A.1";\n'
+    'chr2\tTEST\texon\t2501\t2600\t.\t-\t.\tgene_id "B"; transcript_id "B.1";\n'
+    'chr2\tTEST\texon\t2001\t2100\t.\t-\t.\tgene_id "B"; transcript_id "B.1";\n'
+    'chr1\tTEST\texon\t51\t90\t.\t-\t.\tgene_id "C"; transcript_id "C.1";\n'
+    'chr1\tTEST\texon\t11\t20\t.\t+\t.\tgene_id "C"; transcript_id "C.2";\n'
+)
+
+
+@pytest.fixture
+def gtf_index():
+    return GtfIndex.from_gtf(StringIO(initial_value=GTF_DATA), "digest")
+
+
+def test_gtf_index_from_gtf(gtf_index):
+    assert gtf_index.digest == "digest"
+    assert gtf_index.chroms == ["chr1", "chr2"]
+    assert gtf_index.gene_ids.tolist() == ["A", "B", "C"]
+    assert gtf_index.transcript_ids.tolist() == ["A.1", "B.1", "C.1", "C.2"]
+    assert gtf_index.transcript_genes.tolist() == [0, 1, 2, 2]
+    exons = gtf_index.features["exon"]
+    assert exons["starts"].tolist() == [100, 800, 10, 50, 2500, 2000]
+    assert exons["ends"].tolist() == [200, 1000, 20, 90, 2600, 2100]
+    assert exons["ids"].tolist() == [0, 0, 3, 2, 1, 1]
+    assert exons["offsets"].tolist() == [0, 3, 4, 4, 6]
+    assert gtf_index.features["CDS"]["offsets"].tolist() == [0, 1, 1, 1, 1]
+    assert gtf_index.features["gene"]["ids"].tolist() == [0]
+
+
+def test_gtf_index_from_gtf_attribute_with_hash():
+    gtf = 'chr1\tTEST\texon\t101\t200\t.\t+\t.\tgene_id "A#1"; transcript_id "A#1.1";\n'
+    gtf_index = GtfIndex.from_gtf(StringIO(initial_value=gtf), "digest")
+    assert gtf_index.gene_ids.tolist() == ["A#1"]
+    assert gtf_index.transcript_ids.tolist() == ["A#1.1"]
+
+
+def test_gtf_index_from_gtf_transcript_spans(gtf_index):
+    """
+    B.1 has no transcript row, so it spans its exons.
+    """
+    transcripts = gtf_index.features["transcript"]
+    assert transcripts["starts"].tolist() == [100, 10, 50, 2000]
+    assert transcripts["ends"].tolist() == [1000, 20, 90, 2600]
+    assert transcripts["ids"].tolist() == [0, 3, 2, 1]
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        'chr1\tTEST\tgene\t1\t10\t.\t.\t.\tgene_id "A";',
+        'chr1\tTEST\tgene\t1\t10\t.\t+\t.\tgene_name "A";',
+        'chr1\tTEST\texon\t1\t10\t.\t+\t.\tgene_id "A";',
+        "chr1\tTEST\texon\t1\t10\t.\t+\t.",
+        'chr1\tTEST\texon\t1\t10\t.\t-\t.\tgene_id "A"; transcript_id "A.1";',
+    ],
+)
+def test_gtf_index_from_gtf_invalid(row):
+    gtf = 'chr1\tTEST\texon\t21\t30\t.\t+\t.\tgene_id "A"; transcript_id "A.1";\n'
+    with pytest.raises(ValueError):
+        GtfIndex.from_gtf(StringIO(initial_value=gtf + row + "\n"), "")
+
+
+def test_gtf_index_save_load(tmp_path, gtf_index):
+    path = str(tmp_path / "gtf_index.npz")
+    gtf_index.save(path)
+    result = GtfIndex.load(path)
+    assert result.digest == gtf_index.digest
+    assert result.chroms == gtf_index.chroms
+    assert result.gene_ids.tolist() == gtf_index.gene_ids.tolist()
+    assert result.transcript_ids.tolist() == gtf_index.transcript_ids.tolist()
+    assert isinstance(result.features["exon"]["starts"], np.memmap)
+    for feature, arrays in gtf_index.features.items():
+        for name, array in arrays.items():
+            assert result.features[feature][name].dtype == array.dtype
+            assert result.features[feature][name].tolist() == array.tolist()
+
+
+def test_gtf_index_get(gtf_index):
+    starts, ends, ids = gtf_index.get("exon", "chr2", "-")
+    assert (starts.tolist(), ends.tolist(), ids.tolist()) == (
+        [2500, 2000],
+        [2600, 2100],
+        [1, 1],
+    )
+    assert gtf_index.get("exon", "chr2", "+")[0].tolist() == []
+    assert gtf_index.get("exon", "chr3", "+")[0].tolist() == []
+
+
+def test_gtf_index_get_groups(gtf_index):
+    assert gtf_index.get_groups("exon").tolist() == [0, 0, 0, 1, 3, 3]
+
+
+def test_get_digest(tmp_path):
+    path = tmp_path / "genes.gtf"
+    path.write_text(GTF_DATA)
+    assert get_digest(str(path)) != get_digest(GTF)
+    assert len(get_digest(str(path))) == 64
+
+
+def test_main(mocker, tmp_path):
+    outfile = tmp_path / "gencode.gtfindex.npz"
+    mocker.patch("sys.argv", ["prog", GTF, "-o", str(outfile)])
+    main()
+    result = GtfIndex.load(str(outfile))
+    assert result.digest == get_digest(GTF)
+    assert result.chroms == ["chr19"]
+    assert len(result.features["gene"]["ids"]) == len(result.gene_ids)
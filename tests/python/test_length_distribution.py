@@ -0,0 +1,107 @@
+import hashlib
+from io import StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.length_distribution import (
+    SegmentLengths,
+    get_label_order,
+    get_size_row,
+    main,
+    write_length_distribution,
+    write_segment_sizes,
+)
+
+BED_DATA = (
+    "chr19\t0\t100\t7\t1000\t.\t0\t100\t102,102,102\n"
+    "chr19\t100\t300\t1\t1000\t.\t100\t300\t217,95,2\n"
+    "chr19\t300\t700\t7\t1000\t.\t300\t700\t102,102,102\n"
+    "chr2\t0\t300\t1\t1000\t.\t0\t300\t217,95,2\n"
+    "chr2\t300\t400\t7\t1000\t.\t300\t400\t102,102,102\n"
+)
+
+
+@pytest.fixture
+def segment_lengths():
+    return SegmentLengths.from_bed(StringIO(initial_value=BED_DATA))
+
+
+def test_segment_lengths_from_bed(segment_lengths):
+    assert segment_lengths.labels == ["7", "1"]
+    assert list(segment_lengths.groups) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert segment_lengths.get(0).tolist() == [100, 400, 100]
+    assert segment_lengths.get(1).tolist() == [200, 300]
+    assert segment_lengths.get().tolist() == [100, 400, 200, 100, 300]
+
+
+def test_segment_lengths_from_bed_blocks(mocker, segment_lengths):
+    mocker.patch(
+        "segway_pipeline.segmentation.read_blocks",
+        side_effect=lambda f: ([line] for line in f),
+    )
+    result = SegmentLengths.from_bed(StringIO(initial_value=BED_DATA))
+    assert result.labels == segment_lengths.labels
+    assert result.get().tolist() == segment_lengths.get().tolist()
+
+
+def test_segment_lengths_from_bed_empty():
+    with pytest.raises(ValueError):
+        SegmentLengths.from_bed(StringIO())
+
+
+def test_write_length_distribution(segment_lengths):
+    output = StringIO()
+    write_length_distribution(segment_lengths, output)
+    assert output.getvalue() == (
+        "label\tlength\n7\t100\n7\t400\n7\t100\n1\t200\n1\t300\n"
+    )
+
+
+def test_write_segment_sizes(segment_lengths):
+    output = StringIO()
+    write_segment_sizes(segment_lengths, output)
+    assert output.getvalue() == (
+        "label\tnum.segs\tmean.len\tmedian.len\tstdev.len\tnum.bp\tfrac.bp\n"
+        "all\t5\t220.000\t200.000\t116.619\t1100\t1.000\n"
+        "1\t2\t250.000\t250.000\t50.000\t500\t0.455\n"
+        "7\t3\t200.000\t100.000\t141.421\t600\t0.545\n"
+    )
+
+
+def test_write_segment_sizes_header_matches_segtools(segment_lengths):
+    output = StringIO()
+    write_segment_sizes(segment_lengths, output)
+    with open("tests/data/segment_sizes.tab") as f:
+        expected = f.readline()
+    assert output.getvalue().splitlines(keepends=True)[0] == expected
+
+
+def test_get_size_row():
+    result = get_size_row("4", np.array([1000, 3000, 500, 1500]), 12000)
+    assert result == ["4", "4", "1500.000", "1250.000", "935.414", "6000", "0.500"]
+
+
+def test_get_label_order():
+    assert get_label_order(["10", "2", "QUI", "0"]) == [3, 1, 0, 2]
+
+
+def md5sum(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_main(mocker, tmp_path):
+    """
+    The checksums are those of the segtools outputs for the same BED in the
+    integration tests.
+    """
+    testargs = ["prog", "tests/data/segway.bed.gz", "-o", str(tmp_path / "out")]
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert md5sum(tmp_path / "out" / "length_distribution.tab") == (
+        "bad9d914dbf02def5e15095508a145a4"
+    )
+    assert md5sum(tmp_path / "out" / "segment_sizes.tab") == (
+        "e1c15936ff0a14d3524b0cd6d160c88b"
+    )
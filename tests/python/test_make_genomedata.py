@@ -1,10 +1,29 @@
+import json
+import os
+import stat
 import subprocess
 from contextlib import suppress as does_not_raise
 from typing import List
 
+import numpy as np
+import pyBigWig
 import pytest
+import tables
 
-from segway_pipeline.make_genomedata import get_parser, main, make_command
+from segway_pipeline.genomedata_cache import GenomedataCache
+from segway_pipeline.make_genomedata import (
+    assemble_genomedata,
+    get_parser,
+    get_tracks,
+    load_chromosome,
+    load_track,
+    main,
+    make_command,
+    make_genomedata,
+    read_tracknames,
+    update_genomedata,
+    write_tracks,
+)
 
 
 def test_make_command():
@@ -32,6 +51,14 @@ def test_make_command():
         (["--sizes", "ch.sizes", "-o", "outfile"], pytest.raises(SystemExit)),
         (["--files", "b.bw", "-o", "outfile"], pytest.raises(SystemExit)),
         (["--sizes", "ch.sizes", "--files", "b.bw"], pytest.raises(SystemExit)),
+        (
+            ["--sizes", "ch.sizes", "--files", "b.bw", "-o", "outfile", "-p", "4"],
+            does_not_raise(),
+        ),
+        (
+            ["--sizes", "s", "--files", "b.bw", "-o", "out", "--existing-archive", "a"],
+            does_not_raise(),
+        ),
     ],
 )
 def test_get_parser(args: List[str], condition):
@@ -41,15 +68,13 @@ def test_get_parser(args: List[str], condition):
 
 
 def test_main(mocker):
-    """
-    The assert looks a little wonky here. The first index extracts the args of the call,
-    and the second extracts the first positional arg.
-    """
-    mocker.patch("subprocess.run")
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
     testargs = ["prog", "--files", "ref.bw", "--sizes", "chrom.sizes", "-o", "out.file"]
     mocker.patch("sys.argv", testargs)
     main()
-    assert subprocess.run.call_args[0] == (
+    from segway_pipeline.make_genomedata import run_command
+
+    run_command.assert_called_once_with(
         [
             "genomedata-load",
             "-s",
@@ -58,5 +83,367 @@ def test_main(mocker):
             "-t",
             "ref=ref.bw",
             "out.file",
+        ]
+    )
+
+
+def test_main_writes_metrics(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    metrics = tmp_path / "metrics.json"
+    testargs = ["prog", "--files", "ref.bw", "--sizes", "sizes", "-o", "out"]
+    mocker.patch("sys.argv", testargs + ["--metrics-outfile", str(metrics)])
+    main()
+    result = json.loads(metrics.read_text())
+    assert result["command"] == testargs + ["--metrics-outfile", str(metrics)]
+    assert result["returncode"] == 0
+    assert result["wall_seconds"] >= 0
+
+
+def test_main_writes_metrics_on_failure(mocker, tmp_path):
+    mocker.patch(
+        "segway_pipeline.make_genomedata.run_command",
+        side_effect=subprocess.CalledProcessError(1, "genomedata-load"),
+    )
+    metrics = tmp_path / "metrics.json"
+    testargs = ["prog", "--files", "ref.bw", "--sizes", "sizes", "-o", "out"]
+    mocker.patch("sys.argv", testargs + ["--metrics-outfile", str(metrics)])
+    with pytest.raises(subprocess.CalledProcessError):
+        main()
+    assert json.loads(metrics.read_text())["returncode"] == 1
+
+
+def test_main_with_cache(mocker, tmp_path):
+    def build(command):
+        with open(command[-1], "w") as f:
+            f.write("archive")
+
+    mocker.patch("segway_pipeline.make_genomedata.run_command", side_effect=build)
+    bigwig = tmp_path / "ref.bw"
+    bigwig.write_text("signal")
+    sizes = tmp_path / "sizes"
+    sizes.write_text("chr1\t1000\n")
+    cache_dir = tmp_path / "cache"
+    for outfile in ("out1", "out2"):
+        mocker.patch(
+            "sys.argv",
+            [
+                "prog",
+                "--files",
+                str(bigwig),
+                "--sizes",
+                str(sizes),
+                "-o",
+                str(tmp_path / outfile),
+                "--cache-dir",
+                str(cache_dir),
+            ],
+        )
+        main()
+    from segway_pipeline.make_genomedata import run_command
+
+    assert run_command.call_count == 1
+    assert (tmp_path / "out2").read_text() == "archive"
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_make_genomedata_cache_hit(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    mocker.patch("segway_pipeline.make_genomedata.make_genomedata_parallel")
+    cache = mocker.create_autospec(GenomedataCache, instance=True)
+    cache.make_key.return_value = "key"
+    cache.get.return_value = True
+    make_genomedata(["f1.bw"], "sizes", "out", num_processes=2, cache=cache)
+    cache.make_key.assert_called_once_with([("f1", "f1.bw")], "sizes", 2, False)
+    cache.get.assert_called_once_with("key", "out")
+    cache.put.assert_not_called()
+    from segway_pipeline.make_genomedata import make_genomedata_parallel, run_command
+
+    make_genomedata_parallel.assert_not_called()
+    run_command.assert_not_called()
+
+
+def test_make_genomedata_existing_archive_not_cached(mocker):
+    update_genomedata = mocker.patch(
+        "segway_pipeline.make_genomedata.update_genomedata"
+    )
+    cache = mocker.create_autospec(GenomedataCache, instance=True)
+    cache.make_key.return_value = "key"
+    cache.get.return_value = False
+    make_genomedata(["f1.bw"], "sizes", "out", cache=cache, existing_archive="a")
+    update_genomedata.assert_called_once_with(["f1.bw"], "a", "out")
+    cache.get.assert_called_once_with("key", "out")
+    cache.put.assert_not_called()
+
+
+def test_main_parallel(mocker):
+    mocker.patch("segway_pipeline.make_genomedata.make_genomedata_parallel")
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    testargs = ["prog", "--files", "ref.bw", "--sizes", "sizes", "-o", "out", "-p", "4"]
+    mocker.patch("sys.argv", testargs)
+    main()
+    from segway_pipeline.make_genomedata import make_genomedata_parallel
+
+    from segway_pipeline.make_genomedata import run_command
+
+    make_genomedata_parallel.assert_called_once_with(
+        ["ref.bw"], "sizes", "out", 4, False
+    )
+    run_command.assert_not_called()
+
+
+def test_main_read_bigwigs(mocker):
+    mocker.patch("segway_pipeline.make_genomedata.make_genomedata_parallel")
+    testargs = ["prog", "--files", "ref.bw", "--sizes", "sizes", "-o", "out"]
+    mocker.patch("sys.argv", testargs + ["--read-bigwigs"])
+    main()
+    from segway_pipeline.make_genomedata import make_genomedata_parallel
+
+    make_genomedata_parallel.assert_called_once_with(
+        ["ref.bw"], "sizes", "out", 1, True
+    )
+
+
+def test_get_tracks():
+    result = get_tracks(["/data/f1.bigwig", "f2.bw"])
+    assert result == [("f1", "/data/f1.bigwig"), ("f2", "f2.bw")]
+
+
+def test_load_chromosome(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    mocker.patch("segway_pipeline.make_genomedata.load_track")
+    tracks = [("f1", "f1.bw"), ("f2", "f2.bw")]
+    result = load_chromosome("chr1", 1000, tracks, str(tmp_path))
+    archive = str(tmp_path / "chr1")
+    assert result == ("chr1", os.path.join(archive, "chr1.genomedata"))
+    assert (tmp_path / "chr1.sizes").read_text() == "chr1\t1000\n"
+    from segway_pipeline.make_genomedata import run_command
+
+    assert [i[0][0] for i in run_command.call_args_list] == [
+        [
+            "genomedata-load-seq",
+            "--sizes",
+            "--directory-mode",
+            archive,
+            str(tmp_path / "chr1.sizes"),
         ],
+        ["genomedata-open-data", archive, "--tracknames", "f1", "f2"],
+        ["genomedata-close-data", archive],
+    ]
+    from segway_pipeline.make_genomedata import load_track as mock_load_track
+
+    assert mock_load_track.call_args_list == [
+        mocker.call("chr1", "f1.bw", archive, "f1"),
+        mocker.call("chr1", "f2.bw", archive, "f2"),
+    ]
+
+
+def test_load_chromosome_read_bigwigs(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    mocker.patch("segway_pipeline.make_genomedata.load_track")
+    mocker.patch("segway_pipeline.make_genomedata.write_tracks")
+    tracks = [("f1", "f1.bw"), ("f2", "f2.bw")]
+    _, chrom_file = load_chromosome("chr1", 1000, tracks, str(tmp_path), True)
+    from segway_pipeline.make_genomedata import load_track as mock_load_track
+    from segway_pipeline.make_genomedata import write_tracks as mock_write_tracks
+
+    mock_write_tracks.assert_called_once_with("chr1", tracks, chrom_file)
+    mock_load_track.assert_not_called()
+
+
+@pytest.fixture
+def fake_tools(tmp_path, monkeypatch):
+    """
+    Stand-ins for `bigWigToBedGraph`, which prints the contents of the "bigWig", and
+    `genomedata-load-data`, which copies its input to a file named after the track.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    scripts = {
+        "bigWigToBedGraph": 'shift $(($# - 2)); cat "$1" > "$2"',
+        "genomedata-load-data": 'cat > "$1/$2.loaded"',
+    }
+    for name, script in scripts.items():
+        path = bin_dir / name
+        path.write_text(f"#!/bin/sh\nset -e\n{script}\n")
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return bin_dir
+
+
+def test_load_track(fake_tools, tmp_path):
+    data = "chr1\t0\t10\t1.5\n" * 100000
+    bigwig = tmp_path / "f1.bw"
+    bigwig.write_text(data)
+    load_track("chr1", str(bigwig), str(tmp_path), "f1")
+    assert (tmp_path / "f1.loaded").read_text() == data
+
+
+def test_load_track_whole_bigwig(fake_tools, tmp_path):
+    data = "chr1\t0\t10\t1.5\nchr2\t0\t10\t2.5\n"
+    bigwig = tmp_path / "f1.bw"
+    bigwig.write_text(data)
+    load_track(None, str(bigwig), str(tmp_path), "f1")
+    assert (tmp_path / "f1.loaded").read_text() == data
+
+
+def test_load_track_no_data_skips_loading(fake_tools, tmp_path):
+    bigwig = tmp_path / "f1.bw"
+    bigwig.write_text("")
+    load_track("chr1", str(bigwig), str(tmp_path), "f1")
+    assert not (tmp_path / "f1.loaded").exists()
+
+
+def test_load_track_reader_fails_raises(fake_tools, tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        load_track("chr1", str(tmp_path / "missing.bw"), str(tmp_path), "f1")
+
+
+def test_load_track_loader_fails_raises(fake_tools, tmp_path):
+    (fake_tools / "genomedata-load-data").write_text("#!/bin/sh\nexit 1\n")
+    bigwig = tmp_path / "f1.bw"
+    bigwig.write_text("chr1\t0\t10\t1.5\n" * 100000)
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        load_track("chr1", str(bigwig), str(tmp_path), "f1")
+    assert e.value.cmd[0] == "genomedata-load-data"
+
+
+def make_directory_mode_file(path, chrom_end, data):
+    """
+    Mimics the layout `genomedata-load-seq -d` gives each chromosome's file.
+    """
+    with tables.open_file(str(path), "w") as h5file:
+        root = h5file.root
+        root._v_attrs.genomedata_format_version = 1
+        root._v_attrs.tracknames = np.array([b"f1", b"f2"])
+        root._v_attrs.start = 0
+        root._v_attrs.end = chrom_end
+        root._v_attrs.sums = data.sum(axis=0)
+        supercontig = h5file.create_group(root, "supercontig_0")
+        supercontig._v_attrs.start = 0
+        supercontig._v_attrs.end = chrom_end
+        h5file.create_array(supercontig, "continuous", data)
+
+
+def test_assemble_genomedata(tmp_path):
+    chr1 = np.arange(20, dtype=np.float32).reshape(10, 2)
+    chr2 = np.ones((4, 2), dtype=np.float32)
+    make_directory_mode_file(tmp_path / "chr2.genomedata", 4, chr2)
+    make_directory_mode_file(tmp_path / "chr1.genomedata", 10, chr1)
+    outfile = tmp_path / "out.genomedata"
+    assemble_genomedata(
+        [str(tmp_path / "chr1.genomedata"), str(tmp_path / "chr2.genomedata")],
+        str(outfile),
+    )
+    with tables.open_file(str(outfile)) as h5file:
+        root = h5file.root
+        assert [group._v_name for group in h5file.iter_nodes(root)] == [
+            "chr1",
+            "chr2",
+        ]
+        assert sorted(root._v_attrs._f_list("user")) == [
+            "genomedata_format_version",
+            "tracknames",
+        ]
+        assert root._v_attrs.tracknames.tolist() == [b"f1", b"f2"]
+        assert sorted(root.chr1._v_attrs._f_list("user")) == ["end", "start", "sums"]
+        assert root.chr1._v_attrs.end == 10
+        assert root.chr1._v_attrs.sums.tolist() == [90.0, 100.0]
+        assert root.chr1.supercontig_0._v_attrs.end == 10
+        assert (root.chr1.supercontig_0.continuous.read() == chr1).all()
+        assert (root.chr2.supercontig_0.continuous.read() == chr2).all()
+
+
+def make_file_mode_archive(path, tracknames, data):
+    """
+    Mimics the layout of a closed `genomedata-load` archive, with the given data for
+    each chromosome.
+    """
+    with tables.open_file(str(path), "w") as h5file:
+        root = h5file.root
+        root._v_attrs.genomedata_format_version = 1
+        root._v_attrs.tracknames = np.array(tracknames)
+        for chrom, chrom_data in data.items():
+            group = h5file.create_group(root, chrom)
+            group._v_attrs.dirty = False
+            supercontig = h5file.create_group(group, "supercontig_0")
+            continuous = h5file.create_earray(
+                supercontig,
+                "continuous",
+                tables.Float32Atom(dflt=np.nan),
+                (len(chrom_data), 0),
+                chunkshape=(3, 1),
+            )
+            continuous.truncate(len(tracknames))
+            continuous[:] = chrom_data
+
+
+def test_update_genomedata(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    mocker.patch("segway_pipeline.make_genomedata.load_track")
+    mocker.patch("segway_pipeline.make_genomedata.repack")
+    # Copy chr1 in several blocks
+    mocker.patch("segway_pipeline.make_genomedata.COPY_CHUNK_ROWS", 4)
+    chr1 = np.arange(30, dtype=np.float32).reshape(10, 3)
+    chr2 = np.ones((4, 3), dtype=np.float32)
+    existing = tmp_path / "existing.genomedata"
+    make_file_mode_archive(
+        existing, [b"f1", b"f2", b"f3"], {"chr1": chr1, "chr2": chr2}
+    )
+    outfile = str(tmp_path / "out.genomedata")
+    update_genomedata(["f3.bw", "f4.bw", "f1.bw"], str(existing), outfile)
+    from segway_pipeline.make_genomedata import load_track, repack, run_command
+
+    assert run_command.call_args_list == [
+        mocker.call(["genomedata-open-data", outfile, "--tracknames", "f4"]),
+        mocker.call(["genomedata-close-data", outfile]),
+    ]
+    load_track.assert_called_once_with(None, "f4.bw", outfile, "f4")
+    repack.assert_called_once_with(outfile)
+    assert read_tracknames(outfile) == ["f1", "f3"]
+    assert read_tracknames(str(existing)) == ["f1", "f2", "f3"]
+    with tables.open_file(outfile) as h5file:
+        root = h5file.root
+        assert root.chr1._v_attrs.dirty
+        assert (root.chr1.supercontig_0.continuous.read() == chr1[:, [0, 2]]).all()
+        assert (root.chr2.supercontig_0.continuous.read() == chr2[:, [0, 2]]).all()
+        assert isinstance(root.chr1.supercontig_0.continuous, tables.EArray)
+
+
+def test_update_genomedata_no_changes(mocker, tmp_path):
+    mocker.patch("segway_pipeline.make_genomedata.run_command")
+    existing = tmp_path / "existing.genomedata"
+    make_file_mode_archive(existing, [b"f1"], {"chr1": np.ones((4, 1))})
+    outfile = tmp_path / "out.genomedata"
+    update_genomedata(["f1.bw"], str(existing), str(outfile))
+    from segway_pipeline.make_genomedata import run_command
+
+    run_command.assert_not_called()
+    assert outfile.read_bytes() == existing.read_bytes()
+
+
+def make_bigwig(path, chroms, entries):
+    bigwig = pyBigWig.open(str(path), "w")
+    bigwig.addHeader(chroms)
+    for chrom, start, end, value in entries:
+        bigwig.addEntries([chrom], [start], ends=[end], values=[value])
+    bigwig.close()
+
+
+def test_write_tracks(mocker, tmp_path):
+    # Read in several blocks
+    mocker.patch("segway_pipeline.make_genomedata.READ_BLOCK_SIZE", 4)
+    make_bigwig(
+        tmp_path / "f1.bw",
+        [("chr1", 10), ("chr2", 5)],
+        [("chr1", 2, 5, 1.5), ("chr1", 8, 10, 0.1)],
     )
+    make_bigwig(tmp_path / "f2.bw", [("chr2", 5)], [("chr2", 0, 5, 1.0)])
+    chrom_file = tmp_path / "chr1.genomedata"
+    make_directory_mode_file(chrom_file, 10, np.full((10, 2), np.nan, np.float32))
+    tracks = [("f2", str(tmp_path / "f2.bw")), ("f1", str(tmp_path / "f1.bw"))]
+    write_tracks("chr1", tracks, str(chrom_file))
+    with tables.open_file(str(chrom_file)) as h5file:
+        result = h5file.root.supercontig_0.continuous.read()
+    nan = np.nan
+    expected = [[nan] * 2 + [1.5] * 3 + [nan] * 3 + [0.1] * 2, [nan] * 10]
+    np.testing.assert_array_equal(result.T, np.array(expected, dtype=np.float32))
@@ -1,6 +1,8 @@
 import argparse
+import asyncio
 import builtins
 import json
+import os
 from contextlib import suppress as does_not_raise
 from typing import List
 
@@ -11,9 +13,13 @@ import respx
 from scripts.make_input_jsons_from_portal import (
     ArgHelper,
     Client,
+    ResponseCache,
     UrlJoiner,
     filter_by_status,
+    get_accession,
+    get_accessions,
     get_dnase_preferred_replicate,
+    get_epigenome_id,
     get_portal_files,
     main,
     make_input_json,
@@ -100,7 +106,7 @@ def test_main(mocker):
     original_file = {
         "@graph": [
             {
-                "@id": "tf_chip_1",
+                "@id": "/files/tf_chip_1/",
                 "assembly": "GRCh38",
                 "output_type": "fold change over control",
                 "file_format": "bigWig",
@@ -108,7 +114,8 @@ def test_main(mocker):
                 "cloud_metadata": {"url": "https://d.na/tf_chip_1"},
                 "status": "released",
             }
-        ]
+        ],
+        "total": 1,
     }
     respx.get(
         "https://www.encodeproject.org/sizes",
@@ -126,7 +133,7 @@ def test_main(mocker):
         status_code=200,
     )
     respx.get(
-        "https://www.encodeproject.org/search/?type=File&@id=/files/tf_chip_1/&frame=object",
+        "https://www.encodeproject.org/search/?type=File&dataset=exp1&frame=object&limit=1000&from=0",
         content=original_file,
         status_code=200,
     )
@@ -140,6 +147,175 @@ def test_main(mocker):
     }
 
 
+def mock_reference_epigenome(accession, assay_title="TF ChIP-seq"):
+    content = {
+        "related_datasets": [
+            {
+                "@id": f"{accession}_exp",
+                "assay_title": assay_title,
+                "replicates": [
+                    {"biological_replicate_number": 1, "status": "released"}
+                ],
+                "original_files": [f"/files/{accession}_1/"],
+            }
+        ]
+    }
+    original_file = {
+        "@graph": [
+            {
+                "@id": f"/files/{accession}_1/",
+                "assembly": "GRCh38",
+                "output_type": "fold change over control",
+                "file_format": "bigWig",
+                "biological_replicates": [1],
+                "cloud_metadata": {"url": f"https://d.na/{accession}_1"},
+                "status": "released",
+            }
+        ],
+        "total": 1,
+    }
+    respx.get(
+        f"https://www.encodeproject.org/reference-epigenomes/{accession}",
+        content=content,
+        status_code=200,
+    )
+    respx.get(
+        f"https://www.encodeproject.org/search/?type=File&dataset={accession}_exp&frame=object&limit=1000&from=0",
+        content=original_file,
+        status_code=200,
+    )
+
+
+@respx.mock
+def test_main_batch(mocker, tmp_path):
+    accessions_file = tmp_path / "accessions.txt"
+    accessions_file.write_text("foo\n\nreference-epigenomes/bar\nbaz\nfoo\n")
+    output_dir = tmp_path / "out"
+    mocker.patch(
+        "sys.argv",
+        [
+            "prog",
+            "--accessions-file",
+            str(accessions_file),
+            "-d",
+            str(output_dir),
+            "-j",
+            "2",
+            "-g",
+            "gtf",
+            "-c",
+            "sizes",
+        ],
+    )
+    sizes = respx.get(
+        "https://www.encodeproject.org/sizes",
+        content={"assembly": "GRCh38", "cloud_metadata": {"url": "bar"}},
+        status_code=200,
+    )
+    gtf = respx.get(
+        "https://www.encodeproject.org/gtf",
+        content={"cloud_metadata": {"url": "foo"}},
+        status_code=200,
+    )
+    mock_reference_epigenome("foo")
+    mock_reference_epigenome("bar")
+    respx.get(
+        "https://www.encodeproject.org/reference-epigenomes/baz",
+        content={},
+        status_code=404,
+    )
+    with pytest.raises(SystemExit):
+        main()
+    assert sizes.call_count == 1
+    assert gtf.call_count == 1
+    assert sorted(i.name for i in output_dir.iterdir()) == [
+        "bar.json",
+        "failures.json",
+        "foo.json",
+    ]
+    assert json.loads((output_dir / "foo.json").read_text()) == {
+        "segway.bigwigs": ["https://d.na/foo_1"],
+        "segway.annotation_gtf": "foo",
+        "segway.chrom_sizes": "bar",
+    }
+    failures = json.loads((output_dir / "failures.json").read_text())
+    assert list(failures) == ["baz"]
+    assert failures["baz"].startswith("HTTPError")
+
+
+@respx.mock
+def test_main_batch_no_failures(mocker):
+    mocker.patch(
+        "sys.argv",
+        ["prog", "--search-query", "status=released", "-g", "gtf", "-c", "sizes"],
+    )
+    respx.get(
+        "https://www.encodeproject.org/sizes",
+        content={"assembly": "GRCh38", "cloud_metadata": {"url": "bar"}},
+        status_code=200,
+    )
+    respx.get(
+        "https://www.encodeproject.org/gtf",
+        content={"cloud_metadata": {"url": "foo"}},
+        status_code=200,
+    )
+    respx.get(
+        "https://www.encodeproject.org/search/?type=ReferenceEpigenome&status=released&limit=all&field=accession",
+        content={"@graph": [{"accession": "foo"}]},
+        status_code=200,
+    )
+    mock_reference_epigenome("foo")
+    mocker.patch("builtins.open", mocker.mock_open())
+    mocker.patch("os.makedirs")
+    main()
+    assert builtins.open.call_args_list[0][0][0] == "./foo.json"
+    assert builtins.open.call_args_list[1][0][0] == "./failures.json"
+    assert json.loads(builtins.open.mock_calls[-2][1][0]) == {}
+
+
+@pytest.mark.parametrize(
+    "accession,expected",
+    [
+        ("ENCSR867OGI", "reference-epigenomes/ENCSR867OGI"),
+        ("reference-epigenomes/ENCSR867OGI", "reference-epigenomes/ENCSR867OGI"),
+    ],
+)
+def test_get_epigenome_id(accession, expected):
+    assert get_epigenome_id(accession) == expected
+
+
+@pytest.mark.parametrize(
+    "epigenome_id", ["ENCSR867OGI", "/reference-epigenomes/ENCSR867OGI/"]
+)
+def test_get_accession(epigenome_id):
+    assert get_accession(epigenome_id) == "ENCSR867OGI"
+
+
+@pytest.mark.parametrize(
+    "search_query,expected_query",
+    [
+        ("status=released", "type=ReferenceEpigenome&status=released&limit=all"),
+        ("type=Annotation&limit=10", "type=Annotation&limit=10"),
+    ],
+)
+@respx.mock
+def test_get_accessions_search_query(search_query, expected_query):
+    client = Client()
+    respx.get(
+        f"https://www.encodeproject.org/search/?{expected_query}&field=accession",
+        content={"@graph": [{"accession": "foo"}, {"accession": "bar"}]},
+        status_code=200,
+    )
+    result = client.run(get_accessions, client, None, search_query)
+    assert result == ["foo", "bar"]
+
+
+def test_get_accessions_requires_a_source():
+    client = Client()
+    with pytest.raises(ValueError):
+        client.run(get_accessions, client)
+
+
 @pytest.mark.parametrize(
     "condition,skip_assays",
     [(does_not_raise(), ["DNase-seq"]), (pytest.raises(ValueError), ["DNase"])],
@@ -183,6 +359,12 @@ def test_arg_helper_get_extra_props_from_args():
         (["-a", "accession", "-c", "sizes"], pytest.raises(SystemExit)),
         (["-a", "accession", "-g", "gtf"], pytest.raises(SystemExit)),
         (["-o", "outfile"], pytest.raises(SystemExit)),
+        (["--accessions-file", "f", "-g", "gtf", "-c", "sizes"], does_not_raise()),
+        (["--search-query", "q", "-g", "gtf", "-c", "sizes"], does_not_raise()),
+        (
+            ["-a", "accession", "--search-query", "q", "-g", "gtf", "-c", "sizes"],
+            pytest.raises(SystemExit),
+        ),
     ],
 )
 def test_arg_helper_get_parser(args: List[str], condition):
@@ -410,13 +592,18 @@ def test_get_portal_files(
 ):
     client = Client(base_url=urljoiner.base_url)
     respx.get(
-        urljoiner.resolve("/samtools-flagstats-quality-metrics/1/"),
-        content={"mapped": 10},
-        status_code=200,
-    )
-    respx.get(
-        urljoiner.resolve("/samtools-flagstats-quality-metrics/2/"),
-        content={"mapped": 2},
+        urljoiner.resolve(
+            "search/?type=SamtoolsFlagstatsQualityMetric"
+            "&@id=/samtools-flagstats-quality-metrics/1/"
+            "&@id=/samtools-flagstats-quality-metrics/2/&frame=object&limit=1000&from=0"
+        ),
+        content={
+            "@graph": [
+                {"@id": "/samtools-flagstats-quality-metrics/2/", "mapped": 2},
+                {"@id": "/samtools-flagstats-quality-metrics/1/", "mapped": 10},
+            ],
+            "total": 2,
+        },
         status_code=200,
     )
     with condition:
@@ -628,6 +815,213 @@ def test_client_get_json(condition, status_code, content):
         assert data == content
 
 
+def patch_sleep(mocker):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    mocker.patch("asyncio.sleep", sleep)
+    return delays
+
+
+@respx.mock
+def test_client_get_json_retries_network_errors(mocker):
+    delays = patch_sleep(mocker)
+    client = Client()
+    url = "https://www.encodeproject.org/data"
+    responses = [httpx.NetworkError("Connection reset"), {"foo": "bar"}]
+    pattern = respx.get(url, content=lambda **kwargs: responses.pop(0))
+    data = client.get_json(url)
+    assert data == {"foo": "bar"}
+    assert pattern.call_count == 2
+    assert delays == [0.5]
+
+
+@respx.mock
+def test_client_get_json_retries_server_errors_with_backoff(mocker):
+    delays = patch_sleep(mocker)
+    client = Client(max_retries=2)
+    url = "https://www.encodeproject.org/data"
+    pattern = respx.get(url, content={}, status_code=503)
+    with pytest.raises(httpx.HTTPError):
+        client.get_json(url)
+    assert pattern.call_count == 3
+    assert delays == [0.5, 1.0]
+
+
+@respx.mock
+def test_client_get_json_does_not_retry_client_errors(mocker):
+    delays = patch_sleep(mocker)
+    client = Client()
+    url = "https://www.encodeproject.org/data"
+    pattern = respx.get(url, content={}, status_code=404)
+    with pytest.raises(httpx.HTTPError):
+        client.get_json(url)
+    assert pattern.call_count == 1
+    assert delays == []
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache"), ttl=60)
+
+
+def test_response_cache_put_get(response_cache):
+    key = response_cache.make_key("https://www.encodeproject.org/foo")
+    assert response_cache.get(key) is None
+    response_cache.put(key, "https://www.encodeproject.org/foo", {"a": 1}, "etag")
+    entry = response_cache.get(key)
+    assert entry["body"] == {"a": 1}
+    assert entry["etag"] == "etag"
+    assert entry["url"] == "https://www.encodeproject.org/foo"
+
+
+def test_response_cache_make_key_depends_on_key_id():
+    url = "https://www.encodeproject.org/foo"
+    assert ResponseCache.make_key(url) == ResponseCache.make_key(url)
+    assert ResponseCache.make_key(url) != ResponseCache.make_key(url, "key")
+
+
+def test_response_cache_get_corrupt_entry_removes_it(response_cache):
+    key = response_cache.make_key("foo")
+    path = os.path.join(response_cache.path, f"{key}.json")
+    with open(path, "w") as f:
+        f.write("{")
+    assert response_cache.get(key) is None
+    assert not os.path.exists(path)
+
+
+def test_response_cache_is_fresh(mocker, response_cache):
+    mocker.patch("time.time", return_value=1000.0)
+    assert response_cache.is_fresh({"fetched_at": 950.0})
+    assert not response_cache.is_fresh({"fetched_at": 940.0})
+
+
+def test_response_cache_evicts_least_recently_used(response_cache):
+    keys = [response_cache.make_key(url) for url in ("a", "b", "c")]
+    for key, url in zip(keys[:2], ("a", "b")):
+        response_cache.put(key, url, {"foo": "bar"})
+    paths = [os.path.join(response_cache.path, f"{key}.json") for key in keys]
+    os.utime(paths[0], (100, 100))
+    os.utime(paths[1], (200, 200))
+    response_cache.get(keys[0])
+    # Leave some slack since the entry sizes vary slightly with the fetch time
+    response_cache.max_size = sum(os.path.getsize(path) for path in paths[:2]) + 10
+    response_cache.put(keys[2], "c", {"foo": "bar"})
+    assert response_cache.get(keys[0]) is not None
+    assert response_cache.get(keys[1]) is None
+    assert response_cache.get(keys[2]) is not None
+
+
+def test_response_cache_size_is_restored(response_cache):
+    response_cache.put(response_cache.make_key("a"), "a", {"foo": "bar"})
+    reopened = ResponseCache(response_cache.path)
+    assert reopened._size == response_cache._size > 0
+
+
+@respx.mock
+def test_client_get_json_cached(urljoiner, response_cache):
+    client = Client(base_url=urljoiner.base_url, cache=response_cache)
+    pattern = respx.get(urljoiner.resolve("foo"), content={"a": 1}, status_code=200)
+    assert client.get_json("foo") == {"a": 1}
+    assert client.get_json("foo") == {"a": 1}
+    assert pattern.call_count == 1
+
+
+@respx.mock
+def test_client_get_json_cache_revalidates_stale_entries(
+    mocker, urljoiner, response_cache
+):
+    client = Client(base_url=urljoiner.base_url, cache=response_cache)
+    respx.get(
+        urljoiner.resolve("foo"),
+        content={"a": 1},
+        status_code=200,
+        headers={"ETag": '"abc"'},
+    )
+    assert client.get_json("foo") == {"a": 1}
+    mocker.patch("time.time", return_value=time_after_ttl(response_cache))
+    respx.clear()
+    pattern = respx.get(urljoiner.resolve("foo"), content="", status_code=304)
+    assert client.get_json("foo") == {"a": 1}
+    assert pattern.call_count == 1
+    request = pattern.calls[0][0]
+    assert request.headers["If-None-Match"] == '"abc"'
+
+
+@respx.mock
+def test_client_get_json_cache_refetches_stale_entries_without_etag(
+    mocker, urljoiner, response_cache
+):
+    client = Client(base_url=urljoiner.base_url, cache=response_cache)
+    respx.get(urljoiner.resolve("foo"), content={"a": 1}, status_code=200)
+    client.get_json("foo")
+    mocker.patch("time.time", return_value=time_after_ttl(response_cache))
+    respx.clear()
+    pattern = respx.get(urljoiner.resolve("foo"), content={"a": 2}, status_code=200)
+    assert client.get_json("foo") == {"a": 2}
+    assert "If-None-Match" not in pattern.calls[0][0].headers
+
+
+def time_after_ttl(response_cache):
+    entry_times = []
+    for name in os.listdir(response_cache.path):
+        with open(os.path.join(response_cache.path, name)) as f:
+            entry_times.append(json.load(f)["fetched_at"])
+    return max(entry_times) + response_cache.ttl + 1
+
+
+@respx.mock
+def test_client_get_json_offline(mocker, urljoiner, response_cache):
+    respx.get(urljoiner.resolve("foo"), content={"a": 1}, status_code=200)
+    Client(base_url=urljoiner.base_url, cache=response_cache).get_json("foo")
+    respx.clear()
+    mocker.patch("time.time", return_value=time_after_ttl(response_cache))
+    client = Client(base_url=urljoiner.base_url, cache=response_cache, offline=True)
+    assert client.get_json("foo") == {"a": 1}
+    with pytest.raises(LookupError):
+        client.get_json("bar")
+
+
+def test_client_offline_requires_cache():
+    with pytest.raises(ValueError):
+        Client(offline=True)
+
+
+def test_client_get_json_async_without_session_raises():
+    client = Client()
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.get_json_async("data"))
+
+
+@respx.mock
+def test_client_limits_concurrent_requests(urljoiner):
+    client = Client(base_url=urljoiner.base_url, max_concurrent_requests=2)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def content(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"foo": "bar"}
+
+    respx.get(urljoiner.resolve("data"), content=content)
+
+    async def get_many():
+        async with client:
+            return await asyncio.gather(
+                *(client.get_json_async("data") for _ in range(6))
+            )
+
+    result = asyncio.run(get_many())
+    assert result == [{"foo": "bar"}] * 6
+    assert max_in_flight == 2
+
+
 def test_client_make_query_path():
     client = Client()
     query = [("foo", "bar"), ("baz", "qux")]
@@ -664,10 +1058,123 @@ def test_client_get_reference_epigenome(urljoiner):
         content=file_search,
         status_code=200,
     )
-    result = client.get_reference_epigenome(reference_epigenome_path)
+    result = client.get_reference_epigenome(
+        reference_epigenome_path, single_query=False
+    )
     assert result == {"related_datasets": [{"original_files": [{"foo": "bar"}]}]}
 
 
+@respx.mock
+def test_client_get_reference_epigenome_searches_each_dataset(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    reference_epigenome = {
+        "related_datasets": [
+            {"original_files": ["/files/1/"]},
+            {"original_files": ["/files/2/", "/files/3/"]},
+        ]
+    }
+    respx.get(
+        urljoiner.resolve("reference-epigenomes/baz"),
+        content=reference_epigenome,
+        status_code=200,
+    )
+    respx.get(
+        urljoiner.resolve("search/?type=File&@id=/files/1/&frame=object"),
+        content={"@graph": [{"@id": "/files/1/"}]},
+        status_code=200,
+    )
+    respx.get(
+        urljoiner.resolve("search/?type=File&@id=/files/2/&@id=/files/3/&frame=object"),
+        content={"@graph": [{"@id": "/files/2/"}, {"@id": "/files/3/"}]},
+        status_code=200,
+    )
+    result = client.get_reference_epigenome(
+        "reference-epigenomes/baz", single_query=False
+    )
+    assert result == {
+        "related_datasets": [
+            {"original_files": [{"@id": "/files/1/"}]},
+            {"original_files": [{"@id": "/files/2/"}, {"@id": "/files/3/"}]},
+        ]
+    }
+
+
+@respx.mock
+def test_client_get_reference_epigenome_single_query(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    reference_epigenome = {
+        "related_datasets": [
+            {"@id": "/experiments/1/", "original_files": ["/files/1/"]},
+            {"@id": "/experiments/2/", "original_files": ["/files/3/", "/files/2/"]},
+        ]
+    }
+    respx.get(
+        urljoiner.resolve("reference-epigenomes/baz"),
+        content=reference_epigenome,
+        status_code=200,
+    )
+    search = respx.get(
+        urljoiner.resolve(
+            "search/?type=File&dataset=/experiments/1/&dataset=/experiments/2/"
+            "&frame=object&limit=1000&from=0"
+        ),
+        content={
+            "@graph": [
+                {"@id": "/files/2/", "dataset": "/experiments/2/"},
+                {"@id": "/files/1/", "dataset": "/experiments/1/"},
+                {"@id": "/files/3/", "dataset": "/experiments/2/"},
+            ],
+            "total": 3,
+        },
+        status_code=200,
+    )
+    result = client.get_reference_epigenome("reference-epigenomes/baz")
+    assert search.call_count == 1
+    assert [
+        [file["@id"] for file in dataset["original_files"]]
+        for dataset in result["related_datasets"]
+    ] == [["/files/1/"], ["/files/3/", "/files/2/"]]
+
+
+@respx.mock
+def test_client_get_reference_epigenome_single_query_no_files(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    respx.get(
+        urljoiner.resolve("reference-epigenomes/baz"),
+        content={
+            "related_datasets": [{"@id": "/experiments/1/", "original_files": []}]
+        },
+        status_code=200,
+    )
+    respx.get(
+        urljoiner.resolve(
+            "search/?type=File&dataset=/experiments/1/&frame=object&limit=1000&from=0"
+        ),
+        content={"@graph": [], "total": 0},
+        status_code=404,
+    )
+    result = client.get_reference_epigenome("reference-epigenomes/baz")
+    assert result == {
+        "related_datasets": [{"@id": "/experiments/1/", "original_files": []}]
+    }
+
+
+@respx.mock
+def test_client_search_all(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    for offset in (0, 2, 4):
+        respx.get(
+            urljoiner.resolve(f"search/?type=Foo&limit=2&from={offset}"),
+            content={
+                "@graph": [{"a": i} for i in range(offset, min(offset + 2, 5))],
+                "total": 5,
+            },
+            status_code=200,
+        )
+    result = client.search_all([("type", "Foo")], page_size=2)
+    assert result == [{"a": i} for i in range(5)]
+
+
 @pytest.mark.parametrize(
     "condition,obj,expected",
     [
@@ -753,12 +1260,19 @@ def test_filter_by_status():
 @respx.mock
 def test_get_dnase_preferred_replicate(urljoiner, condition, files, expected):
     client = Client(base_url=urljoiner.base_url)
-    respx.get(
-        urljoiner.resolve("/samtools-flagstats-quality-metrics/1/"),
-        content={"mapped": 10},
+    search = respx.get(
+        urljoiner.resolve(
+            "search/?type=SamtoolsFlagstatsQualityMetric"
+            "&@id=/samtools-flagstats-quality-metrics/1/"
+            "&@id=/samtools-flagstats-quality-metrics/2/&frame=object&limit=1000&from=0"
+        ),
+        content={
+            "@graph": [{"@id": "/samtools-flagstats-quality-metrics/1/", "mapped": 10}],
+            "total": 1,
+        },
         status_code=200,
     )
-    respx.get(
+    metric = respx.get(
         urljoiner.resolve("/samtools-flagstats-quality-metrics/2/"),
         content={"mapped": 2},
         status_code=200,
@@ -766,6 +1280,59 @@ def test_get_dnase_preferred_replicate(urljoiner, condition, files, expected):
     with condition:
         result = get_dnase_preferred_replicate(files, client)
         assert result == expected
+        assert search.call_count == 1
+        assert metric.call_count == 1
+
+
+@respx.mock
+def test_client_get_objects(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    respx.get(
+        urljoiner.resolve(
+            "search/?type=Foo&@id=/foos/1/&@id=/foos/2/&frame=object&limit=1000&from=0"
+        ),
+        content={
+            "@graph": [{"@id": "/foos/2/", "a": 2}, {"@id": "/foos/1/", "a": 1}],
+            "total": 2,
+        },
+        status_code=200,
+    )
+    result = client.get_objects("Foo", ["/foos/1/", "/foos/2/"])
+    assert result == [{"@id": "/foos/1/", "a": 1}, {"@id": "/foos/2/", "a": 2}]
+
+
+@respx.mock
+def test_client_get_objects_falls_back_for_empty_search(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    respx.get(
+        urljoiner.resolve(
+            "search/?type=Foo&@id=/foos/1/&@id=/foos/1/&frame=object&limit=1000&from=0"
+        ),
+        content={"@graph": []},
+        status_code=404,
+    )
+    obj = respx.get(urljoiner.resolve("/foos/1/"), content={"a": 1}, status_code=200)
+    result = client.get_objects("Foo", ["/foos/1/", "/foos/1/"])
+    assert result == [{"a": 1}, {"a": 1}]
+    assert obj.call_count == 1
+
+
+@respx.mock
+def test_client_get_objects_raises_search_errors(urljoiner):
+    client = Client(base_url=urljoiner.base_url)
+    respx.get(
+        urljoiner.resolve(
+            "search/?type=Foo&@id=/foos/1/&frame=object&limit=1000&from=0"
+        ),
+        content={},
+        status_code=403,
+    )
+    with pytest.raises(httpx.HTTPError):
+        client.get_objects("Foo", ["/foos/1/"])
+
+
+def test_client_get_objects_no_ids():
+    assert Client().get_objects("Foo", []) == []
 
 
 def test_write_json(mocker):
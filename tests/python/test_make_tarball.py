@@ -0,0 +1,159 @@
+import gzip
+import io
+import os
+import tarfile
+
+import pytest
+
+from segway_pipeline.make_tarball import (
+    MTIME,
+    ParallelGzipWriter,
+    TarballIndex,
+    TarballRange,
+    compress_member,
+    list_entries,
+    main,
+    make_tarball,
+)
+
+
+def test_compress_member():
+    result = compress_member(b"foo\n")
+    assert gzip.decompress(result) == b"foo\n"
+    # Magic number, deflate, no flags and zero mtime like `gzip -n`
+    assert result[:8] == b"\x1f\x8b\x08\x00\x00\x00\x00\x00"
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_parallel_gzip_writer(num_threads):
+    data = os.urandom(10) * 1000
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, num_threads, block_size=1024) as writer:
+        for piece in [data[:700], data[700:5000], data[5000:]]:
+            writer.write(piece)
+    result = out.getvalue()
+    assert gzip.decompress(result) == data
+    assert result.count(b"\x1f\x8b\x08\x00\x00\x00\x00\x00") == 10
+    blocks = [data[start:][:1024] for start in range(0, len(data), 1024)]
+    assert result == b"".join(compress_member(block) for block in blocks)
+
+
+def test_parallel_gzip_writer_empty():
+    out = io.BytesIO()
+    with ParallelGzipWriter(out):
+        pass
+    assert gzip.decompress(out.getvalue()) == b""
+
+
+def test_parallel_gzip_writer_invalid_num_threads():
+    with pytest.raises(ValueError):
+        ParallelGzipWriter(io.BytesIO(), 0)
+
+
+@pytest.fixture
+def traindir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path in ("traindir/params", "traindir/log", "traindir/Z"):
+        os.makedirs(path)
+    for path in ("traindir/params/params.params", "traindir/segway.str"):
+        with open(path, "w") as f:
+            f.write(f"{path}\n")
+    return "traindir"
+
+
+def test_list_entries(traindir):
+    result = list_entries(f"{traindir}/")
+    assert result == [
+        "traindir",
+        "traindir/Z",
+        "traindir/log",
+        "traindir/params",
+        "traindir/params/params.params",
+        "traindir/segway.str",
+    ]
+
+
+def test_list_entries_regex(traindir):
+    result = list_entries(traindir, r"traindir/(params|segway.str)($|/.*)")
+    assert result == [
+        "traindir/params",
+        "traindir/params/params.params",
+        "traindir/segway.str",
+    ]
+
+
+def test_make_tarball(traindir):
+    make_tarball(list_entries(traindir), "first.tar.gz", 2)
+    os.utime("traindir/segway.str", (0, 0))
+    make_tarball(list_entries(traindir), "second.tar.gz")
+    with open("first.tar.gz", "rb") as first, open("second.tar.gz", "rb") as second:
+        assert first.read() == second.read()
+    with tarfile.open("first.tar.gz") as tar:
+        members = tar.getmembers()
+        assert [member.name for member in members] == list_entries(traindir)
+        assert all(member.mtime == MTIME for member in members)
+        assert all(member.uid == 0 and member.uname == "" for member in members)
+        assert tar.extractfile("traindir/segway.str").read() == (  # type: ignore
+            b"traindir/segway.str\n"
+        )
+
+
+def test_make_tarball_index(traindir):
+    with open("traindir/big", "wb") as f:
+        f.write(os.urandom(5000))
+    entries = list_entries(traindir)
+    make_tarball(entries, "out.tar.gz", index_outfile="out.tar.gz.index")
+    index = TarballIndex.from_file("out.tar.gz.index")
+    assert [name for name, _, _ in index.entries] == entries
+    with gzip.open("out.tar.gz") as f:
+        tar_stream = f.read()
+    assert index.member_offsets == [0, os.path.getsize("out.tar.gz")]
+    for name, start, end in index.entries:
+        tarinfo = tarfile.TarInfo.frombuf(
+            tar_stream[start:][:512], tarfile.ENCODING, "surrogateescape"
+        )
+        assert tarinfo.name.rstrip("/") == name
+        assert end - start == 512 + -(-tarinfo.size // 512) * 512
+
+
+def test_tarball_index_open(tmp_path):
+    data = os.urandom(5000)
+    archive = tmp_path / "out.gz"
+    with open(archive, "wb") as f, ParallelGzipWriter(f, block_size=1000) as writer:
+        writer.write(data)
+    index = TarballIndex(1000, writer.member_offsets, [])
+    assert len(index.member_offsets) == 6
+    with open(archive, "rb") as f:
+        assert index.open(f, 0, 5000).read() == data
+        assert index.open(f, 1500, 2100).read() == data[1500:2100]
+        assert index.open(f, 2000, 3000).read() == data[2000:3000]
+        assert index.open(f, 4999, 5000).read() == data[4999:]
+        tar_range = index.open(f, 500, 4500)
+        chunks = iter(lambda: tar_range.read(300), b"")
+        assert b"".join(chunks) == data[500:4500]
+
+
+def test_tarball_range_decompresses_one_member_at_a_time(mocker, tmp_path):
+    data = os.urandom(5000)
+    archive = tmp_path / "out.gz"
+    with open(archive, "wb") as f, ParallelGzipWriter(f, block_size=1000) as writer:
+        writer.write(data)
+    index = TarballIndex(1000, writer.member_offsets, [])
+    decompress = mocker.spy(gzip, "decompress")
+    with open(archive, "rb") as f:
+        tar_range = TarballRange(index, f, 1500, 5000)
+        result = bytearray(600)
+        assert tar_range.readinto(result) == 500
+        assert bytes(result[:500]) == data[1500:2000]
+        assert decompress.call_count == 1
+        assert tar_range.readinto(result) == 600
+        assert bytes(result) == data[2000:2600]
+        assert decompress.call_count == 2
+
+
+def test_main(mocker, traindir):
+    testargs = ["prog", "-o", "out.tar.gz", "--regex", "traindir/params.*", "traindir"]
+    mocker.patch("sys.argv", testargs)
+    main()
+    with tarfile.open("out.tar.gz") as tar:
+        assert tar.getnames() == ["traindir/params", "traindir/params/params.params"]
@@ -0,0 +1,60 @@
+import gzip
+from io import StringIO
+
+from segway_pipeline.merge_beds import get_sort_key, main, merge_beds
+
+
+def test_get_sort_key():
+    assert get_sort_key("chr1\t100\t200\t1\n") == (100, "chr1\t100\t200\t1\n")
+
+
+def test_merge_beds(tmp_path):
+    shard_0 = tmp_path / "shard_0.bed"
+    shard_0.write_text(
+        "track name=segway\n"
+        "chr2\t0\t10\t0\n"
+        "chr2\t10\t20\t1\n"
+        "chr10\t20\t30\t1\n"
+        "chr10\t0\t20\t0\n"
+    )
+    shard_1 = tmp_path / "shard_1.bed"
+    shard_1.write_text("track name=segway\nchr1\t0\t5\t2\nchr1\t5\t9\t3")
+    output = StringIO()
+    merge_beds([str(shard_0), str(shard_1)], output, str(tmp_path))
+    assert output.getvalue() == (
+        "chr1\t0\t5\t2\n"
+        "chr1\t5\t9\t3\n"
+        "chr10\t0\t20\t0\n"
+        "chr10\t20\t30\t1\n"
+        "chr2\t0\t10\t0\n"
+        "chr2\t10\t20\t1\n"
+    )
+    # The spilled chromosomes are cleaned up
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "shard_0.bed",
+        "shard_1.bed",
+    ]
+
+
+def test_merge_beds_does_not_depend_on_shard_order(tmp_path):
+    shard_0 = tmp_path / "shard_0.bed"
+    shard_0.write_text("chr2\t0\t10\t0\nchr1\t10\t20\t1\n")
+    shard_1 = tmp_path / "shard_1.bed"
+    shard_1.write_text("chr1\t0\t10\t1\nchr1\t0\t10\t0\n")
+    first = StringIO()
+    merge_beds([str(shard_0), str(shard_1)], first)
+    second = StringIO()
+    merge_beds([str(shard_1), str(shard_0)], second)
+    assert first.getvalue() == second.getvalue()
+    assert first.getvalue().startswith("chr1\t0\t10\t0\nchr1\t0\t10\t1\n")
+
+
+def test_main_gzipped_input_and_output(mocker, tmp_path):
+    shard_0 = tmp_path / "shard_0.bed.gz"
+    shard_0.write_bytes(gzip.compress(b"chr2\t0\t10\t0\n"))
+    shard_1 = tmp_path / "shard_1.bed"
+    shard_1.write_text("chr1\t0\t10\t1\n")
+    outfile = tmp_path / "segway.bed.gz"
+    mocker.patch("sys.argv", ["prog", str(shard_0), str(shard_1), "-o", str(outfile)])
+    main()
+    assert gzip.decompress(outfile.read_bytes()) == b"chr1\t0\t10\t1\nchr2\t0\t10\t0\n"
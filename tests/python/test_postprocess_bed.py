@@ -0,0 +1,207 @@
+import gzip
+from io import StringIO
+
+import pytest
+
+from segway_pipeline.postprocess_bed import (
+    ChromosomeSpill,
+    main,
+    make_label_columns,
+    postprocess_bed,
+    process_block,
+    process_lines,
+)
+from segway_pipeline.recolor_bed import Colors
+
+
+@pytest.fixture
+def mnemonics_file_handle():
+    return StringIO(initial_value="old\tnew\n0\tfoo\n1\tbar\n")
+
+
+@pytest.fixture
+def labels_to_colors():
+    return {"foo": Colors.RED, "bar": Colors.ORANGE}
+
+
+def test_postprocess_bed(mnemonics_file_handle, labels_to_colors):
+    bed_data = (
+        "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+        "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+    )
+    bed_file_handle = StringIO(initial_value=bed_data)
+    output_file_handle = StringIO("w", newline="")
+    relabeled_file_handle = StringIO("w", newline="")
+    postprocess_bed(
+        bed_file_handle,
+        mnemonics_file_handle,
+        output_file_handle,
+        relabeled_file_handle=relabeled_file_handle,
+        labels_to_colors=labels_to_colors,
+    )
+    assert output_file_handle.getvalue() == (
+        "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t255,0,0\n"
+        "chr19\t90800\t91100\t1_bar\t1000\t.\t90800\t91100\t255,195,77\n"
+    )
+    assert relabeled_file_handle.getvalue() == (
+        "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t102,102,102\n"
+        "chr19\t90800\t91100\t1_bar\t1000\t.\t90800\t91100\t217,95,2\n"
+    )
+
+
+def test_postprocess_bed_sorts_output(mnemonics_file_handle, labels_to_colors):
+    bed_data = (
+        "chr2\t0\t10\t0\t1000\t.\t0\t10\t1,1,1\n"
+        "chr10\t20\t30\t1\t1000\t.\t20\t30\t1,1,1\n"
+        "chr10\t0\t20\t0\t1000\t.\t0\t20\t1,1,1\n"
+        "chr1\t0\t10\t1\t1000\t.\t0\t10\t1,1,1\n"
+    )
+    bed_file_handle = StringIO(initial_value=bed_data)
+    output_file_handle = StringIO("w", newline="")
+    postprocess_bed(
+        bed_file_handle,
+        mnemonics_file_handle,
+        output_file_handle,
+        labels_to_colors=labels_to_colors,
+    )
+    assert output_file_handle.getvalue() == (
+        "chr1\t0\t10\t1_bar\t1000\t.\t0\t10\t255,195,77\n"
+        "chr10\t0\t20\t0_foo\t1000\t.\t0\t20\t255,0,0\n"
+        "chr10\t20\t30\t1_bar\t1000\t.\t20\t30\t255,195,77\n"
+        "chr2\t0\t10\t0_foo\t1000\t.\t0\t10\t255,0,0\n"
+    )
+
+
+def test_postprocess_bed_parallel_matches_serial(labels_to_colors):
+    bed_data = "".join(
+        f"chr{i % 3}\t{i}\t{i + 1}\t{i % 2}\t1000\t.\t{i}\t{i + 1}\t1,1,1\n"
+        for i in range(1000)
+    )
+    outputs = []
+    for num_processes in (1, 2):
+        output_file_handle = StringIO()
+        relabeled_file_handle = StringIO()
+        postprocess_bed(
+            StringIO(initial_value=bed_data),
+            StringIO(initial_value="old\tnew\n0\tfoo\n1\tbar\n"),
+            output_file_handle,
+            relabeled_file_handle=relabeled_file_handle,
+            labels_to_colors=labels_to_colors,
+            num_processes=num_processes,
+        )
+        outputs.append(
+            (output_file_handle.getvalue(), relabeled_file_handle.getvalue())
+        )
+    assert outputs[0] == outputs[1]
+
+
+def test_make_label_columns(labels_to_colors):
+    result = make_label_columns({"0": "foo", "1": "bar"}, labels_to_colors)
+    assert result == {"0": ("0_foo", "255,0,0"), "1": ("1_bar", "255,195,77")}
+
+
+def test_process_lines():
+    lines = ["chr19\t5\t10\t0\t1000\t.\t5\t10\t1,1,1\n"]
+    relabeled, recolored, starts = process_lines(lines, {"0": ("0_foo", "255,0,0")})
+    assert relabeled == ["chr19\t5\t10\t0_foo\t1000\t.\t5\t10\t1,1,1\n"]
+    assert recolored == ["chr19\t5\t10\t0_foo\t1000\t.\t5\t10\t255,0,0\n"]
+    assert starts == [5]
+
+
+def test_process_block():
+    lines = [
+        "chr1\t5\t10\t0\t1000\t.\t5\t10\t1,1,1\n",
+        "chr2\t0\t5\t0\t1000\t.\t0\t5\t1,1,1\n",
+    ]
+    result = process_block(lines, {"0": ("0_foo", "255,0,0")})
+    assert result == [
+        (
+            "chr1",
+            "chr1\t5\t10\t0_foo\t1000\t.\t5\t10\t1,1,1\n",
+            "chr1\t5\t10\t0_foo\t1000\t.\t5\t10\t255,0,0\n",
+            [5],
+        ),
+        (
+            "chr2",
+            "chr2\t0\t5\t0_foo\t1000\t.\t0\t5\t1,1,1\n",
+            "chr2\t0\t5\t0_foo\t1000\t.\t0\t5\t255,0,0\n",
+            [0],
+        ),
+    ]
+
+
+@pytest.mark.parametrize("relabeled", [True, False])
+def test_chromosome_spill_sorted(tmp_path, relabeled):
+    spill = ChromosomeSpill(str(tmp_path / "0"), relabeled)
+    spill.add("chr1\t0\t10\ta\n", "chr1\t0\t10\tA\n", [0])
+    spill.add("chr1\t10\t20\tb\n", "chr1\t10\t20\tB\n", [10])
+    assert spill.is_sorted
+    output_file_handle = StringIO()
+    relabeled_file_handle = StringIO()
+    spill.write(output_file_handle, relabeled_file_handle)
+    spill.close()
+    assert output_file_handle.getvalue() == "chr1\t0\t10\tA\nchr1\t10\t20\tB\n"
+    assert relabeled_file_handle.getvalue() == (
+        "chr1\t0\t10\ta\nchr1\t10\t20\tb\n" if relabeled else ""
+    )
+
+
+def test_chromosome_spill_sorts_out_of_order_rows(tmp_path):
+    spill = ChromosomeSpill(str(tmp_path / "0"))
+    spill.add("chr1\t10\t20\tb\n", "chr1\t10\t20\tB\n", [10])
+    spill.add(
+        "chr1\t0\t10\ta\nchr1\t5\t6\tc\n", "chr1\t0\t10\tA\nchr1\t5\t6\tC\n", [0, 5]
+    )
+    assert not spill.is_sorted
+    output_file_handle = StringIO()
+    relabeled_file_handle = StringIO()
+    spill.write(output_file_handle, relabeled_file_handle)
+    spill.close()
+    assert output_file_handle.getvalue() == (
+        "chr1\t0\t10\tA\nchr1\t5\t6\tC\nchr1\t10\t20\tB\n"
+    )
+    assert relabeled_file_handle.getvalue() == (
+        "chr1\t0\t10\ta\nchr1\t5\t6\tc\nchr1\t10\t20\tb\n"
+    )
+
+
+def test_postprocess_bed_removes_spills(
+    tmp_path, mnemonics_file_handle, labels_to_colors
+):
+    bed_data = "chr1\t0\t10\t0\t1000\t.\t0\t10\t1,1,1\n"
+    postprocess_bed(
+        StringIO(initial_value=bed_data),
+        mnemonics_file_handle,
+        StringIO(),
+        labels_to_colors=labels_to_colors,
+        tempdir=str(tmp_path),
+    )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_main(mocker, tmp_path):
+    bed = tmp_path / "segway.bed.gz"
+    bed.write_bytes(gzip.compress(b"chr19\t0\t90800\t1\t1000\t.\t0\t90800\t1,1,1\n"))
+    mnemonics = tmp_path / "mnemonics.txt"
+    mnemonics.write_text("old\tnew\n1\tPromoter\n")
+    outfile = tmp_path / "recolored.bed.gz"
+    relabeled = tmp_path / "relabeled.bed"
+    mocker.patch(
+        "sys.argv",
+        [
+            "prog",
+            str(bed),
+            str(mnemonics),
+            "-o",
+            str(outfile),
+            "--relabeled-output-filename",
+            str(relabeled),
+        ],
+    )
+    main()
+    assert gzip.decompress(outfile.read_bytes()) == (
+        b"chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t255,0,0\n"
+    )
+    assert relabeled.read_bytes() == (
+        b"chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t1,1,1\n"
+    )
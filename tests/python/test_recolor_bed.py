@@ -1,8 +1,20 @@
+import gzip
+import pickle
 from io import StringIO
 
 import pytest
 
-from segway_pipeline.recolor_bed import Colors, Rgb, process_row, recolor_bed
+from segway_pipeline.recolor_bed import (
+    ColorColumns,
+    Colors,
+    Rgb,
+    main,
+    process_row,
+    recolor_bed,
+    recolor_line,
+    recolor_segmentation,
+)
+from segway_pipeline.segmentation import Segmentation
 
 
 @pytest.mark.parametrize("args", [(256, 0, 0), (23, -1, 9)])
@@ -16,6 +28,16 @@ def test_rgb_str():
     assert str(color) == "255,0,0"
 
 
+def test_rgb_eq():
+    assert Rgb(255, 0, 0) == Rgb(255, 0, 0)
+    assert Rgb(255, 0, 0) != Rgb(0, 0, 255)
+    assert hash(Rgb(255, 0, 0)) == hash(Rgb(255, 0, 0))
+
+
+def test_colors_can_be_pickled():
+    assert pickle.loads(pickle.dumps(Colors.RED)) is Colors.RED
+
+
 def test_recolor_bed():
     labels_to_colors = {"foo": Colors.RED, "bar": Colors.ORANGE}
     bed_data = (
@@ -33,6 +55,25 @@ def test_recolor_bed():
     )
 
 
+def test_recolor_bed_parallel_matches_serial():
+    labels_to_colors = {"foo": Colors.RED, "bar": Colors.ORANGE}
+    bed_data = "".join(
+        f"chr19\t{i}\t{i + 1}\t{i}_{('foo', 'bar')[i % 2]}\t1000\t.\t{i}\t{i + 1}\t1,1,1\n"
+        for i in range(1000)
+    )
+    outputs = []
+    for num_processes in (1, 2):
+        output_file_handle = StringIO()
+        recolor_bed(
+            StringIO(initial_value=bed_data),
+            output_file_handle,
+            labels_to_colors=labels_to_colors,
+            num_processes=num_processes,
+        )
+        outputs.append(output_file_handle.getvalue())
+    assert outputs[0] == outputs[1]
+
+
 def test_process_row():
     labels_to_colors = {"foo": Colors.RED}
     row = ["chr19", "0", "90800", "0_foo", "1000", ".", "0", "90800", "102,102,102"]
@@ -48,3 +89,63 @@ def test_process_row():
         "90800",
         "255,0,0",
     ]
+
+
+def test_color_columns_memoizes(mocker):
+    color_columns = ColorColumns({"foo": Colors.RED})
+    spy = mocker.spy(Rgb, "__str__")
+    assert color_columns["0_foo"] == "\t255,0,0\n"
+    assert color_columns["0_foo"] == "\t255,0,0\n"
+    assert spy.call_count == 1
+    assert color_columns == {"0_foo": "\t255,0,0\n"}
+
+
+def test_color_columns_unknown_label_raises():
+    color_columns = ColorColumns({"foo": Colors.RED})
+    with pytest.raises(KeyError):
+        color_columns["0_bar"]
+
+
+def test_recolor_line():
+    color_columns = ColorColumns({"foo": Colors.RED})
+    line = "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t102,102,102\n"
+    result = recolor_line(line, color_columns)
+    assert result == "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t255,0,0\n"
+
+
+def test_main_gzipped_input_and_output(mocker, tmp_path):
+    bed = tmp_path / "relabeled.bed.gz"
+    bed.write_bytes(
+        gzip.compress(b"chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t1,1,1\n")
+    )
+    outfile = tmp_path / "recolored.bed.gz"
+    mocker.patch("sys.argv", ["prog", str(bed), "-o", str(outfile)])
+    main()
+    assert gzip.decompress(outfile.read_bytes()) == (
+        b"chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t255,0,0\n"
+    )
+
+
+def test_recolor_segmentation():
+    bed_data = (
+        "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t102,102,102\n"
+        "chr19\t90800\t91100\t1_bar\t1000\t.\t90800\t91100\t217,95,2\n"
+        "chr19\t91100\t91200\t2_foo\t1000\t.\t91100\t91200\t1,1,1\n"
+    )
+    segmentation = Segmentation.from_bed(StringIO(initial_value=bed_data))
+    recolor_segmentation(
+        segmentation, labels_to_colors={"foo": Colors.RED, "bar": Colors.ORANGE}
+    )
+    assert segmentation.colors == ["255,0,0", "255,195,77"]
+    assert segmentation.color_ids.tolist() == [0, 1, 0]
+
+
+def test_main_in_memory(mocker, tmp_path):
+    bed = tmp_path / "relabeled.bed"
+    bed.write_text("chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t1,1,1\n")
+    outfile = tmp_path / "recolored.bed"
+    mocker.patch("sys.argv", ["prog", str(bed), "-o", str(outfile), "--in-memory"])
+    main()
+    assert outfile.read_text() == (
+        "chr19\t0\t90800\t1_Promoter\t1000\t.\t0\t90800\t255,0,0\n"
+    )
@@ -1,8 +1,17 @@
+import gzip
 from io import StringIO
 
 import pytest
 
-from segway_pipeline.relabel import parse_mnemonics, process_row, relabel
+from segway_pipeline.relabel import (
+    main,
+    parse_mnemonics,
+    process_row,
+    relabel,
+    relabel_line,
+    relabel_segmentation,
+)
+from segway_pipeline.segmentation import Segmentation
 
 
 @pytest.fixture
@@ -24,6 +33,24 @@ def test_relabel(mnemonics_file_handle):
     )
 
 
+def test_relabel_parallel_matches_serial():
+    bed_data = "".join(
+        f"chr19\t{i}\t{i + 1}\t{i % 2}\t1000\t.\t{i}\t{i + 1}\t1,1,1\n"
+        for i in range(1000)
+    )
+    outputs = []
+    for num_processes in (1, 2):
+        output_file_handle = StringIO()
+        relabel(
+            StringIO(initial_value=bed_data),
+            StringIO(initial_value="old\tnew\n0\tfoo\n1\tbar\n"),
+            output_file_handle,
+            num_processes=num_processes,
+        )
+        outputs.append(output_file_handle.getvalue())
+    assert outputs[0] == outputs[1]
+
+
 def test_parse_mnemonics(mnemonics_file_handle):
     result = parse_mnemonics(mnemonics_file_handle)
     assert result == {"0": "foo", "1": "bar"}
@@ -44,3 +71,54 @@ def test_process_row():
         "90800",
         "102,102,102",
     ]
+
+
+def test_relabel_line():
+    new_labels = {"0": "0_foo"}
+    line = "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    result = relabel_line(line, new_labels)
+    assert result == "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t102,102,102\n"
+
+
+def test_relabel_line_no_trailing_newline():
+    new_labels = {"0": "0_foo"}
+    result = relabel_line("chr19\t0\t90800\t0\t1000", new_labels)
+    assert result == "chr19\t0\t90800\t0_foo\t1000\n"
+
+
+def test_main_gzipped_input_and_output(mocker, tmp_path):
+    bed = tmp_path / "segway.bed.gz"
+    bed.write_bytes(gzip.compress(b"chr19\t0\t90800\t1\t1000\t.\t0\t90800\t1,1,1\n"))
+    mnemonics = tmp_path / "mnemonics.txt"
+    mnemonics.write_text("old\tnew\n1\tbar\n")
+    outfile = tmp_path / "relabeled.bed.gz"
+    mocker.patch("sys.argv", ["prog", str(bed), str(mnemonics), "-o", str(outfile)])
+    main()
+    assert gzip.decompress(outfile.read_bytes()) == (
+        b"chr19\t0\t90800\t1_bar\t1000\t.\t0\t90800\t1,1,1\n"
+    )
+
+
+def test_relabel_segmentation(mnemonics_file_handle):
+    bed_data = "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    segmentation = Segmentation.from_bed(StringIO(initial_value=bed_data))
+    relabel_segmentation(segmentation, parse_mnemonics(mnemonics_file_handle))
+    output_file_handle = StringIO("w", newline="")
+    segmentation.to_bed(output_file_handle)
+    assert output_file_handle.getvalue() == (
+        "chr19\t0\t90800\t0_foo\t1000\t.\t0\t90800\t102,102,102\n"
+    )
+
+
+def test_main_in_memory(mocker, tmp_path):
+    bed = tmp_path / "segway.bed"
+    bed.write_text("chr19\t0\t90800\t1\t1000\t.\t0\t90800\t1,1,1\n")
+    mnemonics = tmp_path / "mnemonics.txt"
+    mnemonics.write_text("old\tnew\n1\tbar\n")
+    outfile = tmp_path / "relabeled.bed"
+    mocker.patch(
+        "sys.argv",
+        ["prog", str(bed), str(mnemonics), "-o", str(outfile), "--in-memory"],
+    )
+    main()
+    assert outfile.read_text() == "chr19\t0\t90800\t1_bar\t1000\t.\t0\t90800\t1,1,1\n"
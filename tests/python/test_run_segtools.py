@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from segway_pipeline.run_segtools import (
+    COMMAND_NOT_FOUND_RETURNCODE,
+    SegtoolsTool,
+    get_tools,
+    main,
+    run_segtools,
+    run_tool,
+)
+
+
+def python_tool(name, code, allow_failure=False):
+    return SegtoolsTool(name, [sys.executable, "-c", code], allow_failure)
+
+
+def test_get_tools():
+    tools = get_tools("segway.bed.gz", "files.genomedata", "genes.gtf", "params", 500)
+    assert [tool.name for tool in tools] == [
+        "length_distribution",
+        "gmtk_parameters",
+        "feature_aggregation",
+        "signal_distribution",
+    ]
+    assert [tool.name for tool in tools if tool.allow_failure] == [
+        "signal_distribution"
+    ]
+    assert tools[2].command[-3:] == [
+        "--flank-bases=500",
+        "segway.bed.gz",
+        "genes.gtf",
+    ]
+    assert tools[3].command[-2:] == ["segway.bed.gz", "files.genomedata"]
+
+
+def test_get_tools_tables_only():
+    tools = get_tools("segway.bed.gz", "files.genomedata", "genes.gtf", "params", 500)
+    result = get_tools(
+        "segway.bed.gz", "files.genomedata", "genes.gtf", "params", 500, True
+    )
+    assert result[0].command[0] == sys.executable
+    assert result[0].command[1].endswith("length_distribution.py")
+    assert os.path.isfile(result[0].command[1])
+    assert result[0].command[2:] == tools[0].command[1:]
+    assert result[1].command == tools[1].command
+    assert result[2].command[1].endswith("feature_aggregation.py")
+    assert result[2].command[2:] == [
+        "--flank-bases=500",
+        "-o",
+        "feature_aggregation",
+        "segway.bed.gz",
+        "genes.gtf",
+    ]
+    assert result[3].command[1].endswith("signal_distribution.py")
+    assert not result[3].allow_failure
+
+
+def test_get_tools_signal_distribution_processes():
+    result = get_tools(
+        "segway.bed.gz", "files.genomedata", "genes.gtf", "params", 500, True, 4
+    )
+    assert result[3].command[2:] == [
+        "--transformation",
+        "arcsinh",
+        "--num-processes",
+        "4",
+        "-o",
+        "signal_distribution",
+        "segway.bed.gz",
+        "files.genomedata",
+    ]
+
+
+def test_get_tools_annotation_gtf_index():
+    result = get_tools(
+        "segway.bed.gz",
+        "files.genomedata",
+        "genes.gtf",
+        "params",
+        500,
+        True,
+        annotation_gtf_index="genes.gtfindex.npz",
+    )
+    assert result[2].command[2:] == [
+        "--flank-bases=500",
+        "--gtf-index",
+        "genes.gtfindex.npz",
+        "-o",
+        "feature_aggregation",
+        "segway.bed.gz",
+        "genes.gtf",
+    ]
+
+
+def test_run_tool():
+    result = run_tool(python_tool("foo", "sum(range(10 ** 6))"))
+    assert result.returncode == 0
+    assert not result.failed
+    assert result.usage.wall_seconds > 0
+    assert result.usage.cpu_seconds > 0
+
+
+@pytest.mark.parametrize("allow_failure", [True, False])
+def test_run_tool_failure(allow_failure):
+    result = run_tool(python_tool("foo", "import sys; sys.exit(3)", allow_failure))
+    assert result.returncode == 3
+    assert result.failed is not allow_failure
+
+
+def test_run_tool_command_not_found():
+    result = run_tool(SegtoolsTool("foo", ["not-a-segtools-command"], True))
+    assert result.returncode == COMMAND_NOT_FOUND_RETURNCODE
+    assert not result.failed
+
+
+def test_run_segtools_runs_concurrently():
+    tools = [python_tool(str(i), "import time; time.sleep(1)") for i in range(3)]
+    start = time.perf_counter()
+    results = run_segtools(tools)
+    assert time.perf_counter() - start < 2.5
+    assert [result.tool.name for result in results] == ["0", "1", "2"]
+    assert all(result.usage.wall_seconds >= 1 for result in results)
+
+
+def test_run_segtools_num_processes():
+    tools = [python_tool(str(i), "pass") for i in range(3)]
+    results = run_segtools(tools, 1)
+    assert [result.returncode for result in results] == [0, 0, 0]
+
+
+def make_args(tmp_path):
+    return [
+        "prog",
+        "--bed",
+        "segway.bed.gz",
+        "--genomedata",
+        "files.genomedata",
+        "--annotation-gtf",
+        "genes.gtf",
+        "--params",
+        "params.params",
+        "--flank-bases=500",
+        "--metrics-outfile",
+        str(tmp_path / "metrics.json"),
+    ]
+
+
+def test_main(mocker, tmp_path):
+    tools = [
+        python_tool("ok", "pass"),
+        python_tool("flaky", "import sys; sys.exit(1)", allow_failure=True),
+    ]
+    get_tools = mocker.patch("segway_pipeline.run_segtools.get_tools")
+    get_tools.return_value = tools
+    mocker.patch("sys.argv", make_args(tmp_path))
+    main()
+    get_tools.assert_called_once_with(
+        "segway.bed.gz",
+        "files.genomedata",
+        "genes.gtf",
+        "params.params",
+        500,
+        False,
+        1,
+        None,
+    )
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    assert [(m["name"], m["returncode"]) for m in metrics] == [("ok", 0), ("flaky", 1)]
+    assert metrics[1]["allow_failure"] is True
+    assert all(m["wall_seconds"] > 0 for m in metrics)
+
+
+def test_main_failure(mocker, tmp_path):
+    tools = [python_tool("broken", "import sys; sys.exit(2)"), python_tool("ok", "")]
+    mocker.patch("segway_pipeline.run_segtools.get_tools", return_value=tools)
+    mocker.patch("sys.argv", make_args(tmp_path))
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == "Segtools commands failed: broken"
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    assert [m["returncode"] for m in metrics] == [2, 0]
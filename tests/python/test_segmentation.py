@@ -0,0 +1,103 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.segmentation import Segmentation, intern, parse_ints
+
+BED_DATA = (
+    "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+    "chr2\t0\t300\t0\t1000\t.\t0\t300\t102,102,102\n"
+)
+
+
+@pytest.fixture
+def segmentation():
+    return Segmentation.from_bed(StringIO(initial_value=BED_DATA))
+
+
+def test_segmentation_from_bed(segmentation):
+    assert len(segmentation) == 3
+    assert segmentation.chroms == ["chr19", "chr2"]
+    assert segmentation.chrom_ids.tolist() == [0, 0, 1]
+    assert segmentation.starts.tolist() == [0, 90800, 0]
+    assert segmentation.ends.tolist() == [90800, 91100, 300]
+    assert segmentation.labels == ["0", "1"]
+    assert segmentation.label_ids.tolist() == [0, 1, 0]
+    assert segmentation.colors == ["102,102,102", "217,95,2"]
+    assert segmentation.color_ids.tolist() == [0, 1, 0]
+
+
+def test_segmentation_from_bed_no_trailing_newline():
+    segmentation = Segmentation.from_bed(StringIO(initial_value=BED_DATA.rstrip()))
+    assert len(segmentation) == 3
+
+
+def test_segmentation_from_bed_empty():
+    segmentation = Segmentation.from_bed(StringIO())
+    assert len(segmentation) == 0
+    output_file_handle = StringIO()
+    segmentation.to_bed(output_file_handle)
+    assert output_file_handle.getvalue() == ""
+
+
+def test_segmentation_from_bed_wrong_number_of_columns_raises():
+    with pytest.raises(ValueError):
+        Segmentation.from_bed(StringIO(initial_value="chr1\t0\t10\t0\n"))
+
+
+def test_segmentation_iter_bed(mocker):
+    mocker.patch(
+        "segway_pipeline.segmentation.read_blocks",
+        side_effect=lambda f: ([line] for line in f),
+    )
+    blocks = list(Segmentation.iter_bed(StringIO(initial_value=BED_DATA)))
+    assert [len(block) for block in blocks] == [1, 1, 1]
+    assert blocks[0].labels == ["0"]
+    assert blocks[1].labels == blocks[2].labels == ["0", "1"]
+    assert blocks[2].chroms == ["chr19", "chr2"]
+    assert [block.label_ids.tolist() for block in blocks] == [[0], [1], [0]]
+    assert blocks[2].chrom_ids.tolist() == [1]
+
+
+def test_segmentation_to_bed_round_trip(segmentation):
+    output_file_handle = StringIO("w", newline="")
+    segmentation.to_bed(output_file_handle)
+    assert output_file_handle.getvalue() == BED_DATA
+
+
+def test_segmentation_map_labels(segmentation):
+    segmentation.map_labels(lambda label: f"{label}_foo")
+    assert segmentation.labels == ["0_foo", "1_foo"]
+    assert segmentation.label_ids.tolist() == [0, 1, 0]
+
+
+def test_segmentation_color_by_label(segmentation):
+    segmentation.color_by_label(lambda label: "1,1,1" if label == "0" else "2,2,2")
+    assert segmentation.colors == ["1,1,1", "2,2,2"]
+    assert segmentation.color_ids.tolist() == [0, 1, 0]
+
+
+def test_intern():
+    table = {"b": 0}
+    result = intern(["a", "b", "a"], table)
+    assert result.tolist() == [1, 0, 1]
+    assert result.dtype == np.uint16
+    assert table == {"b": 0, "a": 1}
+
+
+def test_intern_too_many_values_raises():
+    table = {str(i): i for i in range(65536)}
+    with pytest.raises(ValueError):
+        intern(["a"], table)
+
+
+def test_parse_ints():
+    result = parse_ints(["1", "22"], np.int64)
+    assert result.tolist() == [1, 22]
+
+
+def test_parse_ints_invalid_raises():
+    with pytest.raises(ValueError):
+        parse_ints(["1", "foo"], np.int64)
@@ -0,0 +1,220 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+import tables
+
+from segway_pipeline.segmentation import Segmentation
+from segway_pipeline.signal_distribution import (
+    add_block_sums,
+    get_chrom_signal_sums,
+    get_signal_sums,
+    label_positions,
+    main,
+    make_signal_sums,
+    read_tracknames,
+    split_chroms,
+    write_signal_distribution,
+)
+
+TRACKNAMES = [b"f1", b"f2"]
+CHR1 = np.array(
+    [[0, 1], [1, np.nan], [2, 3], [3, 5], [4, 7], [np.nan, 9], [6, 11], [7, 13]],
+    dtype=np.float32,
+)
+CHR2 = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.float32)
+BED_DATA = (
+    "chr1\t0\t3\t1\t1000\t.\t0\t3\t0,0,0\n"
+    "chr1\t3\t7\t0\t1000\t.\t3\t7\t0,0,0\n"
+    "chr1\t7\t8\t1\t1000\t.\t7\t8\t0,0,0\n"
+    "chr2\t0\t3\t0\t1000\t.\t0\t3\t0,0,0\n"
+    "chrX\t0\t3\t1\t1000\t.\t0\t3\t0,0,0\n"
+)
+
+
+def make_file_mode_archive(path):
+    """
+    chr1 has a gap between two supercontigs.
+    """
+    with tables.open_file(str(path), "w") as h5file:
+        root = h5file.root
+        root._v_attrs.tracknames = np.array(TRACKNAMES)
+        chr1 = h5file.create_group(root, "chr1")
+        for i, (start, end) in enumerate([(0, 2), (3, 8)]):
+            supercontig = h5file.create_group(chr1, f"supercontig_{i}")
+            supercontig._v_attrs.start = start
+            supercontig._v_attrs.end = end
+            h5file.create_array(supercontig, "continuous", CHR1[start:end])
+        chr2 = h5file.create_group(root, "chr2")
+        supercontig = h5file.create_group(chr2, "supercontig_0")
+        supercontig._v_attrs.start = 0
+        supercontig._v_attrs.end = 3
+        h5file.create_array(supercontig, "continuous", CHR2)
+
+
+def make_directory_mode_archive(path):
+    path.mkdir()
+    for chrom, data in (("chr1", CHR1), ("chr2", CHR2)):
+        with tables.open_file(str(path / f"{chrom}.genomedata"), "w") as h5file:
+            root = h5file.root
+            root._v_attrs.tracknames = np.array(TRACKNAMES)
+            supercontig = h5file.create_group(root, "supercontig_0")
+            supercontig._v_attrs.start = 0
+            supercontig._v_attrs.end = len(data)
+            h5file.create_array(supercontig, "continuous", data)
+
+
+@pytest.fixture
+def segmentation():
+    return Segmentation.from_bed(StringIO(initial_value=BED_DATA))
+
+
+def get_expected_sums(segmentation, data, transformation=None):
+    """
+    Sum segment by segment like segtools.
+    """
+    expected = make_signal_sums(len(TRACKNAMES), len(segmentation.labels))
+    for i in range(len(segmentation)):
+        chrom = segmentation.chroms[segmentation.chrom_ids[i]]
+        if chrom not in data:
+            continue
+        values = data[chrom][slice(segmentation.starts[i], segmentation.ends[i])]
+        for track_index in range(len(TRACKNAMES)):
+            track_values = values[:, track_index]
+            track_values = track_values[np.isfinite(track_values)]
+            if transformation == "arcsinh":
+                track_values = np.arcsinh(track_values)
+            label_id = segmentation.label_ids[i]
+            expected[0][track_index, label_id] += track_values.sum(dtype=np.longdouble)
+            expected[1][track_index, label_id] += np.square(track_values).sum(
+                dtype=np.longdouble
+            )
+            expected[2][track_index, label_id] += len(track_values)
+    return expected
+
+
+def test_split_chroms():
+    bed = "chr2\t5\t6\t0\t1000\t.\t5\t6\t0\nchr1\t3\t4\t1\t1000\t.\t3\t4\t0\n"
+    bed += "chr2\t0\t5\t1\t1000\t.\t0\t5\t0\n"
+    result = split_chroms(Segmentation.from_bed(StringIO(initial_value=bed)))
+    assert list(result) == ["chr2", "chr1"]
+    assert [array.tolist() for array in result["chr2"]] == [[0, 5], [5, 6], [1, 0]]
+    assert [array.tolist() for array in result["chr1"]] == [[3], [4], [1]]
+
+
+def test_label_positions():
+    starts = np.array([2, 5])
+    ends = np.array([4, 6])
+    label_ids = np.array([1, 0])
+    result = label_positions(np.arange(8), starts, ends, label_ids, 2)
+    assert result.tolist() == [2, 2, 1, 1, 2, 0, 2, 2]
+
+
+def test_add_block_sums():
+    sums = make_signal_sums(2, 3)
+    data = np.array([[1, 2], [np.nan, 3], [4, np.inf]], dtype=np.float32)
+    add_block_sums(sums, data, np.array([0, 0, 1]), 2)
+    assert sums[0].tolist() == [[1, 4, 0], [5, 0, 0]]
+    assert sums[1].tolist() == [[1, 16, 0], [13, 0, 0]]
+    assert sums[2].tolist() == [[1, 1, 0], [2, 0, 0]]
+
+
+@pytest.mark.skipif(
+    np.finfo(np.longdouble).nmant <= np.finfo(np.float64).nmant,
+    reason="long double is no more precise than double on this platform",
+)
+def test_add_block_sums_extended_precision():
+    """
+    The small value is lost when the block is summed in double precision.
+    """
+    sums = make_signal_sums(1, 2)
+    data = np.array([[2**30], [2**-30]], dtype=np.float32)
+    add_block_sums(sums, data, np.array([0, 0]), 1)
+    expected = np.longdouble(2**30) + np.longdouble(2**-30)
+    assert np.float64(2**30) + np.float64(2**-30) != expected
+    assert sums[0][0, 0] == expected
+
+
+def test_get_chrom_signal_sums(mocker, tmp_path, segmentation):
+    mocker.patch("segway_pipeline.signal_distribution.READ_BLOCK_ROWS", 2)
+    archive = tmp_path / "test.genomedata"
+    make_file_mode_archive(archive)
+    segments = split_chroms(segmentation)["chr1"]
+    result = get_chrom_signal_sums(str(archive), "chr1", segments, 2, 2)
+    # Position 2 is in the gap between the supercontigs
+    chr1 = CHR1.copy()
+    chr1[2] = np.nan
+    expected = get_expected_sums(segmentation, {"chr1": chr1})
+    for array, expected_array in zip(result, expected):
+        assert array.tolist() == expected_array.tolist()
+
+
+@pytest.mark.parametrize("directory_mode", [False, True])
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_get_signal_sums(tmp_path, segmentation, directory_mode, num_processes):
+    archive = tmp_path / "test.genomedata"
+    if directory_mode:
+        make_directory_mode_archive(archive)
+    else:
+        make_file_mode_archive(archive)
+    tracknames, result = get_signal_sums(
+        segmentation, str(archive), "arcsinh", num_processes
+    )
+    assert tracknames == ["f1", "f2"]
+    chr1 = CHR1.copy()
+    if not directory_mode:
+        chr1[2] = np.nan
+    expected = get_expected_sums(segmentation, {"chr1": chr1, "chr2": CHR2}, "arcsinh")
+    for array, expected_array in zip(result, expected):
+        assert array.dtype == expected_array.dtype
+        assert array.tolist() == expected_array.tolist()
+
+
+def test_read_tracknames(tmp_path):
+    archive = tmp_path / "test.genomedata"
+    make_directory_mode_archive(archive)
+    assert read_tracknames(str(archive)) == ["f1", "f2"]
+
+
+def test_write_signal_distribution():
+    sums = make_signal_sums(2, 2)
+    sums[0][:] = [[3, 0], [1, 2]]
+    sums[1][:] = [[5, 0], [1, 4]]
+    sums[2][:] = [[2, 0], [1, 1]]
+    output = StringIO()
+    write_signal_distribution(["1", "0"], ["f1", "f2"], sums, output)
+    assert output.getvalue() == (
+        "label\ttrackname\tmean\tsd\tn\n"
+        f"1\tf1\t1.5\t{str(np.sqrt(np.longdouble(0.5)))}\t2\n"
+        "1\tf2\t1.0\tnan\t1\n"
+        "0\tf1\tnan\tnan\t0\n"
+        "0\tf2\t2.0\tnan\t1\n"
+    )
+
+
+def test_write_signal_distribution_header_matches_segtools():
+    output = StringIO()
+    write_signal_distribution([], [], make_signal_sums(0, 0), output)
+    with open("tests/data/signal_distribution.tab") as f:
+        assert output.getvalue() == f.readline()
+
+
+def test_main(mocker, tmp_path):
+    archive = tmp_path / "test.genomedata"
+    make_file_mode_archive(archive)
+    bed = tmp_path / "segway.bed"
+    bed.write_text(BED_DATA)
+    outdir = tmp_path / "signal_distribution"
+    testargs = ["prog", "-t", "arcsinh", "-p", "2", "-o", str(outdir)]
+    mocker.patch("sys.argv", testargs + [str(bed), str(archive)])
+    main()
+    lines = (outdir / "signal_distribution.tab").read_text().splitlines()
+    assert len(lines) == 5
+    assert [line.split("\t")[:2] for line in lines[1:]] == [
+        ["1", "f1"],
+        ["1", "f2"],
+        ["0", "f1"],
+        ["0", "f2"],
+    ]
+    # Label 1 covers chr1:0-3 and chr1:7-8, but chr1:2 is not in a supercontig
+    assert lines[1].split("\t")[4] == "3"